@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Build token_database.json from MTGJSON and Cockatrice together.
+
+Each source adapter fetches and parses its upstream data into raw
+TokenRecords. Adapters run concurrently in a thread pool, so wall time
+tracks the slowest source rather than the sum: the work is mostly
+downloads and file I/O, which release the GIL. Records are folded into one
+set of dedup groups under the shared composite ID in a fixed source
+order, so artwork and reverse-related cards are unioned across sources.
+Custom tokens are applied last, as in the single-source scripts.
+
+Unlike process_tokens_mtgjson.py there is no Meta.json preflight and no
+stage snapshots: every run fetches (or revalidates) both sources and
+rebuilds. Sources only merge on identical composite IDs, and the two
+upstreams often word the same token differently, so the near-duplicate
+report is written on every run unless --no-near-duplicates is given.
+
+Usage:
+    python3 docs/housekeeping/process_tokens.py
+    python3 docs/housekeeping/process_tokens.py --sources mtgjson --sequential
+    (Run from repo root)
+"""
+
+import abc
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import process_tokens_mtgjson as mtgjson
+import process_tokens_with_popularity as cockatrice
+import token_analytics
+import token_facets
+import token_ndjson
+import token_reverse_index
+import token_sqlite
+from token_instrument import finish_run, stage, start_run
+from token_io import JSON_BACKENDS, json_backend, set_json_backend
+from token_normalize import TokenRecord, normalize_records
+
+OUTPUT_PATH = mtgjson.OUTPUT_PATH
+MANIFEST_PATH = mtgjson.MANIFEST_PATH
+REPORT_PATH = mtgjson.REPORT_PATH
+
+
+class TokenSource(abc.ABC):
+    """A token source adapter: fetch() downloads (or reuses its cache) and
+    returns raw token records."""
+
+    name = ''
+
+    @abc.abstractmethod
+    def fetch(self) -> List[TokenRecord]:
+        """Raw token records from this source."""
+
+
+class MtgjsonSource(TokenSource):
+    """MTGJSON AllPrintings, via the cached, resumable download."""
+
+    name = 'mtgjson'
+
+    def __init__(self, pipeline: bool = False):
+        self.pipeline = pipeline
+        self.upstream = None
+        self.current = False
+
+    def fetch(self) -> List[TokenRecord]:
+        self.upstream = mtgjson.fetch_upstream_meta()
+        upstream_version = self.upstream['version'] if self.upstream else None
+        if self.pipeline:
+            records = mtgjson.download_and_extract_pipelined(
+                mtgjson.MTGJSON_URL, mtgjson.CACHE_FILE, upstream_version)
+        else:
+            mtgjson.refresh_cache(upstream_version)
+            records = mtgjson.extract_tokens_streaming(mtgjson.CACHE_FILE)
+        self.current = mtgjson.data_is_current(upstream_version)
+        return records
+
+
+class CockatriceSource(TokenSource):
+    """Cockatrice tokens.xml, via the conditional streaming fetch."""
+
+    name = 'cockatrice'
+
+    def fetch(self) -> List[TokenRecord]:
+        return cockatrice.stream_token_xml(cockatrice.XML_URL)
+
+
+SOURCES = {source.name: source for source in (MtgjsonSource, CockatriceSource)}
+
+
+def _fetch_source(source: TokenSource) -> Tuple[List[TokenRecord], float]:
+    with stage(f'source_{source.name}') as st:
+        start = time.perf_counter()
+        records = source.fetch()
+        st.records = len(records)
+    return records, time.perf_counter() - start
+
+
+def fetch_sources(sources: List[TokenSource], concurrent_fetch: bool = True) -> Dict[str, List[TokenRecord]]:
+    """Run every adapter, concurrently unless told otherwise. Results are
+    keyed by source name and returned in `sources` order, whatever order
+    the fetches finish in. Concurrent source_* stages report no memory
+    peak of their own (see token_instrument); the enclosing stage does."""
+    results = {}
+    timings = {}
+    if concurrent_fetch and len(sources) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(sources)) as pool:
+            futures = [pool.submit(_fetch_source, source) for source in sources]
+            for source, future in zip(sources, futures):
+                results[source.name], timings[source.name] = future.result()
+    else:
+        for source in sources:
+            results[source.name], timings[source.name] = _fetch_source(source)
+
+    for name, records in results.items():
+        print(f"  {name}: {len(records)} raw tokens in {timings[name]:.1f}s")
+    return results
+
+
+def source_coverage(results: Dict[str, List[TokenRecord]]) -> Dict[str, Set[str]]:
+    """Composite IDs each source contributes."""
+    coverage = {}
+    for name, records in results.items():
+        coverage[name] = {n[1] for n in normalize_records(records) if n is not None}
+    return coverage
+
+
+def print_coverage(coverage: Dict[str, Set[str]]) -> None:
+    everything = set().union(*coverage.values())
+    print(f"\n=== Source coverage ({len(everything)} distinct tokens before filtering) ===")
+    for name, ids in coverage.items():
+        others = set().union(*(v for k, v in coverage.items() if k != name))
+        print(f"  {name:12s} {len(ids):6d} tokens, {len(ids - others):6d} only from this source")
+
+
+def _art_key(url: str) -> str:
+    # Scryfall URLs from different sources may differ only by the
+    # cache-busting query string.
+    return url.split('?', 1)[0]
+
+
+def dedup_artwork(tokens: List[Dict]) -> int:
+    """Drop artwork entries repeated across sources (same image, different
+    query string), keeping the first. Returns the number removed."""
+    removed = 0
+    for token in tokens:
+        seen = set()
+        kept = []
+        for art in token['artwork']:
+            key = _art_key(art['url'])
+            if key in seen:
+                removed += 1
+                continue
+            seen.add(key)
+            kept.append(art)
+        token['artwork'] = kept
+    return removed
+
+
+def merge_sources(results: Dict[str, List[TokenRecord]], custom_tokens: List[Dict]) -> List[Dict]:
+    """Group every source's records (in source order), then custom tokens."""
+    token_groups = mtgjson.new_token_groups()
+    for name, records in results.items():
+        mtgjson.group_tokens(records, token_groups)
+    if custom_tokens:
+        print(f"Applying {len(custom_tokens)} custom tokens")
+    cleaned = mtgjson.clean_and_dedup(
+        [TokenRecord.from_dict(token) for token in custom_tokens], token_groups)
+    removed = dedup_artwork(cleaned)
+    if removed:
+        print(f"Dropped {removed} artwork entries duplicated across sources")
+    return cleaned
+
+
+def build_stamp(sources: List[TokenSource]) -> Dict[str, str]:
+    """Manifest `source` stamp for a multi-source build. It never equals a
+    single-source MTGJSON stamp, so that script's preflight rebuilds after
+    this one has published."""
+    stamp = {'sources': ','.join(source.name for source in sources)}
+    for source in sources:
+        # Built from an older cache after a failed download: no MTGJSON stamp.
+        if isinstance(source, MtgjsonSource) and source.upstream and source.current:
+            stamp.update(mtgjson.compute_build_stamp(source.upstream))
+    return stamp
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command-line options."""
+    parser = argparse.ArgumentParser(
+        description="Build token_database.json from several token sources at once.")
+    parser.add_argument(
+        '--sources', default=','.join(SOURCES),
+        help=f"Comma-separated sources, in merge order (default {','.join(SOURCES)})")
+    parser.add_argument(
+        '--sequential', action='store_true',
+        help="Fetch sources one after another (for timing comparisons)")
+    parser.add_argument(
+        '--pipeline', action='store_true',
+        help="Overlap the MTGJSON download with decompression and extraction")
+    parser.add_argument(
+        '--json-backend', choices=JSON_BACKENDS, default='auto',
+        help="JSON parser/serializer (auto prefers orjson); the output bytes are the same")
+    parser.add_argument(
+        '--near-duplicates', nargs='?', const=mtgjson.NEAR_DUPLICATE_REPORT_PATH, metavar='REPORT',
+        help="Write near-duplicate merge suggestions for review (on by default, "
+             "except with --check; default report: mtgjson_cache/near_duplicates.json)")
+    parser.add_argument(
+        '--no-near-duplicates', action='store_true',
+        help="Don't write the near-duplicate report")
+    parser.add_argument(
+        '--apply-merges', nargs='?', const=mtgjson.NEAR_DUPLICATE_MERGES_FILE, metavar='ALLOWLIST',
+        help="Merge the near-duplicates listed in an allowlist")
+    parser.add_argument(
+        '--shards', type=int, default=0, metavar='N',
+        help="Also write the database as N popularity-first shards (N >= 2)")
+    parser.add_argument(
+        '--ndjson', action='store_true',
+        help="Also write token_database.ndjson (presorted, one token per line)")
+    parser.add_argument(
+        '--sqlite', action='store_true',
+        help="Also write token_database.sqlite (FTS5 search, facet indexes)")
+    parser.add_argument(
+        '--check', action='store_true',
+        help="Report whether the database would change; writes no outputs "
+             "(exit status 1 if it would)")
+    parser.add_argument(
+        '--skip-reverse-index', action='store_true',
+        help="Don't write token_reverse_index.json")
+    parser.add_argument(
+        '--skip-facets', action='store_true',
+        help="Don't write token_facets.json")
+    parser.add_argument(
+        '--skip-analytics', action='store_true',
+        help="Skip popularity analytics and token_popularity.json (faster rebuilds)")
+    parser.add_argument(
+        '--output', default=OUTPUT_PATH,
+        help="Database path (the manifest is only updated for the default path)")
+    args = parser.parse_args(argv)
+    args.sources = [s.strip() for s in args.sources.split(',') if s.strip()]
+    unknown = [s for s in args.sources if s not in SOURCES]
+    if unknown or not args.sources:
+        parser.error(f"Unknown source(s) {', '.join(unknown)}; choose from {', '.join(SOURCES)}")
+    if args.shards and args.shards < 2:
+        parser.error("--shards needs at least 2 shards")
+    if args.no_near_duplicates:
+        args.near_duplicates = None
+    elif args.near_duplicates is None and not args.check:
+        args.near_duplicates = mtgjson.NEAR_DUPLICATE_REPORT_PATH
+    try:
+        set_json_backend(args.json_backend)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def build(args: argparse.Namespace, sources: List[TokenSource]) -> str:
+    """Fetch, merge and publish; returns the run status for the report."""
+    print(f"Fetching {', '.join(args.sources)} "
+          f"{'sequentially' if args.sequential else 'concurrently'}...")
+    with stage('sources') as st:
+        results = fetch_sources(sources, concurrent_fetch=not args.sequential)
+        st.records = sum(len(r) for r in results.values())
+    if len(results) > 1:
+        print_coverage(source_coverage(results))
+
+    with stage('merge') as st:
+        cleaned = merge_sources(results, mtgjson.load_custom_tokens())
+        st.records = len(cleaned)
+    cleaned = mtgjson.resolve_near_duplicates(cleaned, args)
+
+    publishing = os.path.normpath(args.output) == os.path.normpath(OUTPUT_PATH)
+    if args.check:
+        with stage('check'):
+            changed = mtgjson.check_output(
+                cleaned, args.output, MANIFEST_PATH if publishing else None)
+        return 'would_change' if changed else 'unchanged'
+
+    artifacts = {}
+    if not args.skip_analytics:
+        with stage('analyze'):
+            mtgjson.analyze_popularity(cleaned, mtgjson.POPULARITY_PATH)
+        artifacts['popularity'] = {'path': mtgjson.POPULARITY_PATH,
+                                   'format': token_analytics.ANALYTICS_FORMAT}
+
+    with stage('serialize') as st:
+        mtgjson.save_output(cleaned, args.output)
+        st.bytes = os.path.getsize(args.output)
+        st.notes['json_backend'] = json_backend()
+
+    if not args.skip_reverse_index:
+        index_path = (mtgjson.REVERSE_INDEX_PATH if publishing else
+                      os.path.join(os.path.dirname(args.output), 'token_reverse_index.json'))
+        with stage('reverse_index'):
+            token_reverse_index.write_reverse_index(cleaned, os.path.normpath(index_path), args.output)
+        artifacts['reverse_index'] = {'path': index_path,
+                                      'format': token_reverse_index.REVERSE_INDEX_FORMAT}
+
+    if not args.skip_facets:
+        facets_path = (mtgjson.FACETS_PATH if publishing else
+                       os.path.join(os.path.dirname(args.output), 'token_facets.json'))
+        with stage('facets'):
+            token_facets.write_facet_index(cleaned, os.path.normpath(facets_path), args.output)
+        artifacts['facets'] = {'path': facets_path, 'format': token_facets.FACETS_FORMAT}
+
+    if args.ndjson:
+        ndjson_path = (mtgjson.NDJSON_OUTPUT_PATH if publishing else
+                       os.path.join(os.path.dirname(args.output), 'token_database.ndjson'))
+        with stage('ndjson'):
+            token_ndjson.write_ndjson(cleaned, os.path.normpath(ndjson_path), args.output)
+        artifacts['ndjson'] = {'path': ndjson_path, 'format': token_ndjson.NDJSON_FORMAT}
+
+    if args.sqlite:
+        sqlite_path = (mtgjson.SQLITE_OUTPUT_PATH if publishing else
+                       os.path.join(os.path.dirname(args.output), 'token_database.sqlite'))
+        with stage('sqlite'):
+            token_sqlite.write_sqlite(cleaned, os.path.normpath(sqlite_path), args.output)
+        artifacts['sqlite'] = {'path': sqlite_path, 'format': token_sqlite.SQLITE_FORMAT}
+
+    if args.shards:
+        with stage('shards'):
+            shard_dir = (mtgjson.SHARD_DIR if publishing else
+                         os.path.join(os.path.dirname(args.output), 'token_db_shards'))
+            mtgjson.shard_artifacts(cleaned, args.shards, args.output, shard_dir, artifacts)
+
+    if publishing:
+        with stage('manifest'):
+            mtgjson.update_manifest(OUTPUT_PATH, MANIFEST_PATH, build_stamp(sources), artifacts)
+
+    color_counts = defaultdict(int)
+    for t in cleaned:
+        color_counts[t['colors'] if t['colors'] else 'Colorless'] += 1
+    print("\n=== Token Database Summary ===")
+    print(f"Total tokens: {len(cleaned)}")
+    print("\nTokens by color:")
+    for color, count in sorted(color_counts.items()):
+        print(f"  {color}: {count}")
+    return 'ok'
+
+
+def main(argv: Optional[List[str]] = None):
+    """Main execution."""
+    args = parse_args(argv)
+    start = time.time()
+
+    sources = []
+    for name in args.sources:
+        sources.append(MtgjsonSource(args.pipeline) if name == 'mtgjson' else SOURCES[name]())
+
+    start_run(os.path.basename(__file__))
+    status = 'error'
+    try:
+        status = build(args, sources)
+    finally:
+        # --check writes nothing, not even the run report.
+        if not args.check:
+            finish_run(REPORT_PATH, status)
+
+    print(f"\nCompleted in {time.time() - start:.1f}s")
+    return 1 if status == 'would_change' else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,22 +11,71 @@ Usage:
     (Run from repo root)
 """
 
+import argparse
+import concurrent.futures
+import glob
 import hashlib
+import io
 import json
 import lzma
 import os
+import queue
 import re
+import sys
+import threading
 import time
 from collections import defaultdict
 from datetime import datetime, timezone
-from typing import Dict, List, Set
+from typing import Dict, Iterator, List, Optional, Tuple
 from urllib.request import urlopen, Request
-from email.utils import formatdate, parsedate_to_datetime
+
+import token_analytics
+import token_compact
+import token_delta
+import token_facets
+import token_fetch
+import token_ndjson
+import token_neardup
+import token_reverse_index
+import token_serve
+import token_shards
+import token_sqlite
+from token_instrument import finish_run, stage, start_run
+from token_io import (JSON_BACKENDS, canonical_tokens, dumps_database, json_backend,
+                      load_file, loads, set_json_backend, write_database)
+from token_normalize import TokenRecord, build_scryfall_url, check_key, normalize_records
+from token_stages import StageGraph, code_files, file_fingerprint
 
 MTGJSON_URL = "https://mtgjson.com/api/v5/AllPrintings.json.xz"
+MTGJSON_API = "https://mtgjson.com/api/v5"
 CACHE_DIR = os.path.join(os.path.dirname(__file__), "mtgjson_cache")
 CACHE_FILE = os.path.join(CACHE_DIR, "AllPrintings.json")
+SET_CACHE_DIR = os.path.join(CACHE_DIR, "sets")
+SET_INDEX_FILE = os.path.join(SET_CACHE_DIR, "index.json")
+CUSTOM_TOKENS_FILE = os.path.join(os.path.dirname(__file__), "custom_tokens.json")
+NEAR_DUPLICATE_MERGES_FILE = os.path.join(os.path.dirname(__file__), "near_duplicate_merges.json")
+
+# Files whose content, together with the MTGJSON version, determines the output.
+# The preflight skips the build when none of them (nor upstream) changed.
+BUILD_INPUTS = [
+    os.path.abspath(__file__),
+    *sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "token_*.py"))),
+    NEAR_DUPLICATE_MERGES_FILE,
+    CUSTOM_TOKENS_FILE,
+]
 OUTPUT_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "assets", "token_database.json")
+COMPACT_OUTPUT_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "assets", "token_database.v2.json")
+HISTORY_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "assets", "token_db_history")
+DELTA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "assets", "token_db_deltas")
+SHARD_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "assets", "token_db_shards")
+SNAPSHOT_DIR = os.path.join(CACHE_DIR, "stages")
+NEAR_DUPLICATE_REPORT_PATH = os.path.join(CACHE_DIR, "near_duplicates.json")
+NDJSON_OUTPUT_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "assets", "token_database.ndjson")
+SQLITE_OUTPUT_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "assets", "token_database.sqlite")
+FACETS_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "assets", "token_facets.json")
+REVERSE_INDEX_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "assets", "token_reverse_index.json")
+POPULARITY_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "assets", "token_popularity.json")
+REPORT_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "assets", "token_build_report.json")
 MANIFEST_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "assets", "token_manifest.json")
 
 # WUBRG ordering for color sorting (matches Cockatrice script convention)
@@ -38,47 +87,622 @@ TOKEN_LAYOUTS = {'token', 'emblem', 'double_faced_token'}
 # Types to exclude (same as Cockatrice script)
 EXCLUDED_TYPES = ['Counter', 'State', 'Bounty', 'Dungeon']
 
+# Read size for streaming through the cached AllPrintings file
+STREAM_CHUNK_SIZE = 1 << 20
 
-def download_with_caching() -> dict:
-    """Download AllPrintings.json.xz with HTTP If-Modified-Since caching."""
-    os.makedirs(CACHE_DIR, exist_ok=True)
+# Pipelined download mode: HTTP read size and max chunks buffered per stage
+DOWNLOAD_CHUNK_SIZE = 1 << 18
+PIPELINE_QUEUE_DEPTH = 4
+
+# Incremental mode: concurrent per-set requests
+INCREMENTAL_FETCH_WORKERS = 16
+
+
+def _fetch(url: str, timeout: int = 60) -> bytes:
+    """GET a (small) MTGJSON resource."""
+    req = Request(url, headers={'User-Agent': 'DoublingSeason-TokenGenerator/1.0'})
+    with urlopen(req, timeout=timeout) as response:
+        return response.read()
+
+
+def _cache_headers_file(cache_file: str) -> str:
+    return cache_file + '.headers.json'
+
+
+def _published_sha256(url: str) -> Optional[str]:
+    """sha256 MTGJSON publishes next to each download, or None."""
+    try:
+        return _fetch(url + '.sha256', timeout=30).decode('ascii').split()[0].strip().lower()
+    except Exception:
+        return None
 
-    headers = {
-        'User-Agent': 'DoublingSeason-TokenGenerator/1.0',
+
+def fetch_upstream_meta() -> Optional[Dict[str, str]]:
+    """Fetch MTGJSON's small Meta.json ({'date', 'version'}), or None on failure."""
+    try:
+        meta = json.loads(_fetch(f"{MTGJSON_API}/Meta.json", timeout=30))
+    except Exception as e:
+        print(f"Could not fetch MTGJSON Meta.json ({e})")
+        return None
+    meta = meta.get('data') or meta.get('meta') or {}
+    if not meta.get('version'):
+        return None
+    return {'date': meta.get('date', ''), 'version': meta['version']}
+
+
+# Options that change what a build writes; they are part of the build stamp.
+OUTPUT_OPTIONS = ('compact', 'ndjson', 'sqlite', 'deltas', 'shards', 'apply_merges',
+                  'near_duplicates', 'skip_reverse_index', 'skip_facets', 'skip_analytics')
+
+
+def output_options(args: argparse.Namespace) -> str:
+    """The set output options of `args`, e.g. "compact,shards=4", in a stable
+    order. A non-default merge allowlist is identified by its content."""
+    parts = []
+    for name in OUTPUT_OPTIONS:
+        value = getattr(args, name, None)
+        if not value:
+            continue
+        if name == 'apply_merges' and os.path.abspath(value) not in map(os.path.abspath, BUILD_INPUTS):
+            value = file_fingerprint([value])[:16]
+        parts.append(name if value is True else f"{name}={value}")
+    return ','.join(parts)
+
+
+def compute_build_stamp(upstream: Dict[str, str], options: Optional[str] = None) -> Dict[str, str]:
+    """Build stamp: upstream MTGJSON version plus a digest of local inputs
+    and, for a preflighted build, its output options."""
+    sha = hashlib.sha256()
+    for path in BUILD_INPUTS:
+        sha.update(os.path.basename(path).encode('utf-8') + b'\0')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                sha.update(f.read())
+        sha.update(b'\0')
+    stamp = {
+        'mtgjson_version': upstream['version'],
+        'mtgjson_date': upstream['date'],
+        'inputs_sha256': sha.hexdigest(),
     }
-    if os.path.exists(CACHE_FILE):
-        mtime = os.path.getmtime(CACHE_FILE)
-        headers['If-Modified-Since'] = formatdate(mtime, usegmt=True)
+    if options is not None:
+        stamp['options'] = options
+    return stamp
+
 
-    req = Request(MTGJSON_URL, headers=headers)
+def read_build_stamp(manifest_path: str) -> Optional[Dict[str, str]]:
+    """Build stamp recorded by the last update_manifest(), if any. None as
+    well if an artifact the manifest lists has gone missing, so it is rebuilt."""
     try:
-        print(f"Checking MTGJSON for updates...")
-        response = urlopen(req, timeout=120)
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        base = os.path.dirname(manifest_path)
+        for artifact in manifest.get('artifacts', {}).values():
+            if not os.path.exists(os.path.join(base, artifact['path'])):
+                return None
+        return manifest.get('source')
+    except (OSError, json.JSONDecodeError, ValueError, AttributeError, KeyError, TypeError):
+        return None
+
+
+def _cache_version_file(cache_file: str) -> str:
+    return cache_file + '.version'
 
-        print(f"Downloading AllPrintings.json.xz (~70MB)...")
-        compressed = response.read()
-        print(f"Downloaded {len(compressed) / 1024 / 1024:.1f}MB, decompressing...")
 
-        raw = lzma.decompress(compressed)
-        with open(CACHE_FILE, 'wb') as f:
-            f.write(raw)
+def _cache_is_current(cache_file: str, upstream_version: Optional[str]) -> bool:
+    """True if the cache was downloaded from the given upstream version.
 
-        print(f"Cached decompressed JSON ({len(raw) / 1024 / 1024:.1f}MB)")
-        data = json.loads(raw)
+    Keyed on content version rather than mtime, so checkouts, copies and CI
+    cache restores don't trigger a re-download.
+    """
+    if not upstream_version or not os.path.exists(cache_file):
+        return False
+    try:
+        with open(_cache_version_file(cache_file), 'r', encoding='utf-8') as f:
+            return f.read().strip() == upstream_version
+    except OSError:
+        return False
+
+
+def data_is_current(upstream_version: Optional[str], incremental: bool = False) -> bool:
+    """True if the cache the extraction read (AllPrintings, or the per-set
+    index with --incremental) holds `upstream_version`, i.e. no download
+    fell back to older data."""
+    cache = os.path.join(SET_CACHE_DIR, 'index.json') if incremental else CACHE_FILE
+    return _cache_is_current(cache, upstream_version)
+
+
+def _record_cache_version(cache_file: str, upstream_version: Optional[str]) -> None:
+    version_file = _cache_version_file(cache_file)
+    if upstream_version:
+        with open(version_file, 'w', encoding='utf-8') as f:
+            f.write(upstream_version + '\n')
+    elif os.path.exists(version_file):
+        os.remove(version_file)
+
+
+def decompress_xz(src: str, dest: str) -> int:
+    """Stream-decompress an .xz file into `dest`; returns the output size."""
+    decompressor = lzma.LZMADecompressor()
+    size = 0
+    with open(src, 'rb') as fin, open(dest, 'wb') as fout:
+        for chunk in iter(lambda: fin.read(DOWNLOAD_CHUNK_SIZE), b''):
+            data = decompressor.decompress(chunk, max_length=STREAM_CHUNK_SIZE)
+            while True:
+                fout.write(data)
+                size += len(data)
+                if decompressor.eof or decompressor.needs_input:
+                    break
+                data = decompressor.decompress(b'', max_length=STREAM_CHUNK_SIZE)
+    if not decompressor.eof:
+        raise EOFError(f"{src} ended before the end-of-stream marker")
+    return size
+
+
+def refresh_cache(upstream_version: Optional[str] = None) -> None:
+    """Download AllPrintings.json.xz into the cache with a conditional GET.
+
+    Leaves the decompressed JSON at CACHE_FILE. The archive is streamed to
+    a partial file and resumed with HTTP Range after dropped connections,
+    including across runs (see token_fetch). The cache is replaced only by
+    a complete archive whose sha256 matches the one MTGJSON publishes and
+    that decompresses cleanly.
+    On a failed download the existing cache is kept; raises if there is no
+    cache to fall back to. When `upstream_version` (from Meta.json) matches
+    the cached copy, the network is skipped entirely.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    if _cache_is_current(CACHE_FILE, upstream_version):
+        print(f"Cached AllPrintings matches MTGJSON {upstream_version}, skipping download")
+        return
 
+    headers_file = _cache_headers_file(CACHE_FILE)
+    archive_part = os.path.join(CACHE_DIR, os.path.basename(MTGJSON_URL) + '.part')
+    cache_tmp = CACHE_FILE + '.tmp'
+    try:
+        print("Checking MTGJSON for updates...")
+        headers = token_fetch.conditional_headers(CACHE_FILE, token_fetch.load_validators(headers_file))
+        expected_sha = _published_sha256(MTGJSON_URL)
+
+        print("Downloading AllPrintings.json.xz (~70MB)...")
+        with stage('download') as st:
+            result = token_fetch.fetch_resumable(MTGJSON_URL, archive_part, headers, expected_sha)
+            st.bytes = result['size'] - result['resumed_from']
+            st.notes['resumed_from'] = result['resumed_from']
+            st.notes['attempts'] = result['attempts']
+        resumed = f", resumed at {result['resumed_from'] / 1024 / 1024:.1f}MB" if result['resumed_from'] else ''
+        verified = 'verified' if expected_sha else 'no published sha256'
+        print(f"Downloaded {result['size'] / 1024 / 1024:.1f}MB ({verified}{resumed}), decompressing...")
+
+        with stage('decompress') as st:
+            try:
+                st.bytes = decompress_xz(archive_part, cache_tmp)
+            except (lzma.LZMAError, EOFError):
+                # A corrupt archive must not be resumed on the next run.
+                token_fetch.discard_partial(archive_part)
+                raise
+            os.replace(cache_tmp, CACHE_FILE)
+        token_fetch.discard_partial(archive_part)
+        _record_cache_version(CACHE_FILE, upstream_version)
+        token_fetch.save_validators(headers_file, result)
+
+        print(f"Cached decompressed JSON ({st.bytes / 1024 / 1024:.1f}MB)")
+
+    except token_fetch.NotModified:
+        print("MTGJSON data is up to date (304 Not Modified), using cache")
+        _record_cache_version(CACHE_FILE, upstream_version)
+    except Exception as e:
+        if os.path.exists(cache_tmp):
+            os.remove(cache_tmp)
+        if os.path.exists(CACHE_FILE):
+            print(f"Download failed ({e}), falling back to cached file")
+        else:
+            raise RuntimeError(f"Download failed and no cache available: {e}")
+
+
+def download_with_caching(upstream_version: Optional[str] = None) -> dict:
+    """Download AllPrintings.json.xz with HTTP If-Modified-Since caching."""
+    refresh_cache(upstream_version)
+    with stage('parse') as st:
+        st.bytes = os.path.getsize(CACHE_FILE)
+        st.notes['json_backend'] = json_backend()
+        return load_file(CACHE_FILE)
+
+
+class JsonScanner:
+    """Incremental, structure-only JSON reader over a byte stream.
+
+    Walks objects and arrays without building them, so large subtrees can be
+    skipped and only the values the caller asks for are decoded. `read` is any
+    callable returning up to N bytes (b'' at EOF), e.g. a file's read method.
+    """
+
+    _STRUCTURAL = re.compile(rb'["{}\[\]]')
+    _STRING_END = re.compile(rb'["\\]')
+    _NON_WS = re.compile(rb'[^ \t\r\n]')
+    _SCALAR_END = re.compile(rb'[,}\] \t\r\n]')
+
+    def __init__(self, read, chunk_size: int = STREAM_CHUNK_SIZE):
+        self._read = read
+        self._chunk_size = chunk_size
+        self._buf = b''
+        self._pos = 0
+        self._capture = None
+        self._mark = 0
+        self._offset = 0
+
+    def _fill(self) -> bool:
+        """Replace the exhausted buffer with the next chunk. False at EOF."""
+        if self._capture is not None:
+            self._capture.append(self._buf[self._mark:])
+            self._mark = 0
+        self._offset += len(self._buf)
+        self._buf = self._read(self._chunk_size)
+        self._pos = 0
+        return bool(self._buf)
+
+    def _peek(self) -> int:
+        """Skip whitespace and return the next byte without consuming it."""
+        while True:
+            m = self._NON_WS.search(self._buf, self._pos)
+            if m:
+                self._pos = m.start()
+                return self._buf[self._pos]
+            self._pos = len(self._buf)
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON stream")
+
+    def _expect(self, char: bytes) -> None:
+        if self._peek() != char[0]:
+            raise ValueError(
+                f"Expected {char!r} in JSON stream, got {bytes([self._buf[self._pos]])!r}")
+        self._pos += 1
+
+    def _skip_string(self) -> None:
+        """Skip a string body; the opening quote is already consumed."""
+        while True:
+            m = self._STRING_END.search(self._buf, self._pos)
+            if not m:
+                self._pos = len(self._buf)
+                if not self._fill():
+                    raise ValueError("Unterminated string in JSON stream")
+                continue
+            self._pos = m.end()
+            if m.group() == b'"':
+                return
+            # Backslash escape: skip the escaped byte, which may sit in the next chunk.
+            if self._pos >= len(self._buf) and not self._fill():
+                raise ValueError("Unterminated string in JSON stream")
+            self._pos += 1
+
+    def skip_value(self) -> None:
+        """Consume the next value without decoding it."""
+        first = self._peek()
+        self._pos += 1
+        if first == 0x22:  # "
+            self._skip_string()
+            return
+        if first not in (0x7B, 0x5B):  # { [
+            while True:
+                m = self._SCALAR_END.search(self._buf, self._pos)
+                if m:
+                    self._pos = m.start()
+                    return
+                self._pos = len(self._buf)
+                if not self._fill():
+                    return
+        depth = 1
+        while depth:
+            m = self._STRUCTURAL.search(self._buf, self._pos)
+            if not m:
+                self._pos = len(self._buf)
+                if not self._fill():
+                    raise ValueError("Unexpected end of JSON stream")
+                continue
+            self._pos = m.end()
+            char = m.group()
+            if char == b'"':
+                self._skip_string()
+            elif char in (b'{', b'['):
+                depth += 1
+            else:
+                depth -= 1
+
+    def value_span(self) -> Tuple[int, int]:
+        """Skip the next value and return its [start, end) offsets in the stream."""
+        self._peek()
+        start = self._offset + self._pos
+        self.skip_value()
+        return start, self._offset + self._pos
+
+    def read_raw(self) -> bytes:
+        """Consume the next value and return its undecoded bytes."""
+        self._peek()
+        self._capture = []
+        self._mark = self._pos
+        try:
+            self.skip_value()
+            self._capture.append(self._buf[self._mark:self._pos])
+            return b''.join(self._capture)
+        finally:
+            self._capture = None
+
+    def read_value(self):
+        """Consume and decode the next value."""
+        return loads(self.read_raw())
+
+    def iter_object(self) -> Iterator[str]:
+        """Yield the keys of the next object. The caller must consume each
+        key's value (skip_value/read_value/nested iteration) before resuming."""
+        self._expect(b'{')
+        if self._peek() == 0x7D:  # }
+            self._pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self._expect(b':')
+            yield key
+            if self._peek() == 0x2C:  # ,
+                self._pos += 1
+                continue
+            self._expect(b'}')
+            return
+
+    def iter_array(self) -> Iterator[None]:
+        """Yield once per element of the next array; the caller consumes each."""
+        self._expect(b'[')
+        if self._peek() == 0x5D:  # ]
+            self._pos += 1
+            return
+        while True:
+            yield None
+            if self._peek() == 0x2C:  # ,
+                self._pos += 1
+                continue
+            self._expect(b']')
+            return
+
+
+def _iter_tokens_array(scanner: JsonScanner) -> Iterator[dict]:
+    """Decode the `tokens` entries of one set object, skipping everything else."""
+    for field in scanner.iter_object():
+        if field != 'tokens':
+            scanner.skip_value()
+            continue
+        for _ in scanner.iter_array():
+            yield scanner.read_value()
+
+
+def iter_set_tokens(read) -> Iterator[Tuple[str, dict]]:
+    """Stream (set_code, token_card) pairs out of an AllPrintings document.
+
+    Only entries of each set's `tokens` array are decoded; `meta`, `cards`,
+    `booster` and every other subtree are skipped without being built.
+    """
+    scanner = JsonScanner(read)
+    for top_key in scanner.iter_object():
+        if top_key != 'data':
+            scanner.skip_value()
+            continue
+        for set_code in scanner.iter_object():
+            for card in _iter_tokens_array(scanner):
+                yield set_code, card
+
+
+def index_sets(cache_file: str = CACHE_FILE) -> List[Tuple[str, int, int]]:
+    """Locate each set's object in the cached AllPrintings by byte offsets.
+
+    Returns (set_code, start, end) in document order, so workers can seek
+    straight to their set instead of each re-parsing the whole file.
+    """
+    spans = []
+    with open(cache_file, 'rb') as f:
+        scanner = JsonScanner(f.read)
+        for top_key in scanner.iter_object():
+            if top_key != 'data':
+                scanner.skip_value()
+                continue
+            for set_code in scanner.iter_object():
+                start, end = scanner.value_span()
+                spans.append((set_code, start, end))
+    return spans
+
+
+_EOF = object()
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> None:
+    """Blocking put that gives up once the pipeline has been stopped."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    """Blocking get that returns _EOF once the pipeline has been stopped."""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _EOF
+
+
+class ChunkQueueReader:
+    """File-like read(n) over byte chunks handed over by a producer thread.
+
+    The producer sends bytes, then either _EOF or the exception it failed
+    with; the exception is re-raised in the consuming thread.
+    """
+
+    def __init__(self, q: queue.Queue):
+        self._q = q
+        self._buf = b''
+        self._done = False
+
+    def read(self, n: int = -1) -> bytes:
+        while not self._buf and not self._done:
+            item = self._q.get()
+            if item is _EOF:
+                self._done = True
+            elif isinstance(item, BaseException):
+                self._done = True
+                raise item
+            else:
+                self._buf = item
+        if n < 0 or n >= len(self._buf):
+            out, self._buf = self._buf, b''
+        else:
+            out, self._buf = self._buf[:n], self._buf[n:]
+        return out
+
+    def drain(self) -> None:
+        """Consume whatever the producer still sends, up to EOF."""
+        while self.read(STREAM_CHUNK_SIZE):
+            pass
+
+
+def _download_stage(response, out_q: queue.Queue, stop: threading.Event,
+                    stats: Dict[str, int], hasher: 'hashlib._Hash') -> None:
+    """Producer: read the HTTP body in fixed-size chunks, hashing them."""
+    try:
+        while not stop.is_set():
+            chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            stats['compressed'] += len(chunk)
+            hasher.update(chunk)
+            _put(out_q, chunk, stop)
+        _put(out_q, _EOF, stop)
+    except BaseException as e:
+        _put(out_q, e, stop)
+
+
+def _decompress_stage(in_q: queue.Queue, out_q: queue.Queue, cache_tmp: str,
+                      stop: threading.Event, stats: Dict[str, int]) -> None:
+    """Decompress xz chunks incrementally, tee-ing into the cache file and
+    the parser queue. Output is capped per call so one highly compressible
+    input chunk cannot balloon into a large buffer."""
+    decompressor = lzma.LZMADecompressor()
+    try:
+        with open(cache_tmp, 'wb') as f:
+            while True:
+                item = _get(in_q, stop)
+                if item is _EOF:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                data = decompressor.decompress(item, max_length=STREAM_CHUNK_SIZE)
+                while True:
+                    if data:
+                        f.write(data)
+                        stats['decompressed'] += len(data)
+                        _put(out_q, data, stop)
+                    if decompressor.eof or decompressor.needs_input:
+                        break
+                    data = decompressor.decompress(b'', max_length=STREAM_CHUNK_SIZE)
+        if not stop.is_set() and not decompressor.eof:
+            raise EOFError("Compressed stream ended before the end-of-stream marker")
+        _put(out_q, _EOF, stop)
+    except BaseException as e:
+        _put(out_q, e, stop)
+
+
+def download_and_extract_pipelined(url: str = MTGJSON_URL,
+                                   cache_file: str = CACHE_FILE,
+                                   upstream_version: Optional[str] = None) -> List[TokenRecord]:
+    """Download, decompress, cache and extract tokens as overlapping stages.
+
+    The HTTP body flows through bounded queues into an incremental
+    LZMADecompressor, whose output is written to the cache and streamed into
+    the token scanner at the same time, so peak memory is a few chunks and
+    wall time tracks the slowest stage. The cache is only replaced once the
+    whole archive has been decompressed and parsed, and its sha256 matches
+    the one MTGJSON publishes; on any failure (or 304) tokens are streamed
+    from the existing cache instead.
+    """
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    cache_tmp = cache_file + '.part'
+
+    if _cache_is_current(cache_file, upstream_version):
+        print(f"Cached AllPrintings matches MTGJSON {upstream_version}, skipping download")
+        return extract_tokens_streaming(cache_file)
+
+    headers_file = _cache_headers_file(cache_file)
+    headers = token_fetch.conditional_headers(cache_file, token_fetch.load_validators(headers_file))
+    req = Request(url, headers=headers)
+    try:
+        print("Checking MTGJSON for updates...")
+        expected_sha = _published_sha256(url)
+        response = urlopen(req, timeout=120)
     except Exception as e:
         if hasattr(e, 'code') and e.code == 304:
             print("MTGJSON data is up to date (304 Not Modified), using cache")
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        elif os.path.exists(CACHE_FILE):
+            _record_cache_version(cache_file, upstream_version)
+        elif os.path.exists(cache_file):
             print(f"Download failed ({e}), falling back to cached file")
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
         else:
             raise RuntimeError(f"Download failed and no cache available: {e}")
+        return extract_tokens_streaming(cache_file)
 
-    return data
+    print("Streaming AllPrintings.json.xz through download → decompress → parse...")
+    start = time.time()
+    stop = threading.Event()
+    compressed_q = queue.Queue(maxsize=PIPELINE_QUEUE_DEPTH)
+    json_q = queue.Queue(maxsize=PIPELINE_QUEUE_DEPTH)
+    stats = {'compressed': 0, 'decompressed': 0}
+    hasher = hashlib.sha256()
+    workers = [
+        threading.Thread(target=_download_stage, daemon=True,
+                         args=(response, compressed_q, stop, stats, hasher)),
+        threading.Thread(target=_decompress_stage, daemon=True,
+                         args=(compressed_q, json_q, cache_tmp, stop, stats)),
+    ]
+    for worker in workers:
+        worker.start()
+
+    raw_tokens = []
+    reader = ChunkQueueReader(json_q)
+    try:
+        with response:
+            for set_code, card in iter_set_tokens(reader.read):
+                token = token_from_card(set_code, card)
+                if token is not None:
+                    raw_tokens.append(token)
+            # Let the cache file receive any trailing bytes before swapping it in.
+            reader.drain()
+            for worker in workers:
+                worker.join()
+        if expected_sha and hasher.hexdigest() != expected_sha:
+            raise ValueError(f"sha256 mismatch for {url}: got {hasher.hexdigest()}, "
+                             f"expected {expected_sha}")
+        os.replace(cache_tmp, cache_file)
+        _record_cache_version(cache_file, upstream_version)
+        token_fetch.save_validators(headers_file, {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        })
+    except Exception as e:
+        stop.set()
+        for worker in workers:
+            worker.join()
+        if os.path.exists(cache_tmp):
+            os.remove(cache_tmp)
+        if not os.path.exists(cache_file):
+            raise RuntimeError(f"Download failed and no cache available: {e}")
+        print(f"Download failed ({e}), falling back to cached file")
+        return extract_tokens_streaming(cache_file)
+
+    elapsed = time.time() - start
+    print(f"Downloaded {stats['compressed'] / 1024 / 1024:.1f}MB "
+          f"({'verified' if expected_sha else 'no published sha256'}), "
+          f"cached {stats['decompressed'] / 1024 / 1024:.1f}MB decompressed JSON "
+          f"in {elapsed:.1f}s")
+    print(f"Found {len(raw_tokens)} raw token entries across all sets")
+    return raw_tokens
 
 
 def sort_colors(colors: List[str]) -> str:
@@ -87,24 +711,46 @@ def sort_colors(colors: List[str]) -> str:
     return ''.join(sorted_colors)
 
 
-def strip_reminder_text(text: str) -> str:
-    """Remove reminder text in parentheses from abilities text."""
-    if not text:
-        return ''
-    cleaned = re.sub(r'\([^)]*\)', '', text)
-    cleaned = ' '.join(cleaned.split())
-    return cleaned.strip()
+def token_from_card(set_code: str, card: dict) -> Optional[TokenRecord]:
+    """Build a raw token record from one MTGJSON token card, or None if filtered."""
+    layout = card.get('layout', '')
+
+    # Filter: must be token/emblem layout AND type must contain Token or Emblem
+    if layout not in TOKEN_LAYOUTS:
+        return None
+
+    type_text = card.get('type', '') or ''
+
+    if 'Token' not in type_text and 'Emblem' not in type_text:
+        return None
+
+    # Extract fields
+    name = card.get('name', '').strip()
+    if not name:
+        return None
 
+    power = card.get('power', '')
+    toughness = card.get('toughness', '')
+    pt = f"{power}/{toughness}" if power and toughness else ''
 
-def build_scryfall_url(scryfall_id: str) -> str:
-    """Build Scryfall CDN image URL from scryfallId."""
-    if not scryfall_id:
-        return ''
-    front = scryfall_id[:2]
-    return f"https://cards.scryfall.io/large/front/{front[0]}/{front[1]}/{scryfall_id}.jpg"
+    colors = sort_colors(card.get('colors', []))
+    abilities = card.get('text', '') or ''
 
+    # Build artwork entry
+    scryfall_id = card.get('identifiers', {}).get('scryfallId', '')
+    artwork_url = build_scryfall_url(scryfall_id) if scryfall_id else ''
 
-def extract_tokens(all_printings: dict) -> List[Dict]:
+    # Get reverse related cards (nested under relatedCards)
+    related_cards = card.get('relatedCards', {}) or {}
+    reverse_related = related_cards.get('reverseRelated', []) or []
+
+    return TokenRecord(
+        name, type_text, abilities, pt, colors, reverse_related,
+        [(set_code, artwork_url)] if artwork_url else (),
+    )
+
+
+def extract_tokens(all_printings: dict) -> List[TokenRecord]:
     """Extract token entries from all sets in AllPrintings data."""
     print("Extracting tokens from all sets...")
 
@@ -112,103 +758,267 @@ def extract_tokens(all_printings: dict) -> List[Dict]:
     sets_data = all_printings.get('data', all_printings)
 
     for set_code, set_data in sets_data.items():
-        tokens_list = set_data.get('tokens', [])
-        for card in tokens_list:
-            layout = card.get('layout', '')
-            type_line = card.get('type', '') or card.get('types', '')
+        for card in set_data.get('tokens', []):
+            token = token_from_card(set_code, card)
+            if token is not None:
+                raw_tokens.append(token)
 
-            # Filter: must be token/emblem layout AND type must contain Token or Emblem
-            if layout not in TOKEN_LAYOUTS:
-                continue
+    print(f"Found {len(raw_tokens)} raw token entries across all sets")
+    return raw_tokens
 
-            # Build type string from type line
-            if isinstance(type_line, list):
-                type_line = ' '.join(type_line)
 
-            type_text = card.get('type', '') or ''
+def extract_tokens_streaming(cache_file: str = CACHE_FILE) -> List[TokenRecord]:
+    """Extract token entries by streaming the cached AllPrintings file.
 
-            if 'Token' not in type_text and 'Emblem' not in type_text:
-                continue
+    Produces the same list as extract_tokens(download_with_caching()) while
+    only ever holding one token card in memory at a time.
+    """
+    print("Streaming tokens from cached AllPrintings...")
 
-            # Extract fields
-            name = card.get('name', '').strip()
-            if not name:
-                continue
+    raw_tokens = []
+    with open(cache_file, 'rb') as f:
+        for set_code, card in iter_set_tokens(f.read):
+            token = token_from_card(set_code, card)
+            if token is not None:
+                raw_tokens.append(token)
+
+    print(f"Found {len(raw_tokens)} raw token entries across all sets")
+    return raw_tokens
+
+
+def _extract_set_groups(work: Tuple[str, str, int, int]) -> Tuple[int, Dict[int, Dict]]:
+    """Worker: extract and pre-group the tokens of one set slice of the cache.
+
+    Returns the raw token count and the set's dedup groups (plain dict, so it
+    pickles), in first-seen key order.
+    """
+    cache_file, set_code, start, end = work
+    with open(cache_file, 'rb') as f:
+        f.seek(start)
+        body = f.read(end - start)
+
+    raw_tokens = []
+    scanner = JsonScanner(io.BytesIO(body).read)
+    for card in _iter_tokens_array(scanner):
+        token = token_from_card(set_code, card)
+        if token is not None:
+            raw_tokens.append(token)
+    return len(raw_tokens), dict(group_tokens(raw_tokens, new_token_groups()))
+
+
+def extract_token_groups_parallel(cache_file: str = CACHE_FILE, jobs: int = 2) -> Dict[int, Dict]:
+    """Extract and pre-normalize tokens per set across a process pool.
+
+    Per-set groups are merged in document order, so the result is the same as
+    group_tokens() over extract_tokens() output: first-seen artwork order and
+    last-write-wins token fields are preserved.
+    """
+    print(f"Extracting tokens from all sets with {jobs} workers...")
+    spans = index_sets(cache_file)
+    work = [(cache_file, set_code, start, end) for set_code, start, end in spans]
+
+    token_groups = new_token_groups()
+    raw_count = 0
+    # Workers start with the default backend under spawn; pass ours on.
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=set_json_backend,
+                                                initargs=(json_backend(),)) as pool:
+        chunksize = max(1, len(work) // (jobs * 8))
+        for count, set_groups in pool.map(_extract_set_groups, work, chunksize=chunksize):
+            raw_count += count
+            merge_token_groups(token_groups, set_groups)
+
+    print(f"Found {raw_count} raw token entries across {len(spans)} sets")
+    return token_groups
 
-            power = card.get('power', '')
-            toughness = card.get('toughness', '')
-            pt = f"{power}/{toughness}" if power and toughness else ''
 
-            colors = sort_colors(card.get('colors', []))
-            abilities = card.get('text', '') or ''
+def _set_file_name(set_code: str) -> str:
+    """MTGJSON's per-set file stem (CON is reserved on Windows, so it's CON_)."""
+    return 'CON_' if set_code == 'CON' else set_code
 
-            # Build artwork entry
-            scryfall_id = card.get('identifiers', {}).get('scryfallId', '')
-            artwork_url = build_scryfall_url(scryfall_id) if scryfall_id else ''
 
-            # Get reverse related cards (nested under relatedCards)
-            related_cards = card.get('relatedCards', {}) or {}
-            reverse_related = related_cards.get('reverseRelated', []) or []
+def _set_fingerprint(set_code: str) -> Optional[str]:
+    """Published sha256 of a set's .json.xz, or None if it can't be fetched."""
+    return _published_sha256(f"{MTGJSON_API}/{_set_file_name(set_code)}.json.xz")
 
-            raw_tokens.append({
-                'name': name,
-                'type': type_text,
-                'abilities': abilities,
-                'pt': pt,
-                'colors': colors,
-                'reverse_related': reverse_related,
-                'artwork': [{'set': set_code, 'url': artwork_url}] if artwork_url else [],
-            })
+
+def _refresh_set(set_code: str) -> Tuple[str, Optional[str], Optional[List[TokenRecord]]]:
+    """Download one set file and extract its raw tokens.
+
+    Returns (set_code, sha256 of the archive, raw tokens), with None for both
+    on failure so the caller can keep the previously cached extraction.
+    """
+    url = f"{MTGJSON_API}/{_set_file_name(set_code)}.json.xz"
+    try:
+        compressed = _fetch(url, timeout=120)
+        set_data = loads(lzma.decompress(compressed)).get('data', {})
+    except Exception as e:
+        print(f"  {set_code}: download failed ({e})")
+        return set_code, None, None
+
+    raw_tokens = []
+    for card in set_data.get('tokens', []):
+        token = token_from_card(set_code, card)
+        if token is not None:
+            raw_tokens.append(token)
+    return set_code, hashlib.sha256(compressed).hexdigest(), raw_tokens
+
+
+def extract_tokens_incremental(set_cache_dir: str = SET_CACHE_DIR,
+                               upstream_version: Optional[str] = None) -> List[TokenRecord]:
+    """Extract tokens from per-set MTGJSON files, re-fetching only changed sets.
+
+    Each set's raw tokens are cached next to an index of the set archive's
+    sha256. A run fetches SetList.json plus every set's small .sha256 file
+    (concurrently) and only downloads sets whose fingerprint changed, so a
+    routine refresh moves a few hundred KB instead of all of AllPrintings.
+    Sets are emitted in code order, the same order AllPrintings uses.
+    The index is recorded as `upstream_version` only if every set is current.
+    """
+    os.makedirs(set_cache_dir, exist_ok=True)
+    index_file = os.path.join(set_cache_dir, 'index.json')
+    index = {}
+    if os.path.exists(index_file):
+        try:
+            with open(index_file, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (json.JSONDecodeError, ValueError):
+            index = {}
+
+    def cached_path(set_code: str) -> str:
+        return os.path.join(set_cache_dir, f"{_set_file_name(set_code)}.tokens.json")
+
+    print("Fetching MTGJSON set list...")
+    try:
+        set_list = json.loads(_fetch(f"{MTGJSON_API}/SetList.json"))['data']
+        set_codes = sorted({entry['code'] for entry in set_list})
+    except Exception as e:
+        if not index:
+            raise RuntimeError(f"Set list download failed and no per-set cache available: {e}")
+        print(f"Set list download failed ({e}), using cached sets")
+        set_codes = sorted(index)
+        upstream_version = None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=INCREMENTAL_FETCH_WORKERS) as pool:
+        fingerprints = dict(zip(set_codes, pool.map(_set_fingerprint, set_codes)))
+
+        # A set is stale if its fingerprint moved, is unknown, or its cache is gone.
+        stale = [
+            code for code in set_codes
+            if fingerprints[code] is None
+            or fingerprints[code] != index.get(code)
+            or not os.path.exists(cached_path(code))
+        ]
+        print(f"{len(set_codes)} sets, {len(stale)} new or changed")
+
+        for set_code, sha, raw_tokens in pool.map(_refresh_set, stale):
+            if raw_tokens is None:
+                upstream_version = None
+                continue
+            with open(cached_path(set_code), 'w', encoding='utf-8') as f:
+                json.dump([t.to_dict() for t in raw_tokens], f, ensure_ascii=False)
+            # Record the published fingerprint when we have it, so the next
+            # run compares like with like; fall back to our own digest.
+            index[set_code] = fingerprints[set_code] or sha
+
+    # Drop sets MTGJSON no longer lists.
+    for set_code in set(index) - set(set_codes):
+        del index[set_code]
+        if os.path.exists(cached_path(set_code)):
+            os.remove(cached_path(set_code))
+
+    tmp = index_file + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(tmp, index_file)
+    _record_cache_version(index_file, upstream_version)
+
+    raw_tokens = []
+    for set_code in set_codes:
+        path = cached_path(set_code)
+        if not os.path.exists(path):
+            print(f"  {set_code}: no cached extraction, skipping")
+            continue
+        raw_tokens.extend(TokenRecord.from_dict(t) for t in load_file(path))
 
     print(f"Found {len(raw_tokens)} raw token entries across all sets")
     return raw_tokens
 
 
-def clean_and_dedup(tokens: List[Dict]) -> List[Dict]:
-    """Clean, normalize, and deduplicate tokens. Matches Cockatrice script contract."""
-    print("Cleaning and deduplicating tokens...")
+def _new_group() -> Dict:
+    return {'id': None, 'token': None, 'reverse_related': set(), 'artwork': {}}
 
-    token_groups = defaultdict(lambda: {'token': None, 'reverse_related': set(), 'artwork': {}})
 
-    for token in tokens:
-        # Clean name — strip " Token" suffix
-        name = re.sub(r'\s*Token\s*$', '', token['name'], flags=re.IGNORECASE).strip()
-        if not name:
-            continue
+def new_token_groups() -> Dict[int, Dict]:
+    """Empty dedup state: key_hash of the composite ID -> id, token,
+    reverse_related, artwork.
 
-        # Clean type — strip "Token " prefix
-        type_text = re.sub(r'^Token\s+', '', token['type'], flags=re.IGNORECASE).strip()
+    The default factory is a module-level function so groups can be pickled
+    (stage snapshots).
+    """
+    return defaultdict(_new_group)
 
-        # Clean abilities — strip reminder text
-        abilities = strip_reminder_text(token['abilities'])
 
-        # Composite dedup key (must match Cockatrice script and Dart TokenDefinition.id)
-        unique_key = f"{name}|{token['pt']}|{token['colors']}|{type_text}|{abilities}"
+def group_tokens(tokens: List[TokenRecord], token_groups: Dict[int, Dict]) -> Dict[int, Dict]:
+    """Fold raw tokens into dedup groups, in order.
+
+    Token fields are last-write-wins, reverse_related is unioned and artwork
+    keeps first-seen order (deduped by URL).
+    """
+    for token, normalized in zip(tokens, normalize_records(tokens)):
+        if normalized is None:
+            continue
+        key, token_id, fields = normalized
+        group = token_groups[key]
+        check_key(group, token_id)
 
         # Store normalized token
-        token_groups[unique_key]['token'] = {
-            'name': name,
-            'abilities': abilities,
-            'pt': token['pt'],
-            'colors': token['colors'],
-            'type': type_text,
-        }
+        group['token'] = fields
 
         # Union reverse_related across printings
-        for card_name in token['reverse_related']:
+        for card_name in token.reverse_related:
             if card_name:
-                token_groups[unique_key]['reverse_related'].add(card_name)
+                group['reverse_related'].add(card_name)
 
         # Collect artwork (dedup by URL)
-        for art in token.get('artwork', []):
-            url = art.get('url', '')
-            if url and url not in token_groups[unique_key]['artwork']:
-                token_groups[unique_key]['artwork'][url] = art['set']
+        for set_code, url in token.artwork:
+            if url and url not in group['artwork']:
+                group['artwork'][url] = set_code
+
+    return token_groups
+
+
+def merge_token_groups(token_groups: Dict[int, Dict], later: Dict[int, Dict]) -> None:
+    """Fold groups built from a later slice of the input into token_groups.
+
+    Equivalent to having grouped both slices' tokens in one pass.
+    """
+    for key, data in later.items():
+        group = token_groups[key]
+        check_key(group, data['id'])
+        group['token'] = data['token']
+        group['reverse_related'] |= data['reverse_related']
+        for url, set_code in data['artwork'].items():
+            if url not in group['artwork']:
+                group['artwork'][url] = set_code
+
+
+def clean_and_dedup(tokens: List[TokenRecord],
+                    token_groups: Optional[Dict[int, Dict]] = None) -> List[Dict]:
+    """Clean, normalize, and deduplicate tokens. Matches Cockatrice script contract.
+
+    `token_groups` may carry groups already built from earlier input (see
+    --jobs); `tokens` are folded in after them.
+    """
+    print("Cleaning and deduplicating tokens...")
+
+    if token_groups is None:
+        token_groups = new_token_groups()
+    group_tokens(tokens, token_groups)
 
     # Build final list
     cleaned = []
     excluded_count = 0
-    for unique_key, data in token_groups.items():
+    for data in token_groups.values():
         if data['token'] is None:
             continue
 
@@ -226,6 +1036,7 @@ def clean_and_dedup(tokens: List[Dict]) -> List[Dict]:
 
         entry = data['token'].copy()
         entry['popularity'] = popularity
+        entry.update(token_facets.facet_fields(entry))
         entry['artwork'] = artwork_array
         entry['reverse_related'] = reverse_related_list
         cleaned.append(entry)
@@ -233,15 +1044,30 @@ def clean_and_dedup(tokens: List[Dict]) -> List[Dict]:
     if excluded_count > 0:
         print(f"Excluded {excluded_count} non-traditional token types (Counter/State/Bounty/Dungeon)")
 
-    cleaned.sort(key=lambda x: x['name'])
+    cleaned = canonical_tokens(cleaned)
     print(f"Processed {len(cleaned)} unique tokens after deduplication")
     return cleaned
 
 
+def resolve_near_duplicates(tokens: List[Dict], args: argparse.Namespace) -> List[Dict]:
+    """Apply allowlisted near-duplicate merges (--apply-merges), then report
+    the suggestions that remain (--near-duplicates)."""
+    if args.apply_merges:
+        with stage('merges') as st:
+            tokens = token_neardup.apply_merges(tokens, token_neardup.load_allowlist(args.apply_merges))
+            st.records = len(tokens)
+    if args.near_duplicates:
+        with stage('near_duplicates') as st:
+            result = token_neardup.find_near_duplicates(tokens)
+            token_neardup.write_report(result, tokens, args.near_duplicates)
+            st.records = len(tokens)
+    return tokens
+
+
 def load_custom_tokens(custom_file: str = None) -> List[Dict]:
     """Load custom tokens from JSON file."""
     if custom_file is None:
-        custom_file = os.path.join(os.path.dirname(__file__), 'custom_tokens.json')
+        custom_file = CUSTOM_TOKENS_FILE
 
     if not os.path.exists(custom_file):
         print(f"No custom tokens file found at {custom_file}")
@@ -262,41 +1088,21 @@ def load_custom_tokens(custom_file: str = None) -> List[Dict]:
         return []
 
 
-def merge_custom_tokens(generated: List[Dict], custom: List[Dict]) -> List[Dict]:
+def merge_custom_tokens(generated: List[TokenRecord], custom: List[Dict]) -> List[TokenRecord]:
     """Merge custom tokens with generated tokens (custom overrides on dedup)."""
     if not custom:
         return generated
 
     print(f"Merging {len(custom)} custom tokens with {len(generated)} generated tokens")
-    for token in custom:
-        token.setdefault('reverse_related', [])
-        token.setdefault('artwork', [])
-
-    merged = generated + custom
+    merged = generated + [TokenRecord.from_dict(token) for token in custom]
     print(f"Merged list: {len(merged)} total (before dedup)")
     return merged
 
 
-def analyze_popularity(tokens: List[Dict]):
-    """Print popularity distribution analysis."""
-    print("\n=== Popularity Distribution Analysis ===")
-    popularities = sorted([t['popularity'] for t in tokens], reverse=True)
-
-    if not popularities:
-        print("No tokens to analyze")
-        return
-
-    print(f"Total tokens: {len(tokens)}")
-    print(f"Min popularity: {min(popularities)}")
-    print(f"Max popularity: {max(popularities)}")
-    print(f"Mean popularity: {sum(popularities) / len(popularities):.2f}")
-    print(f"Median popularity: {popularities[len(popularities) // 2]}")
-
-    print("\nTop 20 most popular tokens:")
-    top = sorted(tokens, key=lambda x: (-x['popularity'], x['name']))[:20]
-    for i, t in enumerate(top, 1):
-        colors = t['colors'] if t['colors'] else 'Colorless'
-        print(f"  {i:2d}. {t['name']:30s} {t['pt']:8s} [{colors:5s}] - Pop: {t['popularity']}")
+def analyze_popularity(tokens: List[Dict], artifact_path: Optional[str] = None) -> Dict:
+    """Print popularity distribution analysis; save it to `artifact_path`
+    (see token_analytics)."""
+    return token_analytics.analyze_popularity(tokens, artifact_path)
 
 
 def save_output(tokens: List[Dict], output_path: str):
@@ -306,29 +1112,62 @@ def save_output(tokens: List[Dict], output_path: str):
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
     print(f"\nSaving {len(tokens)} tokens to {output_path}")
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(tokens, f, indent=2, ensure_ascii=False)
+    write_database(tokens, output_path)
     print(f"Done! Saved {len(tokens)} tokens.")
 
 
-def update_manifest(output_path: str, manifest_path: str) -> None:
-    """Refresh the bundled manifest so the in-app remote-update service can
-    compare versions cheaply. Bumps `version` by 1 and recomputes sha256/size
-    from the freshly-written database. min_app_version is preserved if the
-    file already exists; otherwise it falls back to the current pubspec value
-    (hardcoded here — keep in sync if the floor changes)."""
-    manifest_path = os.path.normpath(manifest_path)
-
-    # Compute fresh SHA + size from the just-written database.
+def file_digest(path: str) -> Tuple[str, int]:
+    """sha256 hex digest and size in bytes of a file."""
     sha = hashlib.sha256()
     size = 0
-    with open(output_path, 'rb') as f:
+    with open(path, 'rb') as f:
         for chunk in iter(lambda: f.read(1 << 16), b''):
             sha.update(chunk)
             size += len(chunk)
+    return sha.hexdigest(), size
+
+
+def read_manifest(manifest_path: str) -> Dict:
+    """The current manifest, or {} if missing or unreadable."""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError, ValueError):
+        return {}
+
+
+def update_manifest(output_path: str, manifest_path: str,
+                    source: Optional[Dict[str, str]] = None,
+                    artifacts: Optional[Dict[str, Dict]] = None) -> bool:
+    """Refresh the bundled manifest so the in-app remote-update service can
+    compare versions cheaply. Recomputes sha256/size from the freshly-written
+    database and bumps `version` by 1 (and `updated` to today) only if the
+    sha256 differs from the prior manifest's: the output is canonical, so a
+    rebuild of the same content keeps the same version and clients don't
+    re-download it. min_app_version is preserved if the file already exists;
+    otherwise it falls back to the current pubspec value (hardcoded here —
+    keep in sync if the floor changes). `source` is the build stamp the
+    preflight compares against on the next run. Returns whether the version
+    was bumped.
+
+    `artifacts` maps a name to {'path': ..., **extra} for alternate outputs
+    written next to the database; each is listed under `artifacts` with its
+    path relative to the manifest, sha256, size and any extra keys.
+
+    The app (TokenUpdateService, TokenDatabase and the About screen) looks
+    up version, sha256, size, updated and min_app_version by key, so the
+    build-only `format`, `artifacts` and `source` entries are ignored by
+    every shipped client."""
+    manifest_path = os.path.normpath(manifest_path)
+
+    # Compute fresh SHA + size from the just-written database.
+    sha, size = file_digest(output_path)
 
     prior_version = 0
     prior_min_app_version = "1.9.0"
+    prior_source = None
+    prior_sha = None
+    prior_updated = None
     if os.path.exists(manifest_path):
         try:
             with open(manifest_path, 'r', encoding='utf-8') as f:
@@ -336,50 +1175,348 @@ def update_manifest(output_path: str, manifest_path: str) -> None:
             prior_version = int(prior.get('version', 0))
             prior_min_app_version = prior.get(
                 'min_app_version', prior_min_app_version)
+            prior_source = prior.get('source')
+            prior_sha = prior.get('sha256')
+            prior_updated = prior.get('updated')
         except (json.JSONDecodeError, ValueError):
             pass
 
+    changed = sha != prior_sha or not prior_version
     manifest = {
-        'version': prior_version + 1,
-        'sha256': sha.hexdigest(),
+        'version': prior_version + 1 if changed else prior_version,
+        'sha256': sha,
         'size': size,
-        'updated': datetime.now(timezone.utc).date().isoformat(),
+        'updated': (datetime.now(timezone.utc).date().isoformat()
+                    if changed or not prior_updated else prior_updated),
         'min_app_version': prior_min_app_version,
+        'format': 1,
     }
+    if artifacts:
+        manifest['artifacts'] = {}
+        for name, artifact in sorted(artifacts.items()):
+            entry = {k: v for k, v in artifact.items() if k != 'path'}
+            entry['path'] = os.path.relpath(artifact['path'], os.path.dirname(manifest_path))
+            entry['sha256'], entry['size'] = file_digest(artifact['path'])
+            manifest['artifacts'][name] = entry
+    if source or prior_source:
+        manifest['source'] = source or prior_source
     with open(manifest_path, 'w', encoding='utf-8') as f:
         json.dump(manifest, f, indent=2)
         f.write('\n')
-    print(f"Updated manifest: version {manifest['version']}, "
-          f"sha {manifest['sha256'][:12]}…, "
-          f"updated {manifest['updated']}")
-
-
-def main():
-    """Main execution."""
-    start = time.time()
+    if changed:
+        print(f"Updated manifest: version {manifest['version']}, "
+              f"sha {manifest['sha256'][:12]}…, "
+              f"updated {manifest['updated']}")
+    else:
+        print(f"Database content unchanged: manifest stays at version {manifest['version']} "
+              f"(sha {manifest['sha256'][:12]}…)")
+    return changed
+
+
+def shard_artifacts(tokens: List[Dict], count: int, database_path: str, shard_dir: str,
+                    artifacts: Dict[str, Dict]) -> None:
+    """Write popularity-first shards of the database at `database_path`
+    (see token_shards) and add them to the manifest `artifacts`."""
+    print(f"\nWriting {count} popularity-first shards...")
+    for shard in token_shards.write_shards(tokens, os.path.normpath(shard_dir), count, database_path):
+        artifacts[f"shard-{shard['index']}"] = {
+            **shard,
+            'kind': 'shard',
+            'format': token_shards.SHARD_FORMAT,
+        }
 
-    # Download / use cached MTGJSON data
-    all_printings = download_with_caching()
 
-    # Extract tokens from all sets
-    raw_tokens = extract_tokens(all_printings)
+def check_output(tokens: List[Dict], output_path: str, manifest_path: Optional[str]) -> bool:
+    """--check: report whether publishing `tokens` would change the database
+    the manifest describes (or the file at `output_path`, without a
+    manifest), writing nothing. Returns True if it would."""
+    data = dumps_database(tokens).encode('utf-8')
+    sha = hashlib.sha256(data).hexdigest()
+    published = read_manifest(manifest_path).get('sha256') if manifest_path else None
+    if published is None and os.path.exists(output_path):
+        published = file_digest(output_path)[0]
+
+    if sha == published:
+        print(f"\nCheck: up to date ({len(tokens)} tokens, sha {sha[:12]}…)")
+        return False
+    print(f"\nCheck: a rebuild would change the database "
+          f"(sha {published[:12] + '…' if published else 'none'} -> {sha[:12]}…, {len(data)} bytes)")
+    if os.path.exists(output_path):
+        with open(output_path, 'r', encoding='utf-8') as f:
+            published_tokens = json.load(f)
+        delta = token_delta.make_delta(published_tokens, tokens)
+        print(f"  {len(delta['added'])} added, {len(delta['changed'])} changed, "
+              f"{len(delta['removed'])} removed")
+        if not (delta['added'] or delta['changed'] or delta['removed']):
+            print("  same tokens; only their order or formatting differs")
+    return True
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command-line options."""
+    parser = argparse.ArgumentParser(
+        description="Build token_database.json from MTGJSON AllPrintings.")
+    parser.add_argument(
+        '--stream', action='store_true',
+        help="Stream tokens out of the cached AllPrintings instead of loading "
+             "the whole document (bounded memory)")
+    parser.add_argument(
+        '--pipeline', action='store_true',
+        help="Download, decompress, cache and extract in overlapping chunked "
+             "stages (implies --stream)")
+    parser.add_argument(
+        '--jobs', type=int, default=1, metavar='N',
+        help="Extract and pre-normalize sets across N worker processes "
+             "(output is identical to the serial path)")
+    parser.add_argument(
+        '--json-backend', choices=JSON_BACKENDS, default='auto',
+        help="JSON parser/serializer: orjson if installed (auto, the default) "
+             "or the stdlib json module; the output bytes are the same")
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help="Use per-set MTGJSON files and a per-set extraction cache, "
+             "downloading only sets whose sha256 changed")
+    parser.add_argument(
+        '--compact', action='store_true',
+        help="Also write the minified, interned v2 database "
+             "(token_database.v2.json) and list it in the manifest")
+    parser.add_argument(
+        '--ndjson', action='store_true',
+        help="Also write token_database.ndjson: a header line, then one token "
+             "per line in popularity-then-name order with its rank")
+    parser.add_argument(
+        '--sqlite', action='store_true',
+        help="Also write token_database.sqlite (normalized tables, FTS5 search, "
+             "facet indexes) and list it in the manifest")
+    parser.add_argument(
+        '--deltas', type=int, default=0, metavar='N',
+        help="Keep the last N published databases and write a delta patch "
+             "from each of them to the new version")
+    parser.add_argument(
+        '--near-duplicates', nargs='?', const=NEAR_DUPLICATE_REPORT_PATH, metavar='REPORT',
+        help="Find near-duplicate tokens (MinHash/LSH over ability text) and write "
+             "merge suggestions for review (default report: mtgjson_cache/near_duplicates.json)")
+    parser.add_argument(
+        '--apply-merges', nargs='?', const=NEAR_DUPLICATE_MERGES_FILE, metavar='ALLOWLIST',
+        help="Merge the near-duplicates listed in an allowlist "
+             "(default near_duplicate_merges.json)")
+    parser.add_argument(
+        '--shards', type=int, default=0, metavar='N',
+        help="Also write the database as N shards (N >= 2), the most popular "
+             f"{token_shards.HOT_SHARD_TOKENS} tokens first, listed in the manifest")
+    parser.add_argument(
+        '--check', action='store_true',
+        help="Rebuild in memory and report whether the published database would "
+             "change; writes no outputs (exit status 1 if it would)")
+    parser.add_argument(
+        '--skip-reverse-index', action='store_true',
+        help="Don't write token_reverse_index.json (card name -> token indexes)")
+    parser.add_argument(
+        '--skip-facets', action='store_true',
+        help="Don't write token_facets.json (facet posting bitmaps)")
+    parser.add_argument(
+        '--skip-analytics', action='store_true',
+        help="Skip popularity analytics and token_popularity.json (faster rebuilds)")
+    parser.add_argument(
+        '--serve', nargs='?', type=int, const=token_serve.DEFAULT_PORT, metavar='PORT',
+        help="After building, serve the manifest, database and artifacts on "
+             f"localhost (default port {token_serve.DEFAULT_PORT}) until Ctrl-C")
+    parser.add_argument(
+        '--profile', metavar='STAGE',
+        help="Run one stage (e.g. extract, dedup, serialize) under cProfile; "
+             "stats are saved to the cache directory")
+    parser.add_argument(
+        '--trace-memory', action='store_true',
+        help="Record tracemalloc peak memory per stage in the run report "
+             "(slows the build)")
+    parser.add_argument(
+        '--no-snapshots', action='store_true',
+        help="Recompute every stage instead of reusing snapshots from the "
+             "cache directory")
+    parser.add_argument(
+        '--force', action='store_true',
+        help="Rebuild even if the preflight finds upstream and inputs unchanged")
+    args = parser.parse_args(argv)
+    if args.shards and args.shards < 2:
+        parser.error("--shards needs at least 2 shards")
+    if args.serve is not None and args.check:
+        parser.error("--serve needs a build to serve; drop --check")
+    try:
+        set_json_backend(args.json_backend)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def extract_raw_tokens(args: argparse.Namespace,
+                       upstream_version: Optional[str]) -> Tuple[List[TokenRecord], Optional[Dict[int, Dict]]]:
+    """Fetch MTGJSON and extract token printings with the selected mode.
+
+    Returns (raw_tokens, token_groups); --jobs pre-groups sets in the
+    workers and returns its result as token_groups instead.
+    """
+    token_groups = None
+    if args.incremental:
+        # Re-fetch only new/changed sets; reuse cached extractions for the rest
+        with stage('extract') as st:
+            raw_tokens = extract_tokens_incremental(SET_CACHE_DIR, upstream_version)
+            st.records = len(raw_tokens)
+    elif args.jobs > 1:
+        # Refresh the cache, then extract and pre-group sets in parallel
+        refresh_cache(upstream_version)
+        with stage('extract') as st:
+            token_groups = extract_token_groups_parallel(CACHE_FILE, args.jobs)
+            st.bytes = os.path.getsize(CACHE_FILE)
+        raw_tokens = []
+    elif args.pipeline:
+        # Overlap download, decompression, caching and token extraction
+        with stage('pipeline') as st:
+            raw_tokens = download_and_extract_pipelined(MTGJSON_URL, CACHE_FILE, upstream_version)
+            st.records = len(raw_tokens)
+            st.notes['overlapped'] = ['download', 'decompress', 'parse', 'extract']
+    elif args.stream:
+        # Refresh the cache, then decode only the tokens arrays
+        refresh_cache(upstream_version)
+        with stage('extract') as st:
+            raw_tokens = extract_tokens_streaming(CACHE_FILE)
+            st.records = len(raw_tokens)
+            st.bytes = os.path.getsize(CACHE_FILE)
+    else:
+        # Download / use cached MTGJSON data
+        all_printings = download_with_caching(upstream_version)
+
+        # Extract tokens from all sets
+        with stage('extract') as st:
+            raw_tokens = extract_tokens(all_printings)
+            st.records = len(raw_tokens)
+        del all_printings
+    return raw_tokens, token_groups
+
+
+def dedup_tokens(extracted: Tuple[List[TokenRecord], Optional[Dict[int, Dict]]],
+                 custom_tokens: List[Dict]) -> List[Dict]:
+    """Merge custom tokens into the extracted printings, then clean and dedup."""
+    raw_tokens, token_groups = extracted
+    with stage('merge_custom') as st:
+        merged = merge_custom_tokens(raw_tokens, custom_tokens)
+        st.records = len(custom_tokens)
+
+    # Clean, normalize, deduplicate (on top of any pre-grouped sets)
+    with stage('dedup') as st:
+        cleaned = clean_and_dedup(merged, token_groups)
+        st.records = len(merged) + (len(token_groups) if token_groups else 0)
+    return cleaned
 
-    # Load and merge custom tokens
-    custom_tokens = load_custom_tokens()
-    merged = merge_custom_tokens(raw_tokens, custom_tokens)
 
-    # Clean, normalize, deduplicate
-    cleaned = clean_and_dedup(merged)
+def build(args: argparse.Namespace) -> str:
+    """Run the pipeline stages; returns the run status for the report."""
+    # Preflight: one small request decides whether anything needs rebuilding.
+    with stage('preflight'):
+        upstream = fetch_upstream_meta()
+        stamp = compute_build_stamp(upstream, output_options(args)) if upstream else None
+    upstream_version = upstream['version'] if upstream else None
+    if stamp and not (args.force or args.check) and stamp == read_build_stamp(MANIFEST_PATH):
+        print(f"MTGJSON {upstream_version}, local inputs and output options unchanged "
+              f"since the last build; nothing to do (use --force to rebuild)")
+        return 'unchanged'
+
+    # Extraction and dedup form a small stage graph whose outputs are
+    # snapshotted, so e.g. a custom_tokens.json edit re-runs only merge + dedup.
+    # Stages are keyed on this script and every token_* module it imports.
+    # Extraction is keyed on the upstream version, so it is only snapshotted
+    # when the cache it read really holds that version: after a download
+    # falls back to an older cache, the next run fetches again.
+    code = code_files(sys.modules[__name__])
+    graph = StageGraph(SNAPSHOT_DIR, enabled=not args.no_snapshots)
+    graph.add('extract', lambda: extract_raw_tokens(args, upstream_version),
+              inputs=[upstream_version], code=code,
+              snapshot_if=lambda _: data_is_current(upstream_version, args.incremental))
+    graph.add('custom', load_custom_tokens,
+              inputs=[file_fingerprint([CUSTOM_TOKENS_FILE])], snapshot=False)
+    graph.add('dedup', dedup_tokens, deps=['extract', 'custom'], code=code)
+    cleaned = resolve_near_duplicates(graph.get('dedup'), args)
+    if stamp and not graph.trusted('dedup'):
+        # Keep the previous stamp, so the next run's preflight retries.
+        print(f"Built from cached data older than MTGJSON {upstream_version}; "
+              "not recording the build stamp")
+        stamp = None
+
+    if args.check:
+        with stage('check'):
+            changed = check_output(cleaned, OUTPUT_PATH, MANIFEST_PATH)
+        return 'would_change' if changed else 'unchanged'
 
     # Analyze popularity
-    analyze_popularity(cleaned)
+    artifacts = {}
+    if not args.skip_analytics:
+        with stage('analyze') as st:
+            analyze_popularity(cleaned, POPULARITY_PATH)
+            st.records = len(cleaned)
+        artifacts['popularity'] = {'path': POPULARITY_PATH, 'format': token_analytics.ANALYTICS_FORMAT}
+
+    # Archive the currently published database before overwriting it
+    prior_manifest = read_manifest(MANIFEST_PATH)
+    if args.deltas:
+        token_delta.archive_published(os.path.normpath(OUTPUT_PATH), prior_manifest, HISTORY_DIR)
 
     # Save output
-    save_output(cleaned, OUTPUT_PATH)
+    with stage('serialize') as st:
+        save_output(cleaned, OUTPUT_PATH)
+        st.records = len(cleaned)
+        st.bytes = os.path.getsize(OUTPUT_PATH)
+        st.notes['json_backend'] = json_backend()
+
+    # Card -> token lookup, so clients don't rebuild it from the forward lists
+    if not args.skip_reverse_index:
+        with stage('reverse_index'):
+            token_reverse_index.write_reverse_index(cleaned, os.path.normpath(REVERSE_INDEX_PATH), OUTPUT_PATH)
+        artifacts['reverse_index'] = {'path': REVERSE_INDEX_PATH,
+                                      'format': token_reverse_index.REVERSE_INDEX_FORMAT}
+
+    # Posting bitmaps over the tokens' facet fields, so filters are bitwise ANDs
+    if not args.skip_facets:
+        with stage('facets'):
+            token_facets.write_facet_index(cleaned, os.path.normpath(FACETS_PATH), OUTPUT_PATH)
+        artifacts['facets'] = {'path': FACETS_PATH, 'format': token_facets.FACETS_FORMAT}
+
+    # Alternate encodings listed in the manifest alongside the v1 database
+    if args.compact:
+        with stage('compact'):
+            token_compact.save_compact(cleaned, os.path.normpath(COMPACT_OUTPUT_PATH), OUTPUT_PATH)
+        artifacts['compact'] = {'path': COMPACT_OUTPUT_PATH, 'format': token_compact.FORMAT_VERSION}
+    if args.ndjson:
+        with stage('ndjson'):
+            token_ndjson.write_ndjson(cleaned, os.path.normpath(NDJSON_OUTPUT_PATH), OUTPUT_PATH)
+        artifacts['ndjson'] = {'path': NDJSON_OUTPUT_PATH, 'format': token_ndjson.NDJSON_FORMAT}
+    if args.sqlite:
+        with stage('sqlite'):
+            token_sqlite.write_sqlite(cleaned, os.path.normpath(SQLITE_OUTPUT_PATH), OUTPUT_PATH)
+        artifacts['sqlite'] = {'path': SQLITE_OUTPUT_PATH, 'format': token_sqlite.SQLITE_FORMAT}
+    if args.shards:
+        with stage('shards'):
+            shard_artifacts(cleaned, args.shards, OUTPUT_PATH, SHARD_DIR, artifacts)
+    if args.deltas:
+        print(f"\nWriting delta patches from the last {args.deltas} published versions...")
+        # Same content keeps the same version (see update_manifest), and
+        # rewrites the same deltas.
+        new_version = int(prior_manifest.get('version', 0))
+        if file_digest(OUTPUT_PATH)[0] != prior_manifest.get('sha256') or not new_version:
+            new_version += 1
+        with stage('deltas'):
+            deltas = token_delta.write_deltas(
+                os.path.normpath(OUTPUT_PATH), new_version, HISTORY_DIR, DELTA_DIR, args.deltas)
+        for delta in deltas:
+            artifacts[f"delta-{delta['from_version']}"] = {
+                'path': delta['path'],
+                'kind': 'delta',
+                'from_version': delta['from_version'],
+                'format': token_delta.DELTA_FORMAT,
+            }
 
     # Refresh the bundled manifest so the in-app remote-update service can
     # see the new version + sha256.
-    update_manifest(OUTPUT_PATH, MANIFEST_PATH)
+    with stage('manifest'):
+        update_manifest(OUTPUT_PATH, MANIFEST_PATH, stamp, artifacts)
 
     # Summary
     color_counts = defaultdict(int)
@@ -391,10 +1528,31 @@ def main():
     print("\nTokens by color:")
     for color, count in sorted(color_counts.items()):
         print(f"  {color}: {count}")
+    return 'ok'
+
+
+def main(argv: Optional[List[str]] = None):
+    """Main execution."""
+    args = parse_args(argv)
+    start = time.time()
+
+    start_run(os.path.basename(__file__), trace_memory=args.trace_memory,
+              profile_stage=args.profile, profile_dir=CACHE_DIR)
+    status = 'error'
+    try:
+        status = build(args)
+    finally:
+        # An unchanged preflight or a --check writes nothing, so scheduled
+        # no-op runs leave the tree clean.
+        if status != 'unchanged' and not args.check:
+            finish_run(REPORT_PATH, status)
 
     elapsed = time.time() - start
     print(f"\nCompleted in {elapsed:.1f}s")
+    if args.serve is not None:
+        token_serve.serve(MANIFEST_PATH, port=args.serve)
+    return 1 if status == 'would_change' else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
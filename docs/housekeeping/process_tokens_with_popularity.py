@@ -4,21 +4,35 @@ Script to fetch and process Magic token data from GitHub with popularity metrics
 Generates TokenDatabase.json for the Doubling Season iOS app.
 """
 
+import argparse
 import json
-import re
 import xml.etree.ElementTree as ET
-from urllib.request import urlopen
-from typing import Dict, List, Optional, Set
+from urllib.request import urlopen, Request
+from typing import Dict, Iterator, List, Optional, Set
 from collections import defaultdict
 import os
 
+import token_analytics
+import token_facets
+from token_instrument import finish_run, stage, start_run
+from token_io import canonical_tokens, write_database
+from token_normalize import TokenRecord, check_key, normalize_records
+
+XML_URL = "https://raw.githubusercontent.com/Cockatrice/Magic-Token/master/tokens.xml"
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cockatrice_cache")
+XML_CACHE_FILE = os.path.join(CACHE_DIR, "tokens.xml")
+XML_CACHE_HEADERS = XML_CACHE_FILE + ".headers.json"
+XML_READ_SIZE = 1 << 16
+REPORT_PATH = "../../assets/token_build_report.json"
+POPULARITY_PATH = "../../assets/token_popularity.json"
+
 def fetch_xml_data(url: str) -> str:
     """Fetch XML data from the given URL."""
     print(f"Fetching XML data from: {url}")
     with urlopen(url) as response:
         return response.read().decode('utf-8')
 
-def parse_token_xml(xml_content: str) -> List[Dict]:
+def parse_token_xml(xml_content: str) -> List[TokenRecord]:
     """Parse XML content and extract token information including reverse-related cards."""
     print("Parsing XML content...")
     root = ET.fromstring(xml_content)
@@ -31,134 +45,206 @@ def parse_token_xml(xml_content: str) -> List[Dict]:
         return tokens
 
     for card in cards_element.findall('card'):
-        # Check if this is a token (has <token>1</token> element)
-        token_elem = card.find('token')
-        if token_elem is None or token_elem.text != '1':
-            continue
+        token_data = card_to_token(card)
+        if token_data is not None:
+            tokens.append(token_data)
 
-        # Extract basic information
-        name = card.find('name')
-        if name is None or not name.text:
-            continue
+    return tokens
 
-        name_text = name.text.strip()
-
-        # Extract type from prop element
-        prop = card.find('prop')
-        type_text = ""
-        pt_text = ""
-        colors_text = ""
-
-        if prop is not None:
-            type_elem = prop.find('type')
-            if type_elem is not None and type_elem.text:
-                type_text = type_elem.text.strip()
-
-            # Extract power/toughness
-            pt_elem = prop.find('pt')
-            if pt_elem is not None and pt_elem.text:
-                pt_text = pt_elem.text.strip()
-
-            # Extract colors
-            colors_elem = prop.find('colors')
-            if colors_elem is not None and colors_elem.text:
-                colors_text = colors_elem.text.strip()
-
-        # Extract abilities/text
-        text_elem = card.find('text')
-        abilities_text = ""
-        if text_elem is not None and text_elem.text:
-            abilities_text = text_elem.text.strip()
-
-        # Extract reverse-related cards (NEW)
-        reverse_related = []
-        for reverse_elem in card.findall('reverse-related'):
-            if reverse_elem.text:
-                reverse_related.append(reverse_elem.text.strip())
-
-        # Extract artwork URLs from <set> tags
-        artwork = []
-        for set_elem in card.findall('set'):
-            pic_url = set_elem.get('picURL')
-            set_code = set_elem.text
-            if pic_url and set_code:
-                artwork.append({
-                    'set': set_code.strip(),
-                    'url': pic_url.strip()
-                })
-
-        # Create token data
-        token_data = {
-            'name': name_text,
-            'type': type_text if type_text else "Token",
-            'abilities': abilities_text,
-            'pt': pt_text,
-            'colors': colors_text,
-            'reverse_related': reverse_related,  # Track reverse-related cards
-            'artwork': artwork  # Track artwork URLs from sets
-        }
-
-        tokens.append(token_data)
+def card_to_token(card: ET.Element) -> Optional[TokenRecord]:
+    """Build a raw token record from a <card> element, or None if it isn't a token."""
+    # Check if this is a token (has <token>1</token> element)
+    token_elem = card.find('token')
+    if token_elem is None or token_elem.text != '1':
+        return None
+
+    # Extract basic information
+    name = card.find('name')
+    if name is None or not name.text:
+        return None
+
+    name_text = name.text.strip()
+
+    # Extract type from prop element
+    prop = card.find('prop')
+    type_text = ""
+    pt_text = ""
+    colors_text = ""
+
+    if prop is not None:
+        type_elem = prop.find('type')
+        if type_elem is not None and type_elem.text:
+            type_text = type_elem.text.strip()
+
+        # Extract power/toughness
+        pt_elem = prop.find('pt')
+        if pt_elem is not None and pt_elem.text:
+            pt_text = pt_elem.text.strip()
+
+        # Extract colors
+        colors_elem = prop.find('colors')
+        if colors_elem is not None and colors_elem.text:
+            colors_text = colors_elem.text.strip()
+
+    # Extract abilities/text
+    text_elem = card.find('text')
+    abilities_text = ""
+    if text_elem is not None and text_elem.text:
+        abilities_text = text_elem.text.strip()
+
+    # Extract reverse-related cards (NEW)
+    reverse_related = []
+    for reverse_elem in card.findall('reverse-related'):
+        if reverse_elem.text:
+            reverse_related.append(reverse_elem.text.strip())
+
+    # Extract artwork URLs from <set> tags
+    artwork = []
+    for set_elem in card.findall('set'):
+        pic_url = set_elem.get('picURL')
+        set_code = set_elem.text
+        if pic_url and set_code:
+            artwork.append((set_code.strip(), pic_url.strip()))
+
+    # Create token record (reverse-related cards and artwork URLs from sets)
+    return TokenRecord(
+        name_text,
+        type_text if type_text else "Token",
+        abilities_text,
+        pt_text,
+        colors_text,
+        reverse_related,
+        artwork,
+    )
+
+def iter_token_xml(source) -> Iterator[TokenRecord]:
+    """Stream raw TokenRecords (not dicts: use .to_dict() for a mapping)
+    out of tokens.xml as each <card> closes.
+
+    `source` is a path or a binary file-like object (e.g. an HTTP response).
+    Processed cards are cleared and detached from <cards>, so memory stays
+    flat regardless of document size.
+    """
+    path = []
+    cards_elem = None
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            path.append(elem)
+            if elem.tag == 'cards' and cards_elem is None:
+                cards_elem = elem
+            continue
+        path.pop()
+        if elem.tag == 'card' and path and path[-1] is cards_elem:
+            token_data = card_to_token(elem)
+            if token_data is not None:
+                yield token_data
+            cards_elem.clear()
+
+class _TeeReader:
+    """File-like wrapper that copies everything read into a second file."""
+
+    def __init__(self, response, out):
+        self._response = response
+        self._out = out
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._response.read(XML_READ_SIZE if size is None or size < 0 else size)
+        self._out.write(data)
+        return data
+
+def _load_cache_headers() -> Dict:
+    """Validators (ETag / Last-Modified) saved with the cached tokens.xml."""
+    if not (os.path.exists(XML_CACHE_FILE) and os.path.exists(XML_CACHE_HEADERS)):
+        return {}
+    try:
+        with open(XML_CACHE_HEADERS, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError):
+        return {}
+
+def stream_token_xml(url: str) -> List[TokenRecord]:
+    """Fetch tokens.xml with a conditional GET and parse it while downloading.
+
+    A 200 response is fed straight into iterparse and tee'd into the local
+    cache; a 304, or a request or stream that fails with a cache present,
+    parses the cache instead. The cache and its validators are only replaced
+    after a complete, well-formed download.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    validators = _load_cache_headers()
+    headers = {'User-Agent': 'DoublingSeason-TokenGenerator/1.0'}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
 
+    print(f"Fetching XML data from: {url}")
+    try:
+        response = urlopen(Request(url, headers=headers))
+    except Exception as e:
+        if hasattr(e, 'code') and e.code == 304:
+            print("tokens.xml is up to date (304 Not Modified), using cache")
+        elif os.path.exists(XML_CACHE_FILE):
+            print(f"Download failed ({e}), falling back to cached tokens.xml")
+        else:
+            raise RuntimeError(f"Download failed and no cache available: {e}")
+        return list(iter_token_xml(XML_CACHE_FILE))
+
+    print("Streaming XML content...")
+    partial = XML_CACHE_FILE + '.part'
+    try:
+        with response, open(partial, 'wb') as out:
+            tokens = list(iter_token_xml(_TeeReader(response, out)))
+            # Copy anything after the root element so the cache is complete.
+            for chunk in iter(lambda: response.read(XML_READ_SIZE), b''):
+                out.write(chunk)
+            validators = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+    except Exception as e:
+        if os.path.exists(partial):
+            os.remove(partial)
+        if not os.path.exists(XML_CACHE_FILE):
+            raise RuntimeError(f"Download failed and no cache available: {e}")
+        print(f"Download failed partway ({e}), falling back to cached tokens.xml")
+        return list(iter_token_xml(XML_CACHE_FILE))
+
+    os.replace(partial, XML_CACHE_FILE)
+    with open(XML_CACHE_HEADERS, 'w', encoding='utf-8') as f:
+        json.dump(validators, f, indent=2)
     return tokens
 
-def clean_token_data(tokens: List[Dict]) -> List[Dict]:
+def clean_token_data(tokens: List[TokenRecord]) -> List[Dict]:
     """Clean and normalize token data, calculating popularity from unique reverse-related cards."""
     print("Cleaning and normalizing token data with popularity calculation...")
 
-    # First pass: group by deduplication key and collect unique reverse-related cards and artwork
-    token_groups = defaultdict(lambda: {'token': None, 'reverse_related': set(), 'artwork': {}})
-
-    for token in tokens:
-        # Clean name - remove "Token" suffix and extra whitespace
-        name = token['name']
-        name = re.sub(r'\s*Token\s*$', '', name, flags=re.IGNORECASE)
-        name = name.strip()
+    # First pass: group by hashed deduplication key and collect unique reverse-related cards and artwork
+    token_groups = defaultdict(lambda: {'id': None, 'token': None, 'reverse_related': set(), 'artwork': {}})
 
-        # Skip if empty name
-        if not name:
+    for token, normalized in zip(tokens, normalize_records(tokens)):
+        # Skip if empty name (name/type/abilities cleaning lives in token_normalize)
+        if normalized is None:
             continue
-
-        # Clean type - remove "Token" prefix since it's not a real Magic type
-        type_text = token['type']
-        # Remove "Token " prefix (case-insensitive, handles "Token Creature", "Token Artifact", etc.)
-        type_text = re.sub(r'^Token\s+', '', type_text, flags=re.IGNORECASE)
-        type_text = type_text.strip()
-
-        # Clean abilities text
-        abilities = token['abilities']
-        if abilities:
-            # Remove reminder text in parentheses
-            abilities = re.sub(r'\([^)]*\)', '', abilities)
-            # Clean up whitespace and newlines
-            abilities = ' '.join(abilities.split())
-            abilities = abilities.strip()
-
-        # Create unique identifier for deduplication
-        unique_key = f"{name}|{token['pt']}|{token['colors']}|{type_text}|{abilities}"
+        key, token_id, fields = normalized
+        group = token_groups[key]
+        check_key(group, token_id)
 
         # Store token data (will be overwritten if duplicate, which is fine)
-        token_groups[unique_key]['token'] = {
-            'name': name,
-            'abilities': abilities,
-            'pt': token['pt'],
-            'colors': token['colors'] if token['colors'] else "",
-            'type': type_text
-        }
+        group['token'] = fields
 
         # Add reverse-related cards to the set (automatically handles uniqueness)
-        for card_name in token['reverse_related']:
-            token_groups[unique_key]['reverse_related'].add(card_name)
+        group['reverse_related'].update(token.reverse_related)
 
         # Add artwork URLs (use dict to deduplicate by URL, store set code as value)
-        for art in token.get('artwork', []):
-            if art['url'] not in token_groups[unique_key]['artwork']:
-                token_groups[unique_key]['artwork'][art['url']] = art['set']
+        for set_code, url in token.artwork:
+            if url not in group['artwork']:
+                group['artwork'][url] = set_code
 
     # Second pass: create final token list with popularity
     cleaned_tokens = []
     excluded_count = 0
-    for unique_key, data in token_groups.items():
+    for data in token_groups.values():
         if data['token'] is None:
             continue
 
@@ -181,119 +267,20 @@ def clean_token_data(tokens: List[Dict]) -> List[Dict]:
 
         token_entry = data['token'].copy()
         token_entry['popularity'] = popularity
+        token_entry.update(token_facets.facet_fields(token_entry))
         token_entry['artwork'] = artwork_array
         cleaned_tokens.append(token_entry)
 
     if excluded_count > 0:
         print(f"Excluded {excluded_count} non-traditional token types (Counter/State/Bounty/Dungeon)")
 
-    # Sort tokens by name for consistency
-    cleaned_tokens.sort(key=lambda x: x['name'])
-
-    return cleaned_tokens
-
-def analyze_popularity_distribution(tokens: List[Dict]) -> Dict:
-    """Analyze the distribution of popularity scores."""
-    print("\n=== Popularity Distribution Analysis ===")
-
-    popularities = [token['popularity'] for token in tokens]
-    popularities.sort(reverse=True)
-
-    stats = {
-        'total_tokens': len(tokens),
-        'min': min(popularities) if popularities else 0,
-        'max': max(popularities) if popularities else 0,
-        'mean': sum(popularities) / len(popularities) if popularities else 0,
-        'median': popularities[len(popularities) // 2] if popularities else 0
-    }
-
-    # Calculate percentiles
-    def percentile(data, p):
-        if not data:
-            return 0
-        k = (len(data) - 1) * (p / 100)
-        f = int(k)
-        c = int(k) + 1 if k < len(data) - 1 else int(k)
-        if f == c:
-            return data[f]
-        return data[f] * (c - k) + data[c] * (k - f)
-
-    stats['p10'] = percentile(popularities, 10)
-    stats['p25'] = percentile(popularities, 25)
-    stats['p50'] = percentile(popularities, 50)
-    stats['p75'] = percentile(popularities, 75)
-    stats['p90'] = percentile(popularities, 90)
-    stats['p95'] = percentile(popularities, 95)
-    stats['p99'] = percentile(popularities, 99)
-
-    print(f"Total tokens: {stats['total_tokens']}")
-    print(f"Min popularity: {stats['min']}")
-    print(f"Max popularity: {stats['max']}")
-    print(f"Mean popularity: {stats['mean']:.2f}")
-    print(f"Median popularity: {stats['median']}")
-    print("\nPercentiles:")
-    print(f"  10th: {stats['p10']}")
-    print(f"  25th: {stats['p25']}")
-    print(f"  50th (median): {stats['p50']}")
-    print(f"  75th: {stats['p75']}")
-    print(f"  90th: {stats['p90']}")
-    print(f"  95th: {stats['p95']}")
-    print(f"  99th: {stats['p99']}")
-
-    # Count distribution
-    popularity_counts = {}
-    for pop in popularities:
-        popularity_counts[pop] = popularity_counts.get(pop, 0) + 1
-
-    print("\nTop 20 most popular tokens:")
-    top_tokens = sorted(tokens, key=lambda x: (-x['popularity'], x['name']))[:20]
-    for i, token in enumerate(top_tokens, 1):
-        colors = token['colors'] if token['colors'] else 'Colorless'
-        print(f"  {i:2d}. {token['name']:30s} {token['pt']:8s} [{colors:5s}] - Popularity: {token['popularity']}")
-
-    print("\nPopularity frequency distribution:")
-    print("Popularity | Count | Cumulative")
-    print("-" * 40)
-    cumulative = 0
-    for pop in sorted(popularity_counts.keys(), reverse=True)[:30]:
-        count = popularity_counts[pop]
-        cumulative += count
-        print(f"{pop:10d} | {count:5d} | {cumulative:10d}")
-
-    # Suggest bracket boundaries
-    print("\n=== Suggested Bracket Boundaries ===")
-    print("Goal: Create 6 brackets with roughly 50 tokens each\n")
-
-    # Find top 50 threshold
-    if len(popularities) >= 50:
-        bracket1_threshold = popularities[49]
-        print(f"Bracket 1 (Top 50): popularity >= {bracket1_threshold}")
-
-        # Distribute remaining tokens into 5 brackets
-        remaining = popularities[50:]
-        if remaining:
-            chunk_size = len(remaining) // 5
-            bracket2_threshold = remaining[min(chunk_size, len(remaining)-1)]
-            bracket3_threshold = remaining[min(chunk_size*2, len(remaining)-1)]
-            bracket4_threshold = remaining[min(chunk_size*3, len(remaining)-1)]
-            bracket5_threshold = remaining[min(chunk_size*4, len(remaining)-1)]
-
-            print(f"Bracket 2: popularity >= {bracket2_threshold} (and < {bracket1_threshold})")
-            print(f"Bracket 3: popularity >= {bracket3_threshold} (and < {bracket2_threshold})")
-            print(f"Bracket 4: popularity >= {bracket4_threshold} (and < {bracket3_threshold})")
-            print(f"Bracket 5: popularity >= {bracket5_threshold} (and < {bracket4_threshold})")
-            print(f"Bracket 6: popularity < {bracket5_threshold}")
-
-            # Count tokens per bracket
-            print("\nTokens per bracket:")
-            print(f"  Bracket 1: {sum(1 for p in popularities if p >= bracket1_threshold)} tokens")
-            print(f"  Bracket 2: {sum(1 for p in popularities if bracket2_threshold <= p < bracket1_threshold)} tokens")
-            print(f"  Bracket 3: {sum(1 for p in popularities if bracket3_threshold <= p < bracket2_threshold)} tokens")
-            print(f"  Bracket 4: {sum(1 for p in popularities if bracket4_threshold <= p < bracket3_threshold)} tokens")
-            print(f"  Bracket 5: {sum(1 for p in popularities if bracket5_threshold <= p < bracket4_threshold)} tokens")
-            print(f"  Bracket 6: {sum(1 for p in popularities if p < bracket5_threshold)} tokens")
-
-    return stats
+    # Canonical order (name, then composite ID) for byte-stable output
+    return canonical_tokens(cleaned_tokens)
+
+def analyze_popularity_distribution(tokens: List[Dict], artifact_path: Optional[str] = None) -> Dict:
+    """Analyze the distribution of popularity scores in a single pass and
+    save the bracket boundaries to `artifact_path` (see token_analytics)."""
+    return token_analytics.analyze_popularity(tokens, artifact_path)
 
 def load_custom_tokens(custom_file: str = 'custom_tokens.json') -> List[Dict]:
     """Load custom tokens from JSON file. Gracefully handles missing or empty files."""
@@ -324,7 +311,7 @@ def load_custom_tokens(custom_file: str = 'custom_tokens.json') -> List[Dict]:
         print(f"Error loading custom tokens: {e}")
         return []
 
-def merge_custom_tokens(generated_tokens: List[Dict], custom_tokens: List[Dict]) -> List[Dict]:
+def merge_custom_tokens(generated_tokens: List[TokenRecord], custom_tokens: List[Dict]) -> List[TokenRecord]:
     """
     Merge custom tokens with generated tokens.
     Custom tokens are appended after generated tokens, so during deduplication
@@ -335,16 +322,10 @@ def merge_custom_tokens(generated_tokens: List[Dict], custom_tokens: List[Dict])
 
     print(f"Merging {len(custom_tokens)} custom tokens with {len(generated_tokens)} generated tokens")
 
-    # Convert custom tokens to match the format of generated tokens
-    # Custom tokens don't have reverse_related or artwork, so we add empty defaults
-    for token in custom_tokens:
-        if 'reverse_related' not in token:
-            token['reverse_related'] = []
-        if 'artwork' not in token:
-            token['artwork'] = []
-
+    # Convert custom tokens to records like the generated ones; missing
+    # reverse_related / artwork become empty
     # Append custom tokens after generated tokens (ensures they override during dedup)
-    merged = generated_tokens + custom_tokens
+    merged = generated_tokens + [TokenRecord.from_dict(token) for token in custom_tokens]
     print(f"Merged list contains {len(merged)} total tokens (before deduplication)")
 
     return merged
@@ -353,42 +334,86 @@ def save_json_database(tokens: List[Dict], output_path: str):
     """Save tokens to JSON file."""
     print(f"\nSaving {len(tokens)} tokens to {output_path}")
 
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(tokens, f, indent=2, ensure_ascii=False)
+    write_database(tokens, output_path)
 
     print(f"Successfully saved TokenDatabase.json with {len(tokens)} tokens")
 
-def main():
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command-line options."""
+    parser = argparse.ArgumentParser(
+        description="Build token_database.json from Cockatrice tokens.xml.")
+    parser.add_argument(
+        '--stream', action='store_true',
+        help="Parse tokens.xml incrementally while downloading, with a local "
+             "cache and conditional GET (ETag / Last-Modified)")
+    parser.add_argument(
+        '--skip-analytics', action='store_true',
+        help="Skip popularity analytics and token_popularity.json (faster rebuilds)")
+    parser.add_argument(
+        '--profile', metavar='STAGE',
+        help="Run one stage (e.g. parse, dedup, serialize) under cProfile; "
+             "stats are saved to the cache directory")
+    parser.add_argument(
+        '--trace-memory', action='store_true',
+        help="Record tracemalloc peak memory per stage in the run report "
+             "(slows the build)")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
     """Main execution function."""
+    args = parse_args(argv)
+
     # URL for the Magic Token XML data
-    xml_url = "https://raw.githubusercontent.com/Cockatrice/Magic-Token/master/tokens.xml"
+    xml_url = XML_URL
 
     # Output path for the JSON database
     output_path = "../../assets/token_database.json"
 
+    start_run(os.path.basename(__file__), trace_memory=args.trace_memory,
+              profile_stage=args.profile, profile_dir=CACHE_DIR)
+    status = 'error'
     try:
-        # Fetch XML data
-        xml_content = fetch_xml_data(xml_url)
-
-        # Parse tokens from XML
-        raw_tokens = parse_token_xml(xml_content)
+        if args.stream:
+            # Fetch (conditionally) and parse tokens as the XML arrives
+            with stage('fetch_parse') as st:
+                raw_tokens = stream_token_xml(xml_url)
+                st.records = len(raw_tokens)
+        else:
+            # Fetch XML data
+            with stage('download') as st:
+                xml_content = fetch_xml_data(xml_url)
+                st.bytes = len(xml_content.encode('utf-8'))
+
+            # Parse tokens from XML
+            with stage('parse') as st:
+                raw_tokens = parse_token_xml(xml_content)
+                st.records = len(raw_tokens)
         print(f"Found {len(raw_tokens)} raw token entries")
 
-        # Load custom tokens
-        custom_tokens = load_custom_tokens('custom_tokens.json')
-
-        # Merge custom tokens with generated tokens (before cleaning)
-        merged_tokens = merge_custom_tokens(raw_tokens, custom_tokens)
+        # Load custom tokens and merge them with generated tokens (before cleaning)
+        with stage('merge_custom') as st:
+            custom_tokens = load_custom_tokens('custom_tokens.json')
+            merged_tokens = merge_custom_tokens(raw_tokens, custom_tokens)
+            st.records = len(custom_tokens)
 
         # Clean and normalize the data (this includes deduplication)
-        cleaned_tokens = clean_token_data(merged_tokens)
+        with stage('dedup') as st:
+            cleaned_tokens = clean_token_data(merged_tokens)
+            st.records = len(merged_tokens)
         print(f"Processed {len(cleaned_tokens)} unique tokens after cleaning and deduplication")
 
         # Analyze popularity distribution
-        stats = analyze_popularity_distribution(cleaned_tokens)
+        if not args.skip_analytics:
+            with stage('analyze') as st:
+                analyze_popularity_distribution(cleaned_tokens, POPULARITY_PATH)
+                st.records = len(cleaned_tokens)
 
         # Save to JSON file
-        save_json_database(cleaned_tokens, output_path)
+        with stage('serialize') as st:
+            save_json_database(cleaned_tokens, output_path)
+            st.records = len(cleaned_tokens)
+            st.bytes = os.path.getsize(output_path)
+        status = 'ok'
 
         # Print summary statistics
         print("\n=== Token Database Summary ===")
@@ -416,6 +441,8 @@ def main():
         import traceback
         traceback.print_exc()
         raise
+    finally:
+        finish_run(REPORT_PATH, status)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Tests for the pipelined MTGJSON download and the build preflight against a
+local HTTP stand-in.
+
+Run from docs/housekeeping:
+    python3 -m unittest test_process_tokens_mtgjson
+"""
+
+import contextlib
+import hashlib
+import io
+import json
+import lzma
+import os
+import shutil
+import tempfile
+import unittest
+from typing import Dict, List
+from unittest import mock
+
+import process_tokens_mtgjson as mtgjson
+from testing_http import serve
+
+
+def _all_printings(sets: int, tag: str) -> Dict:
+    data = {}
+    for i in range(sets):
+        code = f'S{i:03d}'
+        data[code] = {'name': f'Set {i}', 'cards': [{'name': 'Filler', 'text': 'x' * 200}], 'tokens': [{
+            'name': f'{tag} Soldier {i}',
+            'layout': 'token',
+            'type': 'Token Creature — Soldier',
+            'power': '1', 'toughness': '1',
+            'colors': ['W'],
+            'text': 'Vigilance',
+            'identifiers': {'scryfallId': f'0000{i:04d}-0000-0000-0000-000000000000'},
+            'relatedCards': {'reverseRelated': [f'Card {i}']},
+        }]}
+    return {'meta': {'version': tag}, 'data': data}
+
+
+def _records(all_printings: Dict) -> List[Dict]:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return [t.to_dict() for t in mtgjson.extract_tokens(all_printings)]
+
+
+class PipelinedDownloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='test_pipeline_')
+        self.cache = os.path.join(self.tmp, 'AllPrintings.json')
+        self.new = _all_printings(60, 'new')
+        self.archive = lzma.compress(json.dumps(self.new).encode('utf-8'))
+        self.files = {
+            '/AllPrintings.json.xz': self.archive,
+            '/AllPrintings.json.xz.sha256': hashlib.sha256(self.archive).hexdigest().encode('ascii'),
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def write_old_cache(self) -> Dict:
+        old = _all_printings(3, 'old')
+        with open(self.cache, 'w', encoding='utf-8') as f:
+            json.dump(old, f)
+        return old
+
+    def run_pipeline(self, **serve_args) -> List[Dict]:
+        with serve(self.files, **serve_args) as (base, _):
+            with contextlib.redirect_stdout(io.StringIO()):
+                tokens = mtgjson.download_and_extract_pipelined(
+                    f'{base}/AllPrintings.json.xz', self.cache)
+        return [t.to_dict() for t in tokens]
+
+    def test_download_extracts_and_caches(self):
+        self.write_old_cache()
+        self.assertEqual(self.run_pipeline(), _records(self.new))
+        with open(self.cache, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f), self.new)
+        self.assertFalse(os.path.exists(self.cache + '.part'))
+
+    def test_dropped_connection_falls_back_to_cache(self):
+        old = self.write_old_cache()
+        tokens = self.run_pipeline(drops={'/AllPrintings.json.xz': 1})
+        self.assertEqual(tokens, _records(old))
+        with open(self.cache, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f), old)
+        self.assertFalse(os.path.exists(self.cache + '.part'))
+
+    def test_sha256_mismatch_keeps_cache(self):
+        old = self.write_old_cache()
+        self.files['/AllPrintings.json.xz.sha256'] = b'0' * 64
+        self.assertEqual(self.run_pipeline(), _records(old))
+        with open(self.cache, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f), old)
+
+    def test_failure_without_cache_raises(self):
+        with self.assertRaises(RuntimeError):
+            self.run_pipeline(drops={'/AllPrintings.json.xz': 1})
+
+
+class BuildStampTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='test_build_stamp_')
+        self.cache = os.path.join(self.tmp, 'AllPrintings.json')
+        with open(self.cache, 'w', encoding='utf-8') as f:
+            json.dump(_all_printings(3, 'old'), f)
+        with open(self.cache + '.version', 'w', encoding='utf-8') as f:
+            f.write('old\n')
+        self.output = os.path.join(self.tmp, 'token_database.json')
+        self.manifest = os.path.join(self.tmp, 'token_manifest.json')
+        self.files = {'/Meta.json': json.dumps({'data': {'date': '2026-10-01', 'version': 'new'}}).encode('utf-8')}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def serve_archive(self):
+        archive = lzma.compress(json.dumps(_all_printings(3, 'new')).encode('utf-8'))
+        self.files['/AllPrintings.json.xz'] = archive
+        self.files['/AllPrintings.json.xz.sha256'] = hashlib.sha256(archive).hexdigest().encode('ascii')
+
+    def build(self, *flags: str) -> List[str]:
+        """Run the build against the stand-in; returns the paths it requested."""
+        with serve(self.files) as (base, server):
+            with mock.patch.multiple(
+                    mtgjson, MTGJSON_URL=f'{base}/AllPrintings.json.xz', MTGJSON_API=base,
+                    CACHE_DIR=self.tmp, CACHE_FILE=self.cache,
+                    SNAPSHOT_DIR=os.path.join(self.tmp, 'stages'),
+                    OUTPUT_PATH=self.output, MANIFEST_PATH=self.manifest,
+                    REPORT_PATH=os.path.join(self.tmp, 'token_build_report.json')):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    mtgjson.main(['--skip-analytics', '--skip-reverse-index',
+                                  '--skip-facets', *flags])
+        return [path for path, _ in server.requests]
+
+    def built_names(self) -> List[str]:
+        with open(self.output, 'r', encoding='utf-8') as f:
+            return sorted(t['name'] for t in json.load(f) if 'Soldier' in t['name'])
+
+    def stamp(self) -> Dict:
+        with open(self.manifest, 'r', encoding='utf-8') as f:
+            return json.load(f).get('source')
+
+    def test_fallback_is_not_stamped(self):
+        # Meta.json announces "new" but the archive is missing: the build
+        # falls back to the old cache and must not claim to be "new".
+        self.build('--no-snapshots')
+        self.assertEqual(self.built_names(), [f'old Soldier {i}' for i in range(3)])
+        self.assertIsNone(self.stamp())
+
+        self.serve_archive()
+        self.assertIn('/AllPrintings.json.xz', self.build('--no-snapshots'))
+        self.assertEqual(self.built_names(), [f'new Soldier {i}' for i in range(3)])
+        self.assertEqual(self.stamp()['mtgjson_version'], 'new')
+
+        self.assertEqual(self.build('--no-snapshots'), ['/Meta.json'])
+
+    def test_fallback_is_not_snapshotted(self):
+        # The old tokens must not be saved under the "new" extract key,
+        # or the next run would reuse them even with --force.
+        self.build()
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, 'stages')))
+
+        self.serve_archive()
+        self.build('--force')
+        self.assertEqual(self.built_names(), [f'new Soldier {i}' for i in range(3)])
+        self.assertEqual(self.stamp()['mtgjson_version'], 'new')
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp, 'stages'))), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming Cockatrice tokens.xml fetch against a local HTTP
+stand-in.
+
+Run from docs/housekeeping:
+    python3 -m unittest test_process_tokens_with_popularity
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from typing import List
+
+import process_tokens_with_popularity as cockatrice
+from testing_http import serve
+
+
+def _tokens_xml(names: List[str]) -> bytes:
+    cards = ''.join(
+        f'<card><name>{name}</name><token>1</token>'
+        f'<prop><type>Token Creature — Soldier</type><pt>1/1</pt><colors>W</colors></prop>'
+        f'<text>{"Vigilance " * 40}</text>'
+        f'<set picURL="https://example.invalid/{name}.jpg">TST</set></card>'
+        for name in names)
+    return f'<?xml version="1.0"?><cockatrice_carddatabase><cards>{cards}</cards></cockatrice_carddatabase>'.encode('utf-8')
+
+
+class StreamTokenXmlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='test_cockatrice_')
+        self._paths = (cockatrice.CACHE_DIR, cockatrice.XML_CACHE_FILE, cockatrice.XML_CACHE_HEADERS)
+        cockatrice.CACHE_DIR = self.tmp
+        cockatrice.XML_CACHE_FILE = os.path.join(self.tmp, 'tokens.xml')
+        cockatrice.XML_CACHE_HEADERS = cockatrice.XML_CACHE_FILE + '.headers.json'
+        self.new = _tokens_xml([f'New {i}' for i in range(400)])
+
+    def tearDown(self):
+        cockatrice.CACHE_DIR, cockatrice.XML_CACHE_FILE, cockatrice.XML_CACHE_HEADERS = self._paths
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def stream(self, **serve_args) -> List[str]:
+        with serve({'/tokens.xml': self.new}, **serve_args) as (base, _):
+            with contextlib.redirect_stdout(io.StringIO()):
+                tokens = cockatrice.stream_token_xml(f'{base}/tokens.xml')
+        return [t.name for t in tokens]
+
+    def test_download_replaces_cache(self):
+        self.assertEqual(self.stream(), [f'New {i}' for i in range(400)])
+        with open(cockatrice.XML_CACHE_FILE, 'rb') as f:
+            self.assertEqual(f.read(), self.new)
+
+    def test_dropped_stream_falls_back_to_cache(self):
+        old = _tokens_xml(['Old 0', 'Old 1'])
+        with open(cockatrice.XML_CACHE_FILE, 'wb') as f:
+            f.write(old)
+        self.assertEqual(self.stream(drops={'/tokens.xml': 1}), ['Old 0', 'Old 1'])
+        with open(cockatrice.XML_CACHE_FILE, 'rb') as f:
+            self.assertEqual(f.read(), old)
+        self.assertFalse(os.path.exists(cockatrice.XML_CACHE_FILE + '.part'))
+
+    def test_dropped_stream_without_cache_raises(self):
+        with self.assertRaisesRegex(RuntimeError, 'no cache available'):
+            self.stream(drops={'/tokens.xml': 1})
+        self.assertFalse(os.path.exists(cockatrice.XML_CACHE_FILE))
+
+
+if __name__ == '__main__':
+    unittest.main()
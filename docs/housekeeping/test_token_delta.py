@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Round-trip tests for token_delta: a published delta applied to vN must
+give vN+1 byte for byte.
+
+Run from docs/housekeeping:
+    python3 -m unittest test_token_delta
+"""
+
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from typing import Dict, List
+
+import token_delta
+from token_io import dumps_database, write_database
+
+
+def _token(name: str, abilities: str = '', pt: str = '1/1', colors: str = 'W',
+           type_text: str = 'Token Creature — Soldier', popularity: int = 1) -> Dict:
+    return {
+        'name': name, 'abilities': abilities, 'pt': pt, 'colors': colors,
+        'type': type_text, 'popularity': popularity,
+        'artwork': [{'set': 'TST', 'url': f'https://example.invalid/{name}.jpg'}],
+        'reverse_related': [f'{name} Maker'],
+    }
+
+
+class DeltaRoundTripTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='test_token_delta_')
+        self.database = os.path.join(self.tmp, 'token_database.json')
+        self.history = os.path.join(self.tmp, 'history')
+        self.deltas = os.path.join(self.tmp, 'deltas')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def publish_and_patch(self, old_bytes: bytes, new_tokens: List[Dict]) -> Dict:
+        """Publish `old_bytes` as v1, build v2 from `new_tokens`, and check
+        that the written v1 -> v2 delta reproduces v2 exactly."""
+        with open(self.database, 'wb') as f:
+            f.write(old_bytes)
+        manifest = {'version': 1, 'sha256': hashlib.sha256(old_bytes).hexdigest()}
+        self.assertEqual(token_delta.archive_published(self.database, manifest, self.history), 1)
+
+        write_database(new_tokens, self.database)
+        with open(self.database, 'rb') as f:
+            new_bytes = f.read()
+        with contextlib.redirect_stdout(io.StringIO()):
+            entries = token_delta.write_deltas(self.database, 2, self.history, self.deltas, keep=1)
+        self.assertEqual([e['from_version'] for e in entries], [1])
+
+        with open(entries[0]['path'], 'r', encoding='utf-8') as f:
+            delta = json.load(f)
+        self.assertEqual(delta['from_sha256'], manifest['sha256'])
+        self.assertEqual(delta['to_sha256'], hashlib.sha256(new_bytes).hexdigest())
+        rebuilt = dumps_database(token_delta.apply_delta(json.loads(old_bytes), delta))
+        self.assertEqual(rebuilt.encode('utf-8'), new_bytes)
+        return delta
+
+    def test_added_and_changed(self):
+        old = [_token('Angel', 'Flying', '4/4'), _token('Soldier'), _token('Spirit', 'Flying')]
+        new = [_token('Angel', 'Flying', '4/4', popularity=9), _token('Soldier'),
+               _token('Spirit', 'Flying'), _token('Zombie', colors='B')]
+        delta = self.publish_and_patch(dumps_database(old).encode('utf-8'), new)
+        self.assertEqual(len(delta['added']), 1)
+        self.assertEqual(len(delta['changed']), 1)
+        self.assertEqual(delta['removed'], [])
+
+    def test_removed(self):
+        old = [_token('Angel', 'Flying', '4/4'), _token('Goblin', colors='R'),
+               _token('Soldier'), _token('Treasure', pt='', colors='', type_text='Token Artifact')]
+        new = [_token('Angel', 'Flying', '4/4'), _token('Soldier')]
+        delta = self.publish_and_patch(dumps_database(old).encode('utf-8'), new)
+        self.assertEqual(len(delta['removed']), 2)
+        self.assertEqual(delta['added'], {})
+
+    def test_reordered_fields(self):
+        # v1 predates canonical output: tokens and fields in another order.
+        old = [_token('Angel', 'Flying', '4/4'), _token('Soldier')]
+        old[1]['artwork'].insert(0, {'set': 'ZZZ', 'url': 'https://example.invalid/z.jpg'})
+        reordered = [dict(reversed(list(t.items()))) for t in reversed(old)]
+        old_bytes = json.dumps(reordered, indent=2, ensure_ascii=False).encode('utf-8')
+        new = old + [_token('Zombie', colors='B')]
+        self.publish_and_patch(old_bytes, new)
+
+    def test_unchanged(self):
+        tokens = [_token('Angel', 'Flying', '4/4'), _token('Soldier')]
+        delta = self.publish_and_patch(dumps_database(tokens).encode('utf-8'), tokens)
+        self.assertEqual(delta['ops'], [['=', 2]])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            token_delta.apply_delta([], {'format': token_delta.DELTA_FORMAT + 1, 'ops': []})
+
+
+if __name__ == '__main__':
+    unittest.main()
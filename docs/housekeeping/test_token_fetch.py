@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for token_fetch against a local HTTP server that drops connections.
+
+Run from docs/housekeeping:
+    python3 -m unittest test_token_fetch
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import token_fetch
+from testing_http import serve
+
+
+class FetchResumableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='test_token_fetch_')
+        self.part = os.path.join(self.tmp, 'file.part')
+        self.body = os.urandom(3 * token_fetch.DOWNLOAD_CHUNK_SIZE + 123)
+        self.sha = hashlib.sha256(self.body).hexdigest()
+        self._backoff = token_fetch.RETRY_BACKOFF
+        token_fetch.RETRY_BACKOFF = 0
+
+    def tearDown(self):
+        token_fetch.RETRY_BACKOFF = self._backoff
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_resumes_with_range_after_drop(self):
+        with serve({'/f': self.body}, drops={'/f': 1}) as (base, server):
+            result = token_fetch.fetch_resumable(f'{base}/f', self.part, expected_sha256=self.sha)
+        with open(self.part, 'rb') as f:
+            self.assertEqual(f.read(), self.body)
+        self.assertEqual(result['sha256'], self.sha)
+        self.assertEqual(result['attempts'], 2)
+        (_, first), (_, retry) = server.requests
+        self.assertNotIn('Range', first)
+        self.assertEqual(retry['Range'], f'bytes={len(self.body) // 2}-')
+        self.assertEqual(retry['If-Range'], result['etag'])
+
+    def test_restarts_without_validator_after_drop(self):
+        with serve({'/f': self.body}, etag=False, drops={'/f': 1}) as (base, server):
+            result = token_fetch.fetch_resumable(f'{base}/f', self.part, expected_sha256=self.sha)
+        with open(self.part, 'rb') as f:
+            self.assertEqual(f.read(), self.body)
+        self.assertEqual(result['size'], len(self.body))
+        self.assertEqual(len(server.requests), 2)
+        for _, headers in server.requests:
+            self.assertNotIn('Range', headers)
+            self.assertNotIn('If-Range', headers)
+
+    def test_sha256_mismatch_discards_partial(self):
+        with serve({'/f': self.body}) as (base, _):
+            with self.assertRaises(ValueError):
+                token_fetch.fetch_resumable(f'{base}/f', self.part, expected_sha256='0' * 64)
+        self.assertFalse(os.path.exists(self.part))
+
+    def test_not_modified(self):
+        with serve({'/f': self.body}) as (base, _):
+            result = token_fetch.fetch_resumable(f'{base}/f', self.part)
+            cache = os.path.join(self.tmp, 'cache')
+            os.replace(self.part, cache)
+            headers = token_fetch.conditional_headers(cache, {'etag': result['etag']})
+            with self.assertRaises(token_fetch.NotModified):
+                token_fetch.fetch_resumable(f'{base}/f', self.part, headers=headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Tests for the canonical database form in token_io.
+
+Run from docs/housekeeping:
+    python3 -m unittest test_token_io
+"""
+
+import json
+import unittest
+
+from token_io import TOKEN_FIELDS, canonical_tokens, dumps_database
+
+
+class CanonicalTokensTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tokens = [{
+            'reverse_related': ['Zombie Maker', 'Angel Maker'],
+            'artwork': [{'set': 'ZZZ', 'url': 'https://example.invalid/z.jpg'},
+                        {'set': 'AAA', 'url': 'https://example.invalid/a.jpg'}],
+            'type': 'Token Creature — Soldier', 'name': 'Soldier', 'pt': '1/1',
+            'colors': 'W', 'abilities': '', 'popularity': 2,
+        }, {
+            'name': 'Angel', 'abilities': 'Flying', 'pt': '4/4', 'colors': 'W',
+            'type': 'Token Creature — Angel', 'popularity': 1, 'artwork': [], 'reverse_related': [],
+        }]
+
+    def test_order(self):
+        angel, soldier = canonical_tokens(self.tokens)
+        self.assertEqual(angel['name'], 'Angel')
+        self.assertEqual(tuple(soldier), tuple(f for f in TOKEN_FIELDS if f in soldier))
+        self.assertEqual(soldier['reverse_related'], ['Angel Maker', 'Zombie Maker'])
+
+    def test_artwork_keeps_first_seen_order(self):
+        # The app shows the first artwork entry as the default art.
+        _, soldier = canonical_tokens(self.tokens)
+        self.assertEqual([a['set'] for a in soldier['artwork']], ['ZZZ', 'AAA'])
+
+    def test_dumps_is_independent_of_input_order(self):
+        reordered = [dict(reversed(list(t.items()))) for t in reversed(self.tokens)]
+        self.assertEqual(dumps_database(self.tokens), dumps_database(reordered))
+        self.assertEqual(json.loads(dumps_database(self.tokens)), canonical_tokens(self.tokens))
+
+
+if __name__ == '__main__':
+    unittest.main()
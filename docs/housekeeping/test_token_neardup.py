@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Tests for applying a reviewed near-duplicate allowlist.
+
+Run from docs/housekeeping:
+    python3 -m unittest test_token_neardup
+"""
+
+import contextlib
+import io
+import unittest
+from typing import Dict, List
+
+import token_neardup
+from token_normalize import token_id
+
+
+def _token(abilities: str, popularity: int, sets: List[str]) -> Dict:
+    return {
+        'name': 'Soldier', 'abilities': abilities, 'pt': '1/1', 'colors': 'W',
+        'type': 'Token Creature — Soldier', 'popularity': popularity,
+        'artwork': [{'set': s, 'url': f'https://example.invalid/{s}.jpg'} for s in sets],
+        'reverse_related': [f'{s} Card' for s in sets],
+    }
+
+
+class ApplyMergesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.keep = _token('Vigilance', 2, ['AAA', 'BBB'])
+        self.other = _token('Vigilance.', 1, ['CCC'])
+        self.tokens = [self.keep, self.other]
+
+    def apply(self, allowlist: List[Dict]) -> List[Dict]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return token_neardup.apply_merges(self.tokens, allowlist)
+
+    def test_merge(self):
+        merged = self.apply([{'keep': token_id(self.keep), 'merge': [token_id(self.other)]}])
+        self.assertEqual(len(merged), 1)
+        self.assertEqual([a['set'] for a in merged[0]['artwork']], ['AAA', 'BBB', 'CCC'])
+        self.assertEqual(merged[0]['popularity'], 3)
+
+    def test_merge_into_itself_is_skipped(self):
+        merged = self.apply([{'keep': token_id(self.keep), 'merge': [token_id(self.keep)]}])
+        self.assertEqual(len(merged), 2)
+
+    def test_unknown_id_is_rejected(self):
+        with self.assertRaisesRegex(ValueError, 'unknown'):
+            self.apply([{'keep': token_id(self.keep), 'merge': ['Soldier|1/1|W|Token Creature|Gone']}])
+
+    def test_merged_twice_is_rejected(self):
+        entry = {'keep': token_id(self.keep), 'merge': [token_id(self.other)]}
+        with self.assertRaisesRegex(ValueError, 'twice'):
+            self.apply([entry, entry])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Local HTTP stand-in shared by the download tests.
+
+serve() runs a threaded server on an ephemeral localhost port that serves
+a dict of URL path -> body. It sends an ETag (unless etag=False), answers
+If-None-Match with 304 and Range + If-Range with 206, and can cut a
+response off halfway to simulate a dropped connection.
+"""
+
+import hashlib
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, Optional, Tuple
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves server.files; honours If-None-Match and Range + If-Range
+    against the ETag, and cuts the body off halfway for the first
+    server.drops[path] requests."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+        body = server.files.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        start = 0
+        etag = server.etag and f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if etag and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        if self.headers.get('Range') and etag and self.headers.get('If-Range') == etag:
+            start = int(self.headers['Range'].split('=', 1)[1].split('-', 1)[0])
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(body) - 1}/{len(body)}')
+        else:
+            self.send_response(200)
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+
+        payload = body[start:]
+        if server.drops.get(self.path):
+            server.drops[self.path] -= 1
+            self.wfile.write(payload[:len(payload) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def serve(files: Dict[str, bytes], etag: bool = True,
+          drops: Optional[Dict[str, int]] = None) -> Iterator[Tuple[str, ThreadingHTTPServer]]:
+    """Serve `files` (URL path -> body) on localhost; yields (base URL, server).
+    server.requests records (path, headers) of every request."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.files = files
+    server.etag = etag
+    server.drops = dict(drops or {})
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}', server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Popularity analytics for the token database build scripts.
+
+One pass over the tokens builds a histogram of popularity values (NumPy's
+bincount when NumPy is installed, collections.Counter otherwise).
+Everything else is derived from the histogram's cumulative counts, with
+work proportional to the number of distinct popularity values: min, max,
+mean, percentiles (linear interpolation on the ascending values, as
+numpy.percentile), and the bracket thresholds and counts. Nothing is
+re-sorted or re-scanned per statistic.
+
+Brackets follow the original tuning rule: bracket 1 holds the top 50
+tokens; the remaining tokens are split into 5 brackets of roughly equal
+size. Tokens tied on popularity always share a bracket, so sizes are
+approximate, and cuts that fall inside one tie collapse into a single
+bracket (there may be fewer than 6).
+
+The result is written as a small JSON artifact next to the database
+(assets/token_popularity.json), so the app can use bracket boundaries
+without sorting anything:
+
+    {
+      "format": 1,
+      "total_tokens": 937, "min": 0, "max": 412, "mean": 11.73,
+      "percentiles": {"p10": 0, "p25": 1, ..., "p99": 187.2},
+      "histogram": [[0, 301], [1, 122], ...],        # [popularity, count], ascending
+      "brackets": [
+        {"bracket": 1, "min_popularity": 52, "max_popularity": null, "count": 50},
+        {"bracket": 2, "min_popularity": 18, "max_popularity": 51, "count": 178},
+        ...
+      ]
+    }
+
+max_popularity is inclusive; null means unbounded.
+"""
+
+import heapq
+import json
+import os
+from bisect import bisect_right
+from collections import Counter
+from itertools import accumulate
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional; the Counter path gives identical results
+    np = None
+
+ANALYTICS_FORMAT = 1
+PERCENTILES = (10, 25, 50, 75, 90, 95, 99)
+TOP_BRACKET_SIZE = 50
+TAIL_BRACKETS = 5
+
+
+def popularity_histogram(tokens: Sequence[Dict], use_numpy: Optional[bool] = None) -> List[Tuple[int, int]]:
+    """[(popularity, count), ...] ascending, over tokens with at least one count."""
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy and tokens:
+        values = np.fromiter((t['popularity'] for t in tokens), dtype=np.int64, count=len(tokens))
+        counts = np.bincount(values)
+        present = np.flatnonzero(counts)
+        return list(zip(present.tolist(), counts[present].tolist()))
+    return sorted(Counter(t['popularity'] for t in tokens).items())
+
+
+class _Ranks:
+    """Value at a given rank of the sorted popularity list, via the histogram."""
+
+    def __init__(self, histogram: List[Tuple[int, int]]):
+        self.values = [v for v, _ in histogram]
+        self.cumulative = list(accumulate(c for _, c in histogram))
+        self.total = self.cumulative[-1] if self.cumulative else 0
+
+    def ascending(self, rank: int) -> int:
+        return self.values[bisect_right(self.cumulative, rank)]
+
+    def descending(self, rank: int) -> int:
+        return self.ascending(self.total - 1 - rank)
+
+    def count_at_least(self, value: int) -> int:
+        below = bisect_right(self.values, value - 1)
+        return self.total - (self.cumulative[below - 1] if below else 0)
+
+    def percentile(self, p: float) -> float:
+        k = (self.total - 1) * p / 100
+        f = int(k)
+        lo = self.ascending(f)
+        hi = self.ascending(min(f + 1, self.total - 1))
+        return lo + (hi - lo) * (k - f)
+
+
+def _brackets(ranks: _Ranks) -> List[Dict]:
+    """Bracket thresholds (descending) and their sizes."""
+    if ranks.total < TOP_BRACKET_SIZE:
+        return []
+    thresholds = [ranks.descending(TOP_BRACKET_SIZE - 1)]
+    remaining = ranks.total - TOP_BRACKET_SIZE
+    if remaining:
+        chunk = remaining // TAIL_BRACKETS
+        for i in range(1, TAIL_BRACKETS):
+            thresholds.append(ranks.descending(TOP_BRACKET_SIZE + min(chunk * i, remaining - 1)))
+
+    brackets = []
+    upper = None
+    counted = 0
+    for threshold in thresholds:
+        if threshold == upper:
+            continue  # a tie spans the cut: the bracket would be empty
+        at_least = ranks.count_at_least(threshold)
+        brackets.append({
+            'bracket': len(brackets) + 1,
+            'min_popularity': threshold,
+            'max_popularity': None if upper is None else upper - 1,
+            'count': at_least - counted,
+        })
+        upper, counted = threshold, at_least
+    if counted < ranks.total:
+        brackets.append({
+            'bracket': len(brackets) + 1,
+            'min_popularity': ranks.values[0],
+            'max_popularity': upper - 1,
+            'count': ranks.total - counted,
+        })
+    return brackets
+
+
+def popularity_analytics(tokens: Sequence[Dict], use_numpy: Optional[bool] = None) -> Dict:
+    """Summary statistics, histogram and brackets for the tokens' popularity."""
+    histogram = popularity_histogram(tokens, use_numpy)
+    ranks = _Ranks(histogram)
+    stats = {'format': ANALYTICS_FORMAT, 'total_tokens': ranks.total}
+    if not ranks.total:
+        stats.update({'min': 0, 'max': 0, 'mean': 0, 'percentiles': {}, 'histogram': [], 'brackets': []})
+        return stats
+    stats.update({
+        'min': ranks.values[0],
+        'max': ranks.values[-1],
+        'mean': round(sum(v * c for v, c in histogram) / ranks.total, 4),
+        'percentiles': {f'p{p}': round(ranks.percentile(p), 4) for p in PERCENTILES},
+        'histogram': [list(pair) for pair in histogram],
+        'brackets': _brackets(ranks),
+    })
+    return stats
+
+
+def print_analytics(stats: Dict, tokens: Sequence[Dict], top: int = 20) -> None:
+    """Human-readable report of popularity_analytics() output."""
+    print("\n=== Popularity Distribution Analysis ===")
+    if not stats['total_tokens']:
+        print("No tokens to analyze")
+        return
+    print(f"Total tokens: {stats['total_tokens']}")
+    print(f"Min popularity: {stats['min']}")
+    print(f"Max popularity: {stats['max']}")
+    print(f"Mean popularity: {stats['mean']:.2f}")
+    print(f"Median popularity: {stats['percentiles']['p50']:g}")
+    print("Percentiles: " + ", ".join(f"{k} {v:g}" for k, v in stats['percentiles'].items()))
+
+    print(f"\nTop {top} most popular tokens:")
+    for i, t in enumerate(heapq.nsmallest(top, tokens, key=lambda x: (-x['popularity'], x['name'])), 1):
+        colors = t['colors'] if t['colors'] else 'Colorless'
+        print(f"  {i:2d}. {t['name']:30s} {t['pt']:8s} [{colors:5s}] - Pop: {t['popularity']}")
+
+    if stats['brackets']:
+        print("\nBrackets:")
+        for b in stats['brackets']:
+            upper = 'max' if b['max_popularity'] is None else b['max_popularity']
+            print(f"  Bracket {b['bracket']}: popularity {b['min_popularity']}..{upper} "
+                  f"({b['count']} tokens)")
+
+
+def analyze_popularity(tokens: Sequence[Dict], artifact_path: Optional[str] = None) -> Dict:
+    """Compute and print popularity analytics; write them to `artifact_path` if given."""
+    stats = popularity_analytics(tokens)
+    print_analytics(stats, tokens)
+    if artifact_path:
+        artifact_path = os.path.normpath(artifact_path)
+        os.makedirs(os.path.dirname(artifact_path), exist_ok=True)
+        with open(artifact_path, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, separators=(',', ':'))
+            f.write('\n')
+        print(f"Saved popularity analytics to {artifact_path}")
+    return stats
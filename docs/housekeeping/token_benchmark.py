@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Synthetic-scale benchmarks for the token database build scripts.
+
+Generates deterministic AllPrintings-shaped and tokens.xml-shaped inputs
+(no network, no 70MB archive) and times each pipeline stage at multiples
+of today's data size, recording wall time, peak traced memory and GC
+collections. Results are written as JSON so runs can be compared.
+
+Usage:
+    python3 docs/housekeeping/token_benchmark.py
+    python3 docs/housekeeping/token_benchmark.py --scales 1,10 --output bench.json
+    python3 docs/housekeeping/token_benchmark.py --baseline bench.json
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+import process_tokens_mtgjson as mtgjson
+import process_tokens_with_popularity as cockatrice
+import token_facets
+import token_io
+import token_ndjson
+import token_neardup
+import token_sqlite
+
+# Roughly today's AllPrintings: ~800 sets averaging ~5 token printings each,
+# most of them reprints of a ~950-token vocabulary.
+BASE_SETS = 800
+BASE_TOKENS_PER_SET = 5
+DEFAULT_REPRINT_RATIO = 0.75
+DEFAULT_FANOUT = 3
+DEFAULT_SEED = 1
+# Share of tokens given a reworded copy for the near-duplicate stage.
+NEAR_DUPLICATE_FRACTION = 0.1
+
+_CREATURE_TYPES = ['Goblin', 'Soldier', 'Zombie', 'Spirit', 'Elf Warrior', 'Saproling',
+                   'Dragon', 'Beast', 'Bird', 'Insect', 'Human Cleric', 'Construct']
+_NONCREATURE_TYPES = ['Artifact — Treasure', 'Artifact — Clue', 'Artifact — Food',
+                      'Enchantment — Aura', 'Emblem — Planeswalker']
+_ABILITIES = ['Flying', 'Haste', 'Trample', 'Vigilance', 'Lifelink', 'Deathtouch',
+              'Menace (This creature can\'t be blocked except by two or more creatures.)',
+              '{T}, Sacrifice this artifact: Add one mana of any color.',
+              'When this creature dies, draw a card.', '']
+
+
+class SyntheticSpec:
+    """Shape of one synthetic input."""
+
+    def __init__(self, sets: int, tokens_per_set: int = BASE_TOKENS_PER_SET,
+                 reprint_ratio: float = DEFAULT_REPRINT_RATIO, fanout: int = DEFAULT_FANOUT,
+                 seed: int = DEFAULT_SEED):
+        self.sets = sets
+        self.tokens_per_set = tokens_per_set
+        self.reprint_ratio = reprint_ratio
+        self.fanout = fanout
+        self.seed = seed
+
+    def to_dict(self) -> Dict:
+        return {
+            'sets': self.sets,
+            'tokens_per_set': self.tokens_per_set,
+            'reprint_ratio': self.reprint_ratio,
+            'fanout': self.fanout,
+            'seed': self.seed,
+        }
+
+
+def _random_definition(rng: random.Random, serial: int) -> Dict:
+    """One distinct token definition (shared by all of its printings)."""
+    if rng.random() < 0.8:
+        subtype = rng.choice(_CREATURE_TYPES)
+        return {
+            'name': f"{subtype.split()[-1]} {serial}",
+            'type': f"Token Creature — {subtype}",
+            'power': str(rng.randint(0, 6)),
+            'toughness': str(rng.randint(1, 6)),
+            'colors': rng.sample('WUBRG', rng.choice([0, 1, 1, 1, 2])),
+            'text': '\n'.join(rng.sample(_ABILITIES, rng.randint(0, 2))).strip(),
+        }
+    subtype = rng.choice(_NONCREATURE_TYPES)
+    layout_type = subtype if subtype.startswith('Emblem') else f"Token {subtype}"
+    return {
+        'name': f"{subtype.split()[-1]} {serial}",
+        'type': layout_type,
+        'power': '',
+        'toughness': '',
+        'colors': [],
+        'text': rng.choice(_ABILITIES),
+    }
+
+
+def _printings(spec: SyntheticSpec) -> List[Tuple[str, Dict, List[str], str]]:
+    """(set_code, definition, reverse_related, scryfall_id) for every printing."""
+    rng = random.Random(spec.seed)
+    definitions = []
+    printings = []
+    for s in range(spec.sets):
+        set_code = f"S{s:05d}"
+        for _ in range(spec.tokens_per_set):
+            if definitions and rng.random() < spec.reprint_ratio:
+                definition = rng.choice(definitions)
+            else:
+                definition = _random_definition(rng, len(definitions))
+                definitions.append(definition)
+            related = [f"Card {rng.randrange(spec.sets * 20)}"
+                       for _ in range(rng.randint(0, spec.fanout * 2))]
+            scryfall_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+            printings.append((set_code, definition, related, scryfall_id))
+    return printings
+
+
+def generate_all_printings(spec: SyntheticSpec) -> Dict:
+    """AllPrintings-shaped document with a small `cards` array per set."""
+    data = {}
+    for set_code, definition, related, scryfall_id in _printings(spec):
+        set_data = data.setdefault(set_code, {
+            'code': set_code,
+            'name': f"Synthetic {set_code}",
+            'cards': [{'name': f"{set_code} card {i}", 'layout': 'normal', 'text': 'Filler.'}
+                      for i in range(3)],
+            'tokens': [],
+        })
+        set_data['tokens'].append({
+            'name': definition['name'],
+            'layout': 'emblem' if definition['type'].startswith('Emblem') else 'token',
+            'type': definition['type'],
+            'power': definition['power'],
+            'toughness': definition['toughness'],
+            'colors': definition['colors'],
+            'text': definition['text'],
+            'identifiers': {'scryfallId': scryfall_id},
+            'relatedCards': {'reverseRelated': related},
+        })
+    return {'meta': {'date': '2000-01-01', 'version': 'synthetic'}, 'data': data}
+
+
+def generate_tokens_xml(spec: SyntheticSpec) -> str:
+    """Cockatrice tokens.xml-shaped document, one <card> per printing."""
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<cockatrice_carddatabase version="4"><cards>\n']
+    for set_code, definition, related, scryfall_id in _printings(spec):
+        pt = f"{definition['power']}/{definition['toughness']}" if definition['power'] else ''
+        url = mtgjson.build_scryfall_url(scryfall_id)
+        parts.append(
+            f"<card><name>{escape(definition['name'])}</name>"
+            f"<text>{escape(definition['text'])}</text>"
+            f"<prop><type>{escape(definition['type'])}</type><pt>{escape(pt)}</pt>"
+            f"<colors>{''.join(definition['colors'])}</colors></prop>"
+            f"<set picURL={quoteattr(url)}>{set_code}</set>"
+            + ''.join(f"<reverse-related>{escape(r)}</reverse-related>" for r in related)
+            + "<token>1</token></card>\n")
+    parts.append('</cards></cockatrice_carddatabase>\n')
+    return ''.join(parts)
+
+
+def plant_near_duplicates(tokens: List[Dict], rng: random.Random,
+                          fraction: float = NEAR_DUPLICATE_FRACTION) -> List[Dict]:
+    """`tokens` plus reworded copies of some of them: punctuation changes,
+    the token's name in place of "this creature", or a stray reminder
+    fragment (which short texts don't survive as near-duplicates)."""
+    planted = list(tokens)
+    for token in tokens:
+        text = token['abilities']
+        if not text or rng.random() >= fraction:
+            continue
+        kind = rng.randrange(3)
+        if kind == 1 and 'this creature' in text:
+            variant = text.replace('this creature', token['name'])
+        elif kind == 2:
+            variant = f"{text} (This"
+        else:
+            variant = text[:-1] if text.endswith('.') else text + '.'
+        planted.append({**token, 'abilities': variant})
+    return planted
+
+
+def measure(fn: Callable, *args, memory: bool = True) -> Tuple[object, Dict]:
+    """Run fn(*args) quietly; return its result and timing/memory/GC stats.
+
+    Wall time comes from an untraced run; peak memory from a second run
+    under tracemalloc, since tracing distorts timings.
+    """
+    gc.collect()
+    counts_before = gc.get_stats()
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        result = fn(*args)
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+    counts_after = gc.get_stats()
+    stats = {
+        'wall_s': round(wall, 6),
+        'cpu_s': round(cpu, 6),
+        'gc_collections': [
+            after['collections'] - before['collections']
+            for before, after in zip(counts_before, counts_after)
+        ],
+    }
+
+    if memory:
+        del result
+        gc.collect()
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = fn(*args)
+            stats['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 3)
+        finally:
+            tracemalloc.stop()
+    return result, stats
+
+
+def json_backends() -> List[str]:
+    """The JSON backends installed here, stdlib first."""
+    return ['json'] + (['orjson'] if token_io.orjson is not None else [])
+
+
+def measure_json_backends(document_path: str, tokens: List[Dict], stages: Dict,
+                          memory: bool) -> Dict[str, Optional[float]]:
+    """Time parsing the JSON file at `document_path` and serializing the
+    database of `tokens` with each installed backend (stages
+    parse_json_<backend> and dumps_database_<backend>); returns the orjson
+    speedups over the stdlib."""
+    previous = token_io.json_backend()
+    try:
+        for backend in json_backends():
+            token_io.set_json_backend(backend)
+            _, stages[f'parse_json_{backend}'] = measure(token_io.load_file, document_path, memory=memory)
+            _, stages[f'dumps_database_{backend}'] = measure(token_io.dumps_database, tokens,
+                                                             memory=memory)
+    finally:
+        token_io.set_json_backend(previous)
+
+    def speedup(stage: str) -> Optional[float]:
+        fast = stages.get(f'{stage}_orjson')
+        if not fast or not fast['wall_s']:
+            return None
+        return round(stages[f'{stage}_json']['wall_s'] / fast['wall_s'], 2)
+
+    return {'parse_speedup': speedup('parse_json'), 'serialize_speedup': speedup('dumps_database')}
+
+
+def run_scale(scale: int, spec: SyntheticSpec, memory: bool) -> Dict:
+    """Benchmark every stage on one synthetic input."""
+    print(f"\n=== {scale}x ({spec.sets} sets, {spec.sets * spec.tokens_per_set} printings) ===")
+    all_printings = generate_all_printings(spec)
+    tokens_xml = generate_tokens_xml(spec)
+    workdir = tempfile.mkdtemp(prefix='token_benchmark_')
+    db_path = os.path.join(workdir, 'token_database.json')
+    manifest_path = os.path.join(workdir, 'token_manifest.json')
+
+    stages = {}
+    try:
+        raw, stages['extract_tokens'] = measure(mtgjson.extract_tokens, all_printings, memory=memory)
+        cleaned, stages['clean_and_dedup'] = measure(mtgjson.clean_and_dedup, raw, memory=memory)
+        xml_raw, stages['parse_token_xml'] = measure(cockatrice.parse_token_xml, tokens_xml, memory=memory)
+        _, stages['clean_token_data'] = measure(cockatrice.clean_token_data, xml_raw, memory=memory)
+        planted = plant_near_duplicates(cleaned, random.Random(spec.seed))
+        near_duplicates, stages['near_duplicates'] = measure(
+            token_neardup.find_near_duplicates, planted, memory=memory)
+        _, stages['save_output'] = measure(mtgjson.save_output, cleaned, db_path, memory=memory)
+        document_path = os.path.join(workdir, 'AllPrintings.json')
+        with open(document_path, 'w', encoding='utf-8') as f:
+            json.dump(all_printings, f, ensure_ascii=False)
+        document_mb = os.path.getsize(document_path) / 1024 / 1024
+        json_speedups = measure_json_backends(document_path, cleaned, stages, memory)
+        _, stages['update_manifest'] = measure(mtgjson.update_manifest, db_path, manifest_path,
+                                               memory=memory)
+        sqlite_path = os.path.join(workdir, 'token_database.sqlite')
+        _, stages['write_sqlite'] = measure(token_sqlite.build_sqlite, cleaned, sqlite_path, '',
+                                            memory=memory)
+        queries = token_sqlite.benchmark_queries(sqlite_path, cleaned)
+        filters = token_facets.benchmark_filters(cleaned)
+        ndjson_path = os.path.join(workdir, 'token_database.ndjson')
+        ndjson, stages['dumps_ndjson'] = measure(token_ndjson.dumps_ndjson, cleaned, '', memory=memory)
+        with open(ndjson_path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(ndjson)
+        first_record = token_ndjson.benchmark_first_record(ndjson_path, db_path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    records = {
+        'extract_tokens': len(raw),
+        'clean_and_dedup': len(raw),
+        'parse_token_xml': len(xml_raw),
+        'clean_token_data': len(xml_raw),
+        'near_duplicates': len(planted),
+        'save_output': len(cleaned),
+        'update_manifest': len(cleaned),
+        'write_sqlite': len(cleaned),
+        'dumps_ndjson': len(cleaned),
+    }
+    for backend in json_backends():
+        records[f'parse_json_{backend}'] = len(raw)
+        records[f'dumps_database_{backend}'] = len(cleaned)
+    for name, stats in stages.items():
+        stats['records'] = records[name]
+        stats['records_per_s'] = round(records[name] / stats['wall_s'], 1) if stats['wall_s'] else None
+        peak = f"{stats['peak_mb']:8.1f}MB" if 'peak_mb' in stats else ''
+        print(f"  {name:22s} {stats['wall_s'] * 1000:10.1f}ms {peak} "
+              f"gc={stats['gc_collections']}")
+
+    merges = sum(len(g['merge']) for g in near_duplicates['groups'])
+    print(f"  near-duplicates: {merges} of {len(planted) - len(cleaned)} planted variants found "
+          f"({'numpy' if token_neardup.np is not None else 'pure Python'} MinHash)")
+    if json_speedups['parse_speedup'] is not None:
+        print(f"  orjson vs stdlib json: parse {json_speedups['parse_speedup']:.1f}x, "
+              f"serialize {json_speedups['serialize_speedup']:.1f}x faster "
+              f"({document_mb:.1f}MB document)")
+    else:
+        print("  orjson not installed; JSON backends timed with the stdlib only")
+    print("  SQLite queries (median) vs a linear scan:")
+    token_sqlite.print_benchmark(queries)
+    print("  Facet filters (median), bitmaps vs string matching:")
+    token_facets.print_benchmark(filters)
+    print("  NDJSON streaming (median):")
+    token_ndjson.print_benchmark(first_record)
+    return {
+        'scale': scale,
+        'spec': spec.to_dict(),
+        'unique_tokens': len(cleaned),
+        'near_duplicates': {
+            'planted': len(planted) - len(cleaned),
+            'found': merges,
+            'candidates': near_duplicates['candidates'],
+            'numpy': token_neardup.np is not None,
+        },
+        'json_backends': json_speedups,
+        'sqlite_queries': queries,
+        'facet_filters': filters,
+        'ndjson_first_record': first_record,
+        'stages': stages,
+    }
+
+
+def compare(results: Dict, baseline: Dict) -> None:
+    """Print per-stage wall-time and peak-memory ratios against a baseline."""
+    print("\n=== Comparison with baseline (current / baseline) ===")
+    prior = {r['scale']: r for r in baseline.get('runs', [])}
+    for run in results['runs']:
+        base = prior.get(run['scale'])
+        if not base:
+            continue
+        print(f"{run['scale']}x:")
+        for name, stats in run['stages'].items():
+            old = base['stages'].get(name)
+            if not old or not old.get('wall_s'):
+                continue
+            line = f"  {name:22s} time {stats['wall_s'] / old['wall_s']:5.2f}x"
+            if stats.get('peak_mb') and old.get('peak_mb'):
+                line += f"  memory {stats['peak_mb'] / old['peak_mb']:5.2f}x"
+            print(line)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Synthetic-scale token pipeline benchmarks.")
+    parser.add_argument('--scales', default='1,10,100',
+                        help="Comma-separated multiples of today's data size (default 1,10,100)")
+    parser.add_argument('--tokens-per-set', type=int, default=BASE_TOKENS_PER_SET)
+    parser.add_argument('--reprint-ratio', type=float, default=DEFAULT_REPRINT_RATIO)
+    parser.add_argument('--fanout', type=int, default=DEFAULT_FANOUT,
+                        help="Mean reverse-related cards per printing")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--no-memory', action='store_true',
+                        help="Skip the tracemalloc pass (faster, no peak memory)")
+    parser.add_argument('--output', help="Write results JSON to this path")
+    parser.add_argument('--baseline', help="Compare against a previous results JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    scales = [int(s) for s in args.scales.split(',') if s.strip()]
+
+    results = {
+        'generated': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'runs': [],
+    }
+    for scale in scales:
+        spec = SyntheticSpec(BASE_SETS * scale, args.tokens_per_set, args.reprint_ratio,
+                             args.fanout, args.seed)
+        results['runs'].append(run_scale(scale, spec, memory=not args.no_memory))
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            compare(results, json.load(f))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+        print(f"\nSaved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
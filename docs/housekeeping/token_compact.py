@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Compact "v2" encoding of token_database.json.
+
+v1 (the shipped format) is a pretty-printed array of token objects in which
+every artwork entry repeats the full Scryfall CDN URL and every token
+repeats its reverse-related card names. v2 is minified and interns the
+repeated strings:
+
+    {
+      "format": 2,
+      "fields": ["name", "abilities", "pt", "colors", "type", "popularity",
+                 "artwork", "reverse_related"],
+      "sets":  ["10E", "2XM", ...],          # artwork set codes
+      "cards": ["Adorned Pouncer", ...],     # reverse-related card names
+      "tokens": [
+        ["Adorned Pouncer", "Double strike", "4/4", "B", "Creature — ...", 1,
+         [[<set index>, "71dc8556-..."]], [<card index>, ...]],
+        ...
+      ]
+    }
+
+Artwork references are a Scryfall ID (rebuilt with build_scryfall_url()) or,
+for non-Scryfall art such as custom tokens, the full URL verbatim. The
+facet fields (color_mask, type_mask, keyword_mask) are not stored: they are
+derived from the other fields, so decode_compact() recomputes them and
+reverses the encoding exactly.
+"""
+
+import json
+import re
+import time
+from typing import Dict, List
+
+from token_facets import facet_fields
+from token_normalize import build_scryfall_url
+
+FORMAT_VERSION = 2
+FIELDS = ['name', 'abilities', 'pt', 'colors', 'type', 'popularity', 'artwork', 'reverse_related']
+
+_SCRYFALL_URL = re.compile(
+    r'^https://cards\.scryfall\.io/large/front/([0-9a-f])/([0-9a-f])/'
+    r'([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\.jpg$')
+
+
+def _art_ref(url: str) -> str:
+    """Scryfall ID when the URL is exactly what build_scryfall_url() makes."""
+    m = _SCRYFALL_URL.match(url)
+    if m and m.group(3)[:2] == m.group(1) + m.group(2):
+        return m.group(3)
+    return url
+
+
+def _art_url(ref: str) -> str:
+    return ref if '/' in ref else build_scryfall_url(ref)
+
+
+def encode_compact(tokens: List[Dict]) -> Dict:
+    """Encode a v1 token list as a v2 document."""
+    sets = sorted({art['set'] for t in tokens for art in t.get('artwork', [])})
+    cards = sorted({name for t in tokens for name in t.get('reverse_related', [])})
+    set_index = {code: i for i, code in enumerate(sets)}
+    card_index = {name: i for i, name in enumerate(cards)}
+
+    rows = []
+    for t in tokens:
+        rows.append([
+            t['name'],
+            t['abilities'],
+            t['pt'],
+            t['colors'],
+            t['type'],
+            t['popularity'],
+            [[set_index[art['set']], _art_ref(art['url'])] for art in t.get('artwork', [])],
+            [card_index[name] for name in t.get('reverse_related', [])],
+        ])
+
+    return {
+        'format': FORMAT_VERSION,
+        'fields': FIELDS,
+        'sets': sets,
+        'cards': cards,
+        'tokens': rows,
+    }
+
+
+def decode_compact(doc: Dict) -> List[Dict]:
+    """Expand a v2 document back into the v1 token list."""
+    if doc.get('format') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported token database format: {doc.get('format')!r}")
+    sets = doc['sets']
+    cards = doc['cards']
+
+    tokens = []
+    for name, abilities, pt, colors, type_text, popularity, artwork, related in doc['tokens']:
+        token = {
+            'name': name,
+            'abilities': abilities,
+            'pt': pt,
+            'colors': colors,
+            'type': type_text,
+            'popularity': popularity,
+        }
+        token.update(facet_fields(token))
+        token['artwork'] = [{'set': sets[s], 'url': _art_url(ref)} for s, ref in artwork]
+        token['reverse_related'] = [cards[i] for i in related]
+        tokens.append(token)
+    return tokens
+
+
+def dumps_compact(tokens: List[Dict]) -> str:
+    """Minified v2 JSON text."""
+    return json.dumps(encode_compact(tokens), ensure_ascii=False, separators=(',', ':'))
+
+
+def save_compact(tokens: List[Dict], output_path: str, reference_path: str = None) -> None:
+    """Write the v2 database, verify it round-trips, and report size and
+    decode time against the v1 file at `reference_path` if given."""
+    text = dumps_compact(tokens)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+    start = time.perf_counter()
+    decoded = decode_compact(json.loads(text))
+    v2_s = time.perf_counter() - start
+    if decoded != tokens:
+        raise AssertionError(f"{output_path} does not decode back to the v1 token list")
+
+    v2_size = len(text.encode('utf-8'))
+    print(f"Saved compact v2 database to {output_path} ({v2_size / 1024:.0f}KB)")
+    if reference_path:
+        with open(reference_path, 'r', encoding='utf-8') as f:
+            v1_text = f.read()
+        start = time.perf_counter()
+        json.loads(v1_text)
+        v1_s = time.perf_counter() - start
+        v1_size = len(v1_text.encode('utf-8'))
+        print(f"  size:   v1 {v1_size / 1024:.0f}KB → v2 {v2_size / 1024:.0f}KB "
+              f"({v2_size / v1_size:.0%})")
+        print(f"  decode: v1 {v1_s * 1000:.1f}ms → v2 {v2_s * 1000:.1f}ms "
+              f"(v2 includes expansion to token dicts)")
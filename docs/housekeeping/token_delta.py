@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Versioned delta patches between published token databases.
+
+The build keeps gzip copies of the last N published token_database.json
+files (assets/token_db_history/v<version>.json.gz). For each of them it
+writes a keyed diff to the new version (assets/token_db_deltas/
+<from>-<to>.json), so a client on a recent version can download kilobytes
+instead of the whole database:
+
+    {
+      "format": 1,
+      "from_version": 3, "from_sha256": "...",
+      "to_version": 4,   "to_sha256": "...", "to_size": 761160,
+      "removed": ["<composite id>", ...],
+      "changed": {"<composite id>": {<token>}, ...},
+      "added":   {"<composite id>": {<token>}, ...},
+      "ops": [["=", 120], ["-", 1], ["+", ["<composite id>", ...]], ...]
+    }
+
+`ops` rebuild the new token order from the old one: "=" copies the next n
+old tokens (taking the `changed` version where listed), "-" drops the next
+n, "+" inserts tokens by ID (from `added`/`changed`, or moved from the old
+list). Serializing the result with token_io.dumps_database() reproduces
+the new database byte-for-byte; write_deltas() checks that for every patch.
+"""
+
+import difflib
+import gzip
+import hashlib
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+from token_io import dumps_database
+from token_normalize import token_id
+
+DELTA_FORMAT = 1
+
+_HISTORY_FILE = re.compile(r'^v(\d+)\.json\.gz$')
+
+
+def make_delta(old: List[Dict], new: List[Dict]) -> Dict:
+    """Keyed diff turning the `old` token list into `new` (version fields
+    are filled in by the caller)."""
+    old_ids = [token_id(t) for t in old]
+    new_ids = [token_id(t) for t in new]
+    old_by_id = dict(zip(old_ids, old))
+    new_by_id = dict(zip(new_ids, new))
+
+    removed = [i for i in old_ids if i not in new_by_id]
+    added = {i: new_by_id[i] for i in new_ids if i not in old_by_id}
+    changed = {
+        i: new_by_id[i] for i in new_ids
+        if i in old_by_id and old_by_id[i] != new_by_id[i]
+    }
+
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old_ids, new_ids, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append(['=', i2 - i1])
+            continue
+        if i2 > i1:
+            ops.append(['-', i2 - i1])
+        if j2 > j1:
+            ops.append(['+', new_ids[j1:j2]])
+
+    return {
+        'format': DELTA_FORMAT,
+        'removed': removed,
+        'changed': changed,
+        'added': added,
+        'ops': ops,
+    }
+
+
+def apply_delta(old: List[Dict], delta: Dict) -> List[Dict]:
+    """Rebuild the newer token list from `old` and a delta."""
+    if delta.get('format') != DELTA_FORMAT:
+        raise ValueError(f"Unsupported delta format: {delta.get('format')!r}")
+    changed = delta['changed']
+    added = delta['added']
+    old_by_id = {token_id(t): t for t in old}
+
+    result = []
+    pos = 0
+    for op, arg in delta['ops']:
+        if op == '=':
+            for t in old[pos:pos + arg]:
+                result.append(changed.get(token_id(t), t))
+            pos += arg
+        elif op == '-':
+            pos += arg
+        elif op == '+':
+            for i in arg:
+                result.append(changed.get(i) or added.get(i) or old_by_id[i])
+        else:
+            raise ValueError(f"Unknown delta op: {op!r}")
+    return result
+
+
+def dumps_delta(delta: Dict) -> str:
+    # No sort_keys: token objects must keep their field order to round-trip.
+    return json.dumps(delta, ensure_ascii=False, separators=(',', ':'))
+
+
+def _history_path(history_dir: str, version: int) -> str:
+    return os.path.join(history_dir, f"v{version}.json.gz")
+
+
+def history_versions(history_dir: str) -> List[int]:
+    """Archived database versions, oldest first."""
+    if not os.path.isdir(history_dir):
+        return []
+    versions = []
+    for name in os.listdir(history_dir):
+        m = _HISTORY_FILE.match(name)
+        if m:
+            versions.append(int(m.group(1)))
+    return sorted(versions)
+
+
+def load_history(history_dir: str, version: int) -> bytes:
+    with gzip.open(_history_path(history_dir, version), 'rb') as f:
+        return f.read()
+
+
+def archive_published(database_path: str, manifest: Dict, history_dir: str) -> Optional[int]:
+    """Archive the currently published database before it is overwritten.
+
+    Only archives when the file on disk is what `manifest` describes (same
+    sha256), so history never holds a database clients didn't receive.
+    Returns the archived version, or None.
+    """
+    version = manifest.get('version')
+    if not version or not os.path.exists(database_path):
+        return None
+    with open(database_path, 'rb') as f:
+        data = f.read()
+    if hashlib.sha256(data).hexdigest() != manifest.get('sha256'):
+        return None
+
+    os.makedirs(history_dir, exist_ok=True)
+    path = _history_path(history_dir, version)
+    if not os.path.exists(path):
+        # mtime=0 keeps the archive bytes stable across rebuilds.
+        with open(path, 'wb') as raw, gzip.GzipFile(
+                filename='', mode='wb', fileobj=raw, mtime=0) as f:
+            f.write(data)
+    return version
+
+
+def write_deltas(new_path: str, new_version: int, history_dir: str, delta_dir: str,
+                 keep: int) -> List[Dict]:
+    """Write deltas from each of the last `keep` archived versions to the new
+    database, verifying that every patch round-trips byte-for-byte.
+
+    Prunes older history and stale delta files. Returns one entry per delta
+    ({'path', 'from_version'}) for the manifest.
+    """
+    with open(new_path, 'rb') as f:
+        new_bytes = f.read()
+    new_tokens = json.loads(new_bytes)
+    new_sha = hashlib.sha256(new_bytes).hexdigest()
+
+    versions = [v for v in history_versions(history_dir) if v < new_version]
+    for stale in versions[:-keep] if keep else versions:
+        os.remove(_history_path(history_dir, stale))
+    versions = versions[-keep:] if keep else []
+
+    os.makedirs(delta_dir, exist_ok=True)
+    wanted = set()
+    entries = []
+    for version in versions:
+        old_bytes = load_history(history_dir, version)
+        old_tokens = json.loads(old_bytes)
+        delta = make_delta(old_tokens, new_tokens)
+        delta.update({
+            'from_version': version,
+            'from_sha256': hashlib.sha256(old_bytes).hexdigest(),
+            'to_version': new_version,
+            'to_sha256': new_sha,
+            'to_size': len(new_bytes),
+        })
+        text = dumps_delta(delta)
+
+        # Round-trip check: patching vN must reproduce the new file exactly.
+        rebuilt = dumps_database(apply_delta(old_tokens, json.loads(text))).encode('utf-8')
+        if rebuilt != new_bytes:
+            raise AssertionError(f"Delta v{version} -> v{new_version} does not reproduce the database")
+
+        name = f"{version}-{new_version}.json"
+        wanted.add(name)
+        path = os.path.join(delta_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        entries.append({'path': path, 'from_version': version})
+        print(f"  delta v{version} -> v{new_version}: {len(delta['added'])} added, "
+              f"{len(delta['changed'])} changed, {len(delta['removed'])} removed "
+              f"({len(text.encode('utf-8')) / 1024:.1f}KB)")
+
+    for name in os.listdir(delta_dir):
+        if name.endswith('.json') and name not in wanted:
+            os.remove(os.path.join(delta_dir, name))
+    return entries
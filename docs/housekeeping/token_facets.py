@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Integer facet fields and posting bitmaps for the token filters.
+
+The app's filter re-derives each token's category from its type string and
+compares color strings on every filter change. clean_and_dedup() now
+derives three integers per token once, at build time:
+
+    color_mask     WUBRG bits (COLORS order); 0 is colorless
+    type_mask      bit i < 8: the app's filter category (CATEGORIES order,
+                   one bit set); bit 8 + j: TYPE_WORDS[j] appears in the
+                   type line before the dash
+    keyword_mask   bit k: KEYWORDS[k] is one of the token's own keyword
+                   abilities
+
+Keywords are parsed from the leading run of keyword abilities ("Flying,
+haste", "Trample Whenever ..."), so text that only grants a keyword to
+something else ("Creatures you control have flying") doesn't set one.
+Parameterized keywords (ward {2}, protection from red, toxic 1, ...) set
+their bit regardless of the parameter. Bit positions are append-only: add
+new names at the end of their tuple.
+
+The facet index (token_facets.json) holds a posting bitmap per facet
+value over token indexes in token_database.json:
+
+    {
+      "format": 1, "tokens": 942, "database_sha256": "...",
+      "bits": {"colors": [...], "types": [...], "keywords": [...]},
+      "postings": {
+        "colors":   {"W": "<base64>", ..., "C": "<base64>"},
+        "category": {"creature": "<base64>", ...},
+        "types":    {...},
+        "keywords": {...}
+      }
+    }
+
+A bitmap is ceil(tokens / 8) bytes, little-endian: token i is bit i % 8
+of byte i // 8. A filter is then an AND of bitmaps. filter_bitmap() is the
+reference implementation, and benchmark_filters() compares it with the
+string matching the app does today.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+from token_instrument import median_ms
+from token_normalize import CATEGORIES, NORMALIZE_CACHE_SIZE, token_category
+
+FACETS_FORMAT = 1
+
+COLORS = 'WUBRG'
+TYPE_WORDS = ('creature', 'artifact', 'enchantment', 'land', 'planeswalker', 'battle',
+              'emblem', 'dungeon', 'legendary', 'snow')
+KEYWORDS = ('flying', 'first strike', 'double strike', 'deathtouch', 'defender', 'haste',
+            'hexproof', 'indestructible', 'lifelink', 'menace', 'reach', 'trample',
+            'vigilance', 'ward', 'flash', 'prowess', 'protection', 'myriad', 'changeling',
+            'decayed', 'infect', 'shroud', 'toxic', 'devoid', 'undying', 'persist',
+            'wither', 'fear', 'intimidate', 'skulk', 'shadow', 'landwalk', 'flanking',
+            'banding', 'horsemanship', 'exalted', 'annihilator', 'afflict', 'devour')
+
+FACET_FIELDS = ('color_mask', 'type_mask', 'keyword_mask')
+
+_COLOR_BITS = {c: 1 << i for i, c in enumerate(COLORS)}
+_CATEGORY_BITS = {c: 1 << i for i, c in enumerate(CATEGORIES)}
+_TYPE_WORD_BITS = {w: 1 << (len(CATEGORIES) + j) for j, w in enumerate(TYPE_WORDS)}
+
+# Keyword forms, tried in KEYWORDS order at the current position.
+_KEYWORD_FORMS = {
+    'ward': r'ward(?:\s*\{[^}]*\})*(?:\s*[—-]\s*[^,]+)?',
+    'protection': r'protection from [\w-]+(?: and from [\w-]+)*',
+    'landwalk': r'(?:island|swamp|mountain|forest|plains|desert|nonbasic land)walk',
+    'toxic': r'toxic \d+',
+    'annihilator': r'annihilator \d+',
+    'afflict': r'afflict \d+',
+    'devour': r'devour \d+',
+}
+_KEYWORD_PATTERNS = [
+    (1 << k, re.compile(_KEYWORD_FORMS.get(word, re.escape(word)) + r'(?=[\s,;.]|$)', re.IGNORECASE))
+    for k, word in enumerate(KEYWORDS)
+]
+_SEPARATOR = re.compile(r'[\s,;.]*')
+_TYPE_WORD = re.compile(r'[a-z]+')
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+def color_mask(colors: str) -> int:
+    """WUBRG bitmask of a colors string ('' -> 0)."""
+    mask = 0
+    for c in colors:
+        mask |= _COLOR_BITS.get(c, 0)
+    return mask
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _type_line_mask(type_text: str) -> int:
+    mask = 0
+    for word in _TYPE_WORD.findall(type_text.split('—', 1)[0].lower()):
+        mask |= _TYPE_WORD_BITS.get(word, 0)
+    return mask
+
+
+def type_mask(name: str, type_text: str, abilities: str) -> int:
+    """Category bit plus type-line bits (see the module docstring)."""
+    return _CATEGORY_BITS[token_category(name, type_text, abilities)] | _type_line_mask(type_text)
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def keyword_mask(abilities: str) -> int:
+    """Bits of the keyword abilities at the start of `abilities`."""
+    mask = 0
+    pos = _SEPARATOR.match(abilities).end()
+    while pos < len(abilities):
+        for bit, pattern in _KEYWORD_PATTERNS:
+            m = pattern.match(abilities, pos)
+            if m:
+                mask |= bit
+                pos = _SEPARATOR.match(abilities, m.end()).end()
+                break
+        else:
+            break
+    return mask
+
+
+def facet_fields(token: Dict) -> Dict[str, int]:
+    """The facet fields of one token."""
+    return {
+        'color_mask': color_mask(token['colors']),
+        'type_mask': type_mask(token['name'], token['type'], token['abilities']),
+        'keyword_mask': keyword_mask(token['abilities']),
+    }
+
+
+def _bit_names() -> Dict[str, List[str]]:
+    return {'colors': list(COLORS), 'types': list(TYPE_WORDS), 'keywords': list(KEYWORDS)}
+
+
+def build_postings(tokens: List[Dict]) -> Dict[str, Dict[str, int]]:
+    """Posting bitmaps (as Python ints, bit i = token i) per facet value,
+    from the tokens' facet fields."""
+    facets = {
+        'colors': [(c, 'color_mask', bit) for c, bit in _COLOR_BITS.items()],
+        'category': [(c, 'type_mask', bit) for c, bit in _CATEGORY_BITS.items()],
+        'types': [(w, 'type_mask', bit) for w, bit in _TYPE_WORD_BITS.items()],
+        'keywords': [(k, 'keyword_mask', 1 << i) for i, k in enumerate(KEYWORDS)],
+    }
+    # Bits are set in byte arrays and converted once: OR-ing 1 << i into a
+    # growing int per token would be quadratic.
+    size = (len(tokens) + 7) // 8
+    arrays = {facet: {value: bytearray(size) for value, _, _ in values} for facet, values in facets.items()}
+    arrays['colors']['C'] = bytearray(size)
+    for i, t in enumerate(tokens):
+        byte, bit = i >> 3, 1 << (i & 7)
+        if not t['color_mask']:
+            arrays['colors']['C'][byte] |= bit
+        for facet, values in facets.items():
+            for value, field, mask in values:
+                if t[field] & mask:
+                    arrays[facet][value][byte] |= bit
+    return {facet: {value: int.from_bytes(array, 'little') for value, array in values.items()}
+            for facet, values in arrays.items()}
+
+
+def encode_bitmap(bitmap: int, count: int) -> str:
+    return base64.b64encode(bitmap.to_bytes((count + 7) // 8, 'little')).decode('ascii')
+
+
+def decode_bitmap(text: str) -> int:
+    return int.from_bytes(base64.b64decode(text), 'little')
+
+
+def build_facet_index(tokens: List[Dict]) -> Dict:
+    """The token_facets.json document (without database_sha256)."""
+    postings = build_postings(tokens)
+    return {
+        'format': FACETS_FORMAT,
+        'tokens': len(tokens),
+        'bits': _bit_names(),
+        'postings': {facet: {value: encode_bitmap(bitmap, len(tokens)) for value, bitmap in values.items()}
+                     for facet, values in postings.items()},
+    }
+
+
+def load_postings(index: Dict) -> Dict[str, Dict[str, int]]:
+    """Decoded posting bitmaps of a facet index document."""
+    return {facet: {value: decode_bitmap(text) for value, text in values.items()}
+            for facet, values in index['postings'].items()}
+
+
+def filter_bitmap(postings: Dict[str, Dict[str, int]], count: int, colors: Optional[str] = None,
+                  category: Optional[str] = None, keywords: Iterable[str] = ()) -> int:
+    """Reference filter: bitmap of the tokens matching every given facet.
+
+    `colors` follows the app's color filter: an exact set of WUBRG colors,
+    or 'C' for colorless. `keywords` must all be present.
+    """
+    result = (1 << count) - 1
+    if colors is not None:
+        if colors == 'C':
+            result &= postings['colors']['C']
+        else:
+            for c in COLORS:
+                if c in colors:
+                    result &= postings['colors'][c]
+                else:
+                    result &= ~postings['colors'][c]
+            result &= ~postings['colors']['C']
+    if category is not None:
+        result &= postings['category'][category]
+    for keyword in keywords:
+        result &= postings['keywords'][keyword]
+    return result
+
+
+def bitmap_indexes(bitmap: int) -> List[int]:
+    """Token indexes set in `bitmap`, ascending."""
+    indexes = []
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    for byte_index, byte in enumerate(data):
+        if byte:
+            base = byte_index << 3
+            indexes.extend(base + bit for bit in _BYTE_BITS[byte])
+    return indexes
+
+
+def string_filter(tokens: List[Dict], colors: Optional[str] = None, category: Optional[str] = None,
+                  keywords: Iterable[str] = ()) -> List[int]:
+    """The app's filter today: derive category and compare color sets per
+    token, with keywords as a substring search of the ability text."""
+    keywords = list(keywords)
+    wanted = None if colors is None or colors == 'C' else set(colors)
+    indexes = []
+    for i, t in enumerate(tokens):
+        if colors == 'C' and t['colors']:
+            continue
+        if wanted is not None and set(t['colors']) != wanted:
+            continue
+        if category is not None and token_category(t['name'], t['type'], t['abilities']) != category:
+            continue
+        lower = t['abilities'].lower()
+        if any(k not in lower for k in keywords):
+            continue
+        indexes.append(i)
+    return indexes
+
+
+def check_facet_index(index: Dict, tokens: List[Dict]) -> None:
+    """Raise AssertionError unless `index` matches the facet fields of
+    `tokens`, and those fields match the tokens' text."""
+    if index.get('format') != FACETS_FORMAT:
+        raise AssertionError(f"Unsupported facet index format: {index.get('format')!r}")
+    if index['tokens'] != len(tokens):
+        raise AssertionError(f"Facet index covers {index['tokens']} tokens, database has {len(tokens)}")
+    for i, token in enumerate(tokens):
+        if {f: token.get(f) for f in FACET_FIELDS} != facet_fields(token):
+            raise AssertionError(f"Facet fields of token {i} ({token['name']!r}) are stale")
+    if load_postings(index) != build_postings(tokens):
+        raise AssertionError("Facet posting bitmaps disagree with the tokens' facet fields")
+
+
+def benchmark_filters(tokens: List[Dict], repeat: int = 20) -> Dict[str, Dict]:
+    """Median time of representative filters: bitmap ANDs (with and without
+    listing the matching indexes) against string matching."""
+    postings = build_postings(tokens)
+    count = len(tokens)
+    cases = {
+        'color': dict(colors='G'),
+        'color_category': dict(colors='W', category='creature'),
+        'colorless': dict(colors='C'),
+        'category_keyword': dict(category='creature', keywords=['flying']),
+    }
+    results = {}
+    for name, filters in cases.items():
+        bitmap = filter_bitmap(postings, count, **filters)
+        results[name] = {
+            'filters': filters,
+            'rows': bin(bitmap).count('1'),
+            'string_rows': len(string_filter(tokens, **filters)),
+            'bitmap_ms': round(median_ms(lambda: filter_bitmap(postings, count, **filters), repeat), 4),
+            'bitmap_indexes_ms': round(median_ms(
+                lambda: bitmap_indexes(filter_bitmap(postings, count, **filters)), repeat), 4),
+            'string_ms': round(median_ms(lambda: string_filter(tokens, **filters), repeat), 4),
+        }
+    return results
+
+
+def print_benchmark(results: Dict[str, Dict]) -> None:
+    for name, r in results.items():
+        print(f"  {name:17s} {r['rows']:6d} rows  bitmap {r['bitmap_ms']:7.3f}ms "
+              f"(+indexes {r['bitmap_indexes_ms']:7.3f}ms)  string {r['string_ms']:7.3f}ms  "
+              f"({r['string_ms'] / max(r['bitmap_indexes_ms'], 1e-6):.0f}x)")
+
+
+def write_facet_index(tokens: List[Dict], output_path: str, database_path: str) -> None:
+    """Write the posting bitmaps for `tokens` to `output_path`, stamped with
+    the sha256 of the database file at `database_path`, and report size."""
+    with open(database_path, 'rb') as f:
+        database = f.read()
+    index = build_facet_index(tokens)
+    index['database_sha256'] = hashlib.sha256(database).hexdigest()
+    text = json.dumps(index, ensure_ascii=False, separators=(',', ':'))
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+    # Decode the bitmaps again and compare them with the facet fields stored
+    # in the database file, which are what the app filters on.
+    check_facet_index(json.loads(text), json.loads(database))
+    values = sum(len(v) for v in index['postings'].values())
+    print(f"Saved facet index to {output_path} ({values} posting bitmaps, "
+          f"{len(text.encode('utf-8')) / 1024:.0f}KB; consistency verified)")
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Resumable, verified HTTP downloads for the token build scripts.
+
+fetch_resumable() streams a response body into a partial file, hashing it
+as it arrives. If the connection drops it retries with an HTTP Range
+request guarded by If-Range (the ETag, or Last-Modified), so only the
+missing bytes are fetched. A server that sends neither validator gets
+the whole file requested again. If the server has since changed the file, it
+sends the whole thing again and the download restarts cleanly. The partial
+file and a small state sidecar (<part>.json) survive across runs, so a
+killed build resumes where it stopped.
+
+The caller decides what "done" means: a finished download is checked
+against the expected size and, if given, the expected sha256. Only then is
+it handed back for the caller to swap into its cache.
+
+Conditional requests for an existing cache use the validators saved from
+the last successful response (load_validators / save_validators): both
+If-None-Match and If-Modified-Since are sent, and a 304 raises NotModified.
+"""
+
+import hashlib
+import http.client
+import json
+import os
+import time
+from email.utils import formatdate
+from typing import Dict, Optional
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+USER_AGENT = 'DoublingSeason-TokenGenerator/1.0'
+DOWNLOAD_CHUNK_SIZE = 1 << 18
+MAX_ATTEMPTS = 6
+# Seconds before the first retry; doubles after each attempt that made no
+# progress, and resets once bytes arrive again.
+RETRY_BACKOFF = 1.0
+
+
+class NotModified(Exception):
+    """The server answered 304: the cached copy is current."""
+
+
+def load_validators(path: str) -> Dict[str, str]:
+    """ETag / Last-Modified saved from the last complete download."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_validators(path: str, result: Dict) -> None:
+    validators = {k: result[k] for k in ('etag', 'last_modified') if result.get(k)}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(validators, f, indent=2)
+
+
+def conditional_headers(cache_file: str, validators: Dict[str, str]) -> Dict[str, str]:
+    """Request headers that let the server answer 304 for an existing cache.
+
+    Uses the saved ETag and Last-Modified values; falls back to the cache
+    file's mtime when no Last-Modified was recorded.
+    """
+    headers = {'User-Agent': USER_AGENT}
+    if not os.path.exists(cache_file):
+        return headers
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    else:
+        headers['If-Modified-Since'] = formatdate(os.path.getmtime(cache_file), usegmt=True)
+    return headers
+
+
+def _state_path(part_path: str) -> str:
+    return part_path + '.json'
+
+
+def _load_state(part_path: str, url: str) -> Dict:
+    """Resume state for `part_path`, or {} if it can't be resumed safely."""
+    if not os.path.exists(part_path):
+        return {}
+    try:
+        with open(_state_path(part_path), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # Without a validator there is no way to make sure the rest of the
+    # bytes belong to the same file.
+    if state.get('url') != url or not (state.get('etag') or state.get('last_modified')):
+        return {}
+    return state
+
+
+def _save_state(part_path: str, state: Dict) -> None:
+    with open(_state_path(part_path), 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+
+
+def discard_partial(part_path: str) -> None:
+    """Remove a partial download and its resume state."""
+    for path in (part_path, _state_path(part_path)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _hash_file(path: str) -> 'hashlib._Hash':
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher
+
+
+def _content_range(value: Optional[str]):
+    """(start, total) from a 'bytes start-end/total' header; total may be None."""
+    try:
+        unit, spec = value.split(' ', 1)
+        span, total = spec.split('/', 1)
+        start = int(span.split('-', 1)[0])
+        return start, (None if total == '*' else int(total))
+    except (AttributeError, ValueError):
+        return None, None
+
+
+def fetch_resumable(url: str, part_path: str, headers: Optional[Dict[str, str]] = None,
+                    expected_sha256: Optional[str] = None, attempts: Optional[int] = None,
+                    timeout: int = 120) -> Dict:
+    """Download `url` into `part_path`, resuming after dropped connections.
+
+    `headers` are the conditional headers for a fresh request (see
+    conditional_headers()). They are not sent when resuming, because
+    the partial file is what matters then.
+
+    Returns {'size', 'sha256', 'etag', 'last_modified', 'resumed_from',
+    'attempts'}. Raises NotModified on 304. Raises the last error once
+    `attempts` (default MAX_ATTEMPTS) are used up; the partial file is
+    kept for the next run.
+    Raises ValueError, and discards the partial file, when a complete
+    download fails the sha256 check.
+    """
+    attempts = attempts or MAX_ATTEMPTS
+    state = _load_state(part_path, url)
+    if state:
+        offset = os.path.getsize(part_path)
+        hasher = _hash_file(part_path)
+    else:
+        discard_partial(part_path)
+        state = {'url': url}
+        offset = 0
+        hasher = hashlib.sha256()
+    resumed_from = offset
+    total = state.get('total')
+    backoff = RETRY_BACKOFF
+    last_error = None
+
+    for attempt in range(1, attempts + 1):
+        if attempt > 1:
+            time.sleep(backoff)
+        if offset and not (state.get('etag') or state.get('last_modified')):
+            # No validator to guard a Range request with: start over.
+            print(f"  {url} sent no ETag or Last-Modified, restarting download")
+            discard_partial(part_path)
+            state = {'url': url}
+            offset = 0
+            hasher = hashlib.sha256()
+        req_headers = dict(headers or {}) if offset == 0 else {'User-Agent': USER_AGENT}
+        if offset:
+            req_headers['Range'] = f'bytes={offset}-'
+            req_headers['If-Range'] = state.get('etag') or state['last_modified']
+
+        progress = 0
+        try:
+            with urlopen(Request(url, headers=req_headers), timeout=timeout) as response:
+                if response.status == 206:
+                    start, total = _content_range(response.headers.get('Content-Range'))
+                    if start != offset:
+                        raise http.client.HTTPException(
+                            f"Server resumed at byte {start}, expected {offset}")
+                    mode = 'ab'
+                else:
+                    # Full body: either a fresh start, or the file changed
+                    # upstream and If-Range sent everything again.
+                    if offset:
+                        print(f"  {url} changed upstream, restarting download")
+                    offset = 0
+                    hasher = hashlib.sha256()
+                    length = response.headers.get('Content-Length')
+                    total = int(length) if length and length.isdigit() else None
+                    mode = 'wb'
+
+                state.update({
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'total': total,
+                })
+                _save_state(part_path, state)
+
+                with open(part_path, mode) as f:
+                    while True:
+                        chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        offset += len(chunk)
+                        progress += len(chunk)
+
+            if total is not None and offset < total:
+                raise http.client.IncompleteRead(b'', total - offset)
+            break
+
+        except HTTPError as e:
+            if e.code == 304:
+                raise NotModified() from e
+            if e.code == 416:
+                # Range no longer satisfiable (file shrank or was replaced).
+                discard_partial(part_path)
+                state = {'url': url}
+                offset = 0
+                hasher = hashlib.sha256()
+                last_error = e
+                continue
+            if e.code < 500:
+                raise
+            last_error = e
+        except (URLError, OSError, http.client.HTTPException) as e:
+            last_error = e
+
+        if progress:
+            backoff = RETRY_BACKOFF
+        else:
+            backoff *= 2
+        print(f"  Download interrupted at {offset / 1024 / 1024:.1f}MB "
+              f"({last_error}); attempt {attempt}/{attempts}")
+    else:
+        raise last_error
+
+    digest = hasher.hexdigest()
+    if expected_sha256 and digest != expected_sha256.lower():
+        discard_partial(part_path)
+        raise ValueError(f"sha256 mismatch for {url}: got {digest}, expected {expected_sha256}")
+
+    return {
+        'size': offset,
+        'sha256': digest,
+        'etag': state.get('etag'),
+        'last_modified': state.get('last_modified'),
+        'resumed_from': resumed_from,
+        'attempts': attempt,
+    }
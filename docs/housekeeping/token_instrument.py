@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Per-stage instrumentation for the token database build scripts.
+
+A build calls start_run() once, wraps each step in `with stage(name) as s:`
+(setting s.records / s.bytes for throughput) and finally finish_run(),
+which writes a machine-readable run report. stage() is a no-op when no run
+is active, so library functions can be instrumented unconditionally.
+
+Per stage the report holds wall time, CPU time, peak RSS and, with
+trace_memory, the tracemalloc peak within the stage. peak_rss_mb is the
+process's high-water mark so far, not the stage's own use: it never goes
+down, so without trace_memory (--trace-memory) there is no per-stage
+memory figure. Stages may nest; an enclosing stage's traced peak includes
+its inner stages. A single stage can also be run under cProfile; its
+stats are dumped next to the report.
+
+Stages may run on worker threads (e.g. sources fetched in parallel). The
+tracemalloc peak is process-wide, so such stages neither reset it nor
+report one: per-thread memory figures are not supported. Their CPU time
+is likewise the whole process's, and the entry names the thread. A
+main-thread stage around the pool still gets the combined peak.
+"""
+
+import cProfile
+import io
+import json
+import os
+import platform
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_active = None
+
+
+class StageStats:
+    """Mutable per-stage counters the instrumented code may fill in."""
+
+    __slots__ = ('records', 'bytes', 'notes')
+
+    def __init__(self):
+        self.records = None
+        self.bytes = None
+        self.notes = {}
+
+
+def median_ms(fn: Callable[[], object], repeat: int) -> float:
+    """Median wall time of `repeat` calls to `fn`, in milliseconds (for the
+    artifact micro-benchmarks, which run outside any stage)."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2] * 1000
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux.
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 1)
+
+
+class RunReport:
+    """Collects stage timings for one build run."""
+
+    def __init__(self, script: str, trace_memory: bool = False,
+                 profile_stage: Optional[str] = None, profile_dir: Optional[str] = None):
+        self.script = script
+        self.trace_memory = trace_memory
+        self.profile_stage = profile_stage
+        self.profile_dir = profile_dir
+        self.stages: List[Dict] = []
+        # Traced peak of each open main-thread stage up to its innermost
+        # open child's start (reset_peak() would lose it).
+        self._peaks: List[int] = []
+        self.started = datetime.now(timezone.utc)
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageStats]:
+        stats = StageStats()
+        profiler = cProfile.Profile() if name == self.profile_stage else None
+        on_main = threading.current_thread() is threading.main_thread()
+        trace_memory = self.trace_memory and on_main
+        if trace_memory:
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._peaks.append(0)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield stats
+        finally:
+            if profiler:
+                profiler.disable()
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            entry = {
+                'name': name,
+                'wall_s': round(wall, 4),
+                'cpu_s': round(cpu, 4),
+                'peak_rss_mb': _peak_rss_mb(),
+            }
+            if not on_main:
+                entry['thread'] = threading.current_thread().name
+            if trace_memory:
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                entry['peak_traced_mb'] = round(peak / 1024 / 1024, 2)
+            if stats.records is not None:
+                entry['records'] = stats.records
+                entry['records_per_s'] = round(stats.records / wall, 1) if wall else None
+            if stats.bytes is not None:
+                entry['bytes'] = stats.bytes
+                entry['bytes_per_s'] = round(stats.bytes / wall) if wall else None
+            if stats.notes:
+                entry.update(stats.notes)
+            if profiler:
+                entry['profile'] = self._dump_profile(name, profiler)
+            self.stages.append(entry)
+
+    def _dump_profile(self, name: str, profiler: cProfile.Profile) -> str:
+        """Save cProfile stats for a stage and print the hottest functions."""
+        directory = self.profile_dir or os.getcwd()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"token_build_{name}.prof")
+        profiler.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(25)
+        print(f"\n=== cProfile: {name} (saved to {path}) ===")
+        print(out.getvalue())
+        return path
+
+    def to_dict(self, status: str = 'ok') -> Dict:
+        return {
+            'script': self.script,
+            'status': status,
+            'started': self.started.isoformat(timespec='seconds'),
+            'argv': sys.argv[1:],
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'total': {
+                'wall_s': round(time.perf_counter() - self._wall_start, 4),
+                'cpu_s': round(time.process_time() - self._cpu_start, 4),
+                'peak_rss_mb': _peak_rss_mb(),
+            },
+            'stages': self.stages,
+        }
+
+    def print_summary(self) -> None:
+        print("\n=== Stage timings ===")
+        for s in self.stages:
+            line = f"  {s['name']:18s} {s['wall_s']:8.2f}s wall {s['cpu_s']:8.2f}s cpu"
+            if 'peak_traced_mb' in s:
+                line += f" {s['peak_traced_mb']:8.1f}MB peak"
+            if s.get('records_per_s'):
+                line += f" {s['records_per_s']:10.0f} rec/s"
+            if s.get('bytes_per_s'):
+                line += f" {s['bytes_per_s'] / 1024 / 1024:8.1f} MB/s"
+            if 'json_backend' in s:
+                line += f" [{s['json_backend']}]"
+            print(line)
+
+
+def start_run(script: str, trace_memory: bool = False, profile_stage: Optional[str] = None,
+              profile_dir: Optional[str] = None) -> RunReport:
+    """Begin collecting stages for this process."""
+    global _active
+    _active = RunReport(script, trace_memory, profile_stage, profile_dir)
+    return _active
+
+
+def finish_run(report_path: str, status: str = 'ok') -> None:
+    """Write the active run's report as JSON and stop collecting."""
+    global _active
+    if _active is None:
+        return
+    report = _active
+    _active = None
+    if report.trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    report.print_summary()
+    report_path = os.path.normpath(report_path)
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report.to_dict(status), f, indent=2)
+        f.write('\n')
+    print(f"Wrote run report to {report_path}")
+
+
+@contextmanager
+def stage(name: str) -> Iterator[StageStats]:
+    """Time a stage of the active run; a no-op outside a run."""
+    if _active is None:
+        yield StageStats()
+        return
+    with _active.stage(name) as stats:
+        yield stats
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Serialization of token_database.json shared by the build tooling.
+
+Anything that must reproduce the database byte-for-byte (delta patches,
+verification) goes through dumps_database() rather than calling json.dump
+with its own options.
+
+The output is canonical: the same tokens serialize to the same bytes
+however the upstream data happened to be ordered. Tokens are sorted by
+name, then composite ID (so tokens sharing a name keep a stable order);
+reverse-related card names alphabetically; fields in TOKEN_FIELDS order.
+Artwork is the exception: it keeps its first-seen order, because the app
+shows the first entry as a token's default art. The extractors emit it in
+upstream set order, which is stable across runs. The manifest relies on
+this to publish a new version only when the content really changed.
+
+Decoding and encoding go through a pluggable backend: orjson when it is
+installed, else the stdlib json module (set_json_backend() picks one
+explicitly). Both give the same values from loads() and the same bytes
+from dumps_database(): with indent=2 and ensure_ascii=False the stdlib
+writes exactly what orjson's OPT_INDENT_2 writes for strings, integers,
+booleans, null, lists and str-keyed objects, which is all a token holds.
+Anything orjson refuses (integers beyond 64 bits, lone surrogates) is
+re-encoded with the stdlib.
+"""
+
+import gc
+import json
+import os
+from typing import Dict, List, Union
+
+from token_normalize import composite_id
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib backend is used instead
+    orjson = None
+
+JSON_BACKENDS = ('auto', 'orjson', 'json')
+
+_backend = 'orjson' if orjson is not None else 'json'
+
+# Field order of a database token; the Cockatrice build has no reverse_related.
+# The *_mask fields are derived from the others (see token_facets).
+TOKEN_FIELDS = ('name', 'abilities', 'pt', 'colors', 'type', 'popularity',
+                'color_mask', 'type_mask', 'keyword_mask', 'artwork', 'reverse_related')
+
+
+def canonical_key(token: Dict):
+    """Sort key of a token in canonical order."""
+    return token['name'], composite_id(token['name'], token['pt'], token['colors'],
+                                       token['type'], token['abilities'])
+
+
+def canonical_token(token: Dict) -> Dict:
+    """`token` with its fields in canonical order and its reverse-related
+    cards sorted; artwork is left in first-seen order."""
+    entry = {field: token[field] for field in TOKEN_FIELDS if field in token}
+    for field in sorted(token.keys() - entry.keys()):
+        entry[field] = token[field]
+    if 'reverse_related' in entry:
+        entry['reverse_related'] = sorted(entry['reverse_related'])
+    return entry
+
+
+def canonical_tokens(tokens: List[Dict]) -> List[Dict]:
+    """Canonical form of a token list (see the module docstring)."""
+    return sorted((canonical_token(t) for t in tokens), key=canonical_key)
+
+
+def set_json_backend(name: str) -> str:
+    """Select the JSON backend ('auto', 'orjson' or 'json'); returns the one
+    in use. 'auto' prefers orjson when it is installed."""
+    global _backend
+    if name not in JSON_BACKENDS:
+        raise ValueError(f"Unknown JSON backend {name!r}; choose from {', '.join(JSON_BACKENDS)}")
+    if name == 'orjson' and orjson is None:
+        raise ValueError("JSON backend 'orjson' requested but orjson is not installed")
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'json'
+    _backend = name
+    return _backend
+
+
+def json_backend() -> str:
+    """Name of the JSON backend in use."""
+    return _backend
+
+
+def loads(data: Union[bytes, str]):
+    """Decode a JSON document (UTF-8 bytes or text) with the selected backend."""
+    if _backend == 'orjson':
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def load_file(path: str):
+    """Decode the JSON file at `path` with the selected backend.
+
+    The cyclic GC is paused meanwhile: a decoded document has no cycles, but
+    its millions of new containers would otherwise trigger collections that
+    cost more than the decode itself on AllPrintings.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return loads(data)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _dumps_indented(value) -> str:
+    if _backend == 'orjson':
+        try:
+            return orjson.dumps(value, option=orjson.OPT_INDENT_2).decode('utf-8')
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(value, indent=2, ensure_ascii=False)
+
+
+def dumps_database(tokens: List[Dict]) -> str:
+    """The exact text written to token_database.json."""
+    return _dumps_indented(canonical_tokens(tokens))
+
+
+def write_database(tokens: List[Dict], output_path: str) -> None:
+    """Write token_database.json (UTF-8, no trailing newline)."""
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(dumps_database(tokens))
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Presorted NDJSON copy of token_database.json, for streaming clients.
+
+token_database.json is one array in name order: a client decodes all of
+it, then sorts it by popularity before it can show the first result. The
+NDJSON output is already in the app's display order, one token per line,
+behind a header line:
+
+    {"format":1,"kind":"header","tokens":942,"database_sha256":"...",
+     "order":["-popularity","name"],
+     "brackets":[{"bracket":1,"min_popularity":52,"max_popularity":null,
+                  "count":50,"first_rank":1,"last_rank":50}, ...]}
+    {"rank":1,"name":"Treasure","abilities":"...",...}
+    {"rank":2,...}
+
+Tokens are ordered by popularity (highest first), then name, then
+composite ID, which is the same ranking as the popularity-first shards.
+`rank` is the 1-based line position after the header. The brackets come
+from token_analytics, with the rank range each one covers, so a client
+can draw bracket headings before those tokens arrive. A reader decodes
+the header and then one line at a time, and can render the first screen
+after a few kilobytes.
+
+write_ndjson() checks that the lines, with `rank` dropped and put back in
+canonical order, reproduce token_database.json byte-for-byte.
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, IO, Iterator, List, Tuple
+
+from token_analytics import TOP_BRACKET_SIZE, popularity_analytics
+from token_instrument import median_ms
+from token_io import canonical_token, dumps_database
+from token_shards import rank_tokens
+
+NDJSON_FORMAT = 1
+
+
+def _dumps(record: Dict) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+
+
+def ndjson_header(tokens: List[Dict], database_sha256: str) -> Dict:
+    """The header record: counts, format, sort order and bracket rank ranges."""
+    brackets = []
+    first = 1
+    for bracket in popularity_analytics(tokens)['brackets']:
+        brackets.append({**bracket, 'first_rank': first, 'last_rank': first + bracket['count'] - 1})
+        first += bracket['count']
+    return {
+        'format': NDJSON_FORMAT,
+        'kind': 'header',
+        'tokens': len(tokens),
+        'database_sha256': database_sha256,
+        'order': ['-popularity', 'name'],
+        'brackets': brackets,
+    }
+
+
+def dumps_ndjson(tokens: List[Dict], database_sha256: str) -> str:
+    """The full NDJSON text: header line, then one ranked token per line."""
+    lines = [_dumps(ndjson_header(tokens, database_sha256))]
+    for rank, token in enumerate(rank_tokens(tokens), 1):
+        lines.append(_dumps({'rank': rank, **canonical_token(token)}))
+    return '\n'.join(lines) + '\n'
+
+
+def stream_ndjson(f: IO) -> Tuple[Dict, Iterator[Dict]]:
+    """(header, token iterator) for an NDJSON file or response opened in
+    binary or text mode. Tokens are decoded one line at a time, as read."""
+    header = json.loads(f.readline())
+    if header.get('kind') != 'header' or header.get('format') != NDJSON_FORMAT:
+        raise ValueError(f"Unsupported NDJSON header: {header!r}")
+
+    def tokens() -> Iterator[Dict]:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+    return header, tokens()
+
+
+def check_ndjson(path: str, database: bytes) -> None:
+    """Raise AssertionError unless the NDJSON file at `path` is ranked
+    correctly and holds exactly the database `database` (bytes)."""
+    with open(path, 'rb') as f:
+        header, records = stream_ndjson(f)
+        tokens = list(records)
+    if header['tokens'] != len(tokens):
+        raise AssertionError(f"{path} header says {header['tokens']} tokens, file has {len(tokens)}")
+    if header['database_sha256'] != hashlib.sha256(database).hexdigest():
+        raise AssertionError(f"{path} was not built from this database")
+    if [t['rank'] for t in tokens] != list(range(1, len(tokens) + 1)):
+        raise AssertionError(f"{path} ranks are not 1..{len(tokens)} in order")
+    stripped = [{k: v for k, v in t.items() if k != 'rank'} for t in tokens]
+    if rank_tokens(stripped) != stripped:
+        raise AssertionError(f"{path} is not in popularity-then-name order")
+    if dumps_database(stripped).encode('utf-8') != database:
+        raise AssertionError(f"{path} does not hold the same tokens as the database")
+    for bracket in header['brackets']:
+        for t in stripped[bracket['first_rank'] - 1:bracket['last_rank']]:
+            upper = bracket['max_popularity']
+            if t['popularity'] < bracket['min_popularity'] or (upper is not None and t['popularity'] > upper):
+                raise AssertionError(f"{path} bracket {bracket['bracket']} rank range is wrong")
+
+
+def benchmark_first_record(ndjson_path: str, database_path: str, screen: int = TOP_BRACKET_SIZE,
+                           repeat: int = 5) -> Dict[str, float]:
+    """Median milliseconds from opening the file to the first token and to
+    the first `screen` tokens, streaming the NDJSON, against decoding and
+    sorting the whole JSON array (what the app does)."""
+    def first_records(count: int) -> None:
+        with open(ndjson_path, 'rb') as f:
+            _, records = stream_ndjson(f)
+            for i, _ in enumerate(records, 1):
+                if i >= count:
+                    break
+
+    def full_stream() -> None:
+        with open(ndjson_path, 'rb') as f:
+            _, records = stream_ndjson(f)
+            for _ in records:
+                pass
+
+    def json_array() -> None:
+        with open(database_path, 'rb') as f:
+            tokens = json.load(f)
+        tokens.sort(key=lambda t: (-t['popularity'], t['name']))
+
+    return {
+        'first_record_ms': round(median_ms(lambda: first_records(1), repeat), 3),
+        'first_screen_ms': round(median_ms(lambda: first_records(screen), repeat), 3),
+        'full_stream_ms': round(median_ms(full_stream, repeat), 3),
+        'json_array_sorted_ms': round(median_ms(json_array, repeat), 3),
+        'screen': screen,
+    }
+
+
+def print_benchmark(results: Dict[str, float]) -> None:
+    print(f"  first token {results['first_record_ms']:.2f}ms, first {results['screen']} tokens "
+          f"{results['first_screen_ms']:.2f}ms, all {results['full_stream_ms']:.1f}ms streamed; "
+          f"decode + sort of the JSON array {results['json_array_sorted_ms']:.1f}ms")
+
+
+def write_ndjson(tokens: List[Dict], output_path: str, database_path: str) -> None:
+    """Write `tokens` as ranked NDJSON lines with a header naming the sha256
+    of the database file at `database_path`, check that the lines hold
+    exactly that file's tokens, and report size and first-record latency."""
+    with open(database_path, 'rb') as f:
+        database = f.read()
+    text = dumps_ndjson(tokens, hashlib.sha256(database).hexdigest())
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(text)
+    check_ndjson(output_path, database)
+
+    print(f"Saved NDJSON database to {output_path} ({len(tokens)} tokens, "
+          f"{len(text.encode('utf-8')) / 1024:.0f}KB; verified against {os.path.basename(database_path)})")
+    print_benchmark(benchmark_first_record(output_path, database_path))
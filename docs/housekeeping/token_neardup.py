@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate token detection (MinHash + LSH) and allowlisted merges.
+
+Dedup is exact on the composite ID, so printings whose ability text
+differs only in punctuation, "this creature" vs the token's own name, or a
+leftover reminder fragment stay separate search entries. This module finds
+them without comparing every pair:
+
+1. Tokens are blocked by identity: name, P/T, colors and type must match
+   exactly. Only the ability text may differ. Ability text on its own is
+   far too common ("Flying") to bucket on, and tokens with different
+   identities are different tokens anyway.
+2. The ability text is normalized: lowercase, the token's name becomes
+   "this creature", punctuation is dropped. It is then cut into
+   character SHINGLE_SIZE-grams, each hashed with crc32.
+3. Each text with at least one other text in its block gets a
+   NUM_PERM-value MinHash signature, computed with universal hashes
+   (a*x + b) mod P. This is vectorized with NumPy when available;
+   otherwise plain Python computes the same values.
+4. Signatures are cut into BANDS bands. Texts that share an identical
+   band in the same block are candidates (locality-sensitive hashing),
+   so the work grows with the number of texts, not pairs.
+5. Candidates are verified with the exact Jaccard similarity of their
+   shingle sets. Pairs at or above the threshold are joined into groups.
+
+Each group becomes a merge suggestion: the most popular token is kept.
+write_report() saves the suggestions for review; entries are in the
+allowlist format, so a reviewed group can be pasted into
+near_duplicate_merges.json as is:
+
+    [
+      {"keep": "<composite id>", "merge": ["<composite id>", ...]},
+      ...
+    ]
+
+apply_merges() folds each listed token into its `keep` token (artwork and
+reverse-related cards unioned, popularity recounted). An allowlist that
+names a token the build no longer produces, or merges a token twice, is
+rejected: the entry has to be reviewed again.
+"""
+
+import json
+import os
+import random
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional; the pure-Python path gives identical signatures
+    np = None
+
+from token_io import canonical_tokens
+from token_normalize import token_id
+
+REPORT_FORMAT = 1
+SHINGLE_SIZE = 5
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# With 16 bands of 4 rows, pairs at Jaccard 0.7 become candidates ~99% of
+# the time, and pairs at 0.3 about 12% of the time (all then rejected on
+# verification).
+DEFAULT_THRESHOLD = 0.7
+# Mersenne prime 2^31 - 1: a*x + b stays below 2^63, so NumPy's int64
+# arithmetic matches Python's exactly.
+_PRIME = (1 << 31) - 1
+_PERM_SEED = 0x6d696e68
+_NUMPY_BATCH = 1 << 16
+
+_rng = random.Random(_PERM_SEED)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_NON_TEXT = re.compile(r"[^\w{}+/\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def _words(text: str) -> str:
+    return ' ' + _SPACES.sub(' ', _NON_TEXT.sub(' ', text.lower())).strip() + ' '
+
+
+def normalize_text(token: Dict) -> str:
+    """Ability text with wording and punctuation differences removed."""
+    text = _words(token['abilities'])
+    name = _words(token['name'])
+    if name.strip():
+        text = text.replace(name, ' this creature ')
+    return text.replace(' this token ', ' this creature ').strip()
+
+
+def shingles(text: str) -> Set[int]:
+    """crc32 hashes of the character SHINGLE_SIZE-grams of `text`."""
+    if not text:
+        return set()
+    if len(text) <= SHINGLE_SIZE:
+        return {zlib.crc32(text.encode('utf-8')) % _PRIME}
+    data = text.encode('utf-8')
+    return {zlib.crc32(data[i:i + SHINGLE_SIZE]) % _PRIME for i in range(len(data) - SHINGLE_SIZE + 1)}
+
+
+def _signatures_python(shingle_sets: List[Set[int]]) -> List[Tuple[int, ...]]:
+    return [tuple(min((a * x + b) % _PRIME for x in hashes) for a, b in _PERMS)
+            for hashes in shingle_sets]
+
+
+def _signatures_numpy(shingle_sets: List[Set[int]]) -> List[Tuple[int, ...]]:
+    a = np.array([p[0] for p in _PERMS], dtype=np.int64)[:, None]
+    b = np.array([p[1] for p in _PERMS], dtype=np.int64)[:, None]
+    signatures = []
+    # Batches of whole documents keep the (NUM_PERM x shingles) matrix small.
+    start = 0
+    while start < len(shingle_sets):
+        end = start
+        width = 0
+        while end < len(shingle_sets) and (width < _NUMPY_BATCH or end == start):
+            width += len(shingle_sets[end])
+            end += 1
+        batch = shingle_sets[start:end]
+        lengths = np.fromiter((len(s) for s in batch), dtype=np.int64, count=len(batch))
+        values = np.fromiter((x for s in batch for x in s), dtype=np.int64, count=int(lengths.sum()))
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        hashed = (a * values[None, :] + b) % _PRIME
+        mins = np.minimum.reduceat(hashed, offsets, axis=1)
+        signatures.extend(map(tuple, mins.T.tolist()))
+        start = end
+    return signatures
+
+
+def minhash_signatures(shingle_sets: List[Set[int]], use_numpy: Optional[bool] = None) -> List[Tuple[int, ...]]:
+    """MinHash signature of each (non-empty) shingle set."""
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy and shingle_sets:
+        return _signatures_numpy(shingle_sets)
+    return _signatures_python(shingle_sets)
+
+
+def jaccard(a: Set[int], b: Set[int]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def _find(parent: Dict[int, int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def find_near_duplicates(tokens: Sequence[Dict], threshold: float = DEFAULT_THRESHOLD,
+                         use_numpy: Optional[bool] = None) -> Dict:
+    """Merge suggestions for `tokens` (see the module docstring).
+
+    Returns {'groups': [...], 'threshold', 'candidates': n, 'signatures': n}; each group
+    is {'keep', 'merge', 'similarity', 'tokens'}, where similarity is the
+    lowest verified Jaccard in the group.
+    """
+    # Only tokens sharing an identity with another token need a signature.
+    # String keys and a first-seen index per identity keep this loop from
+    # allocating a container per token (which the GC would keep rescanning).
+    first = {}
+    blocks = defaultdict(list)
+    for i, t in enumerate(tokens):
+        identity = f"{t['name']}|{t['pt']}|{t['colors']}|{t['type']}"
+        seen = first.setdefault(identity, i)
+        if seen != i:
+            members = blocks[identity]
+            if not members:
+                members.append(seen)
+            members.append(i)
+
+    docs = []
+    doc_shingles = []
+    block_docs = []
+    for members in blocks.values():
+        in_block = []
+        for i in members:
+            hashes = shingles(normalize_text(tokens[i]))
+            if hashes:
+                in_block.append(len(docs))
+                docs.append(i)
+                doc_shingles.append(hashes)
+        if len(in_block) > 1:
+            block_docs.append(in_block)
+
+    signatures = minhash_signatures(doc_shingles, use_numpy)
+
+    # LSH within each block: documents sharing any whole band are candidates.
+    candidates = set()
+    for in_block in block_docs:
+        for band in range(0, NUM_PERM, ROWS):
+            buckets = defaultdict(list)
+            for d in in_block:
+                buckets[signatures[d][band:band + ROWS]].append(d)
+            for members in buckets.values():
+                for x in range(len(members)):
+                    for y in range(x + 1, len(members)):
+                        candidates.add((members[x], members[y]))
+
+    parent = {}
+    similarity = {}
+    for x, y in candidates:
+        score = jaccard(doc_shingles[x], doc_shingles[y])
+        if score < threshold:
+            continue
+        for d in (x, y):
+            parent.setdefault(d, d)
+        rx, ry = _find(parent, x), _find(parent, y)
+        root = min(rx, ry)
+        parent[rx] = parent[ry] = root
+        similarity[root] = min(score, similarity.get(rx, 1.0), similarity.get(ry, 1.0))
+
+    grouped = defaultdict(list)
+    for d in parent:
+        grouped[_find(parent, d)].append(docs[d])
+
+    groups = []
+    for root, members in grouped.items():
+        ranked = sorted((tokens[i] for i in members), key=lambda t: (-t['popularity'], token_id(t)))
+        groups.append({
+            'keep': token_id(ranked[0]),
+            'merge': [token_id(t) for t in ranked[1:]],
+            'similarity': round(similarity[root], 3),
+            'tokens': [{'id': token_id(t), 'abilities': t['abilities'], 'popularity': t['popularity']}
+                       for t in ranked],
+        })
+    groups.sort(key=lambda g: g['keep'])
+    return {'groups': groups, 'threshold': threshold, 'candidates': len(candidates),
+            'signatures': len(signatures)}
+
+
+def write_report(result: Dict, tokens: Sequence[Dict], path: str) -> None:
+    """Save merge suggestions for review, and print a short summary."""
+    report = {
+        'format': REPORT_FORMAT,
+        'threshold': result['threshold'],
+        'num_perm': NUM_PERM,
+        'bands': BANDS,
+        'tokens': len(tokens),
+        'signatures': result['signatures'],
+        'candidates': result['candidates'],
+        'groups': result['groups'],
+    }
+    path = os.path.normpath(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+
+    merges = sum(len(g['merge']) for g in result['groups'])
+    print(f"Near-duplicates: {len(result['groups'])} groups ({merges} tokens could merge) "
+          f"from {result['candidates']} LSH candidates over {result['signatures']} signatures")
+    for group in result['groups'][:10]:
+        print(f"  {group['similarity']:.2f}  " + '  |  '.join(
+            repr(t['abilities']) for t in group['tokens']))
+    if len(result['groups']) > 10:
+        print(f"  ... {len(result['groups']) - 10} more")
+    print(f"Saved merge suggestions to {path}")
+
+
+def load_allowlist(path: str) -> List[Dict]:
+    """Reviewed merges ([{'keep', 'merge'}, ...]); [] if the file is missing."""
+    if not os.path.exists(path):
+        print(f"No near-duplicate allowlist at {path}")
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    for entry in entries:
+        if not isinstance(entry.get('keep'), str) or not isinstance(entry.get('merge'), list):
+            raise ValueError(f"{path}: each entry needs a 'keep' id and a 'merge' list, got {entry!r}")
+    return entries
+
+
+def apply_merges(tokens: List[Dict], allowlist: List[Dict]) -> List[Dict]:
+    """Fold allowlisted tokens into their `keep` token; returns the new list.
+
+    Raises ValueError if an entry names a token that isn't in `tokens`, or
+    a token was already merged away by an earlier entry.
+    """
+    by_id = {token_id(t): dict(t) for t in tokens}
+    unknown = sorted({i for entry in allowlist for i in [entry['keep'], *entry['merge']]} - by_id.keys())
+    if unknown:
+        raise ValueError(f"Near-duplicate allowlist names {len(unknown)} unknown tokens: "
+                         + ', '.join(repr(i) for i in unknown))
+    merged = 0
+    for entry in allowlist:
+        keep = by_id.get(entry['keep'])
+        if keep is None:
+            raise ValueError(f"Near-duplicate allowlist keeps {entry['keep']!r}, "
+                             "which an earlier entry merged away")
+        for merge_id in entry['merge']:
+            if merge_id == entry['keep']:
+                continue
+            other = by_id.pop(merge_id, None)
+            if other is None:
+                raise ValueError(f"Near-duplicate allowlist merges {merge_id!r} twice")
+            urls = {art['url'] for art in keep['artwork']}
+            keep['artwork'] = keep['artwork'] + [a for a in other['artwork'] if a['url'] not in urls]
+            if 'reverse_related' in keep:
+                keep['reverse_related'] = sorted(set(keep['reverse_related']) | set(other['reverse_related']))
+                keep['popularity'] = len(keep['reverse_related'])
+            else:
+                keep['popularity'] = max(keep['popularity'], other['popularity'])
+            merged += 1
+    print(f"Applied {merged} allowlisted near-duplicate merges")
+    return canonical_tokens(by_id.values())
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Shared token normalization for the token database build scripts.
+
+Both process_tokens_mtgjson.py and process_tokens_with_popularity.py clean
+raw printings the same way and dedup them on the composite ID that Dart's
+TokenDefinition.id uses:
+
+    name|pt|colors|type|abilities
+
+Raw printings are held as TokenRecord objects (__slots__, tuples and
+interned strings) rather than dicts. Raw name/type/ability strings repeat
+heavily across reprints, so normalization is memoized per distinct raw
+field tuple, and the string cleaners are memoized (bounded LRU) on top of
+precompiled patterns. Dedup groups on a fixed-size hash of the composite
+ID (key_hash()), computed once per distinct token rather than once per
+printing. The Scryfall artwork URL
+scheme lives here too, since the compact database format depends on
+rebuilding URLs exactly.
+
+Usage (micro-benchmark, inline re.sub vs this module):
+    python3 docs/housekeeping/token_normalize.py
+"""
+
+import hashlib
+import re
+import sys
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Upper bound on memoized entries per cleaner; a few times today's distinct
+# strings, so a full build never evicts but memory stays bounded.
+NORMALIZE_CACHE_SIZE = 1 << 16
+
+_TOKEN_SUFFIX = re.compile(r'\s*Token\s*$', re.IGNORECASE)
+_TOKEN_PREFIX = re.compile(r'^Token\s+', re.IGNORECASE)
+_REMINDER_TEXT = re.compile(r'\([^)]*\)')
+
+_intern = sys.intern
+
+
+class TokenRecord:
+    """One raw token printing, as produced by extraction.
+
+    Compact stand-in for the per-printing dict: no instance __dict__,
+    tuples instead of lists, artwork as (set code, url) pairs instead of a
+    dict per entry, and interned strings so reprints share one copy of
+    each name, type, color, P/T, set code and related-card name.
+    """
+
+    __slots__ = ('name', 'type', 'abilities', 'pt', 'colors', 'reverse_related', 'artwork')
+
+    def __init__(self, name: str, type_text: str, abilities: str, pt: str, colors: str,
+                 reverse_related: Iterable[str] = (), artwork: Iterable[Tuple[str, str]] = ()):
+        self.name = _intern(name)
+        self.type = _intern(type_text)
+        self.abilities = _intern(abilities)
+        self.pt = _intern(pt)
+        self.colors = _intern(colors)
+        self.reverse_related = tuple(map(_intern, reverse_related)) if reverse_related else ()
+        self.artwork = tuple([(_intern(set_code), url) for set_code, url in artwork]) if artwork else ()
+
+    @classmethod
+    def from_dict(cls, token: Dict) -> 'TokenRecord':
+        """Record from the dict form (custom tokens, per-set caches)."""
+        return cls(
+            token['name'],
+            token.get('type') or '',
+            token.get('abilities') or '',
+            token.get('pt') or '',
+            token.get('colors') or '',
+            token.get('reverse_related') or (),
+            [(art.get('set', ''), art.get('url', '')) for art in token.get('artwork') or ()],
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'type': self.type,
+            'abilities': self.abilities,
+            'pt': self.pt,
+            'colors': self.colors,
+            'reverse_related': list(self.reverse_related),
+            'artwork': [{'set': set_code, 'url': url} for set_code, url in self.artwork],
+        }
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, TokenRecord):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"TokenRecord({self.name!r}, {self.type!r}, pt={self.pt!r}, colors={self.colors!r})"
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def clean_name(name: str) -> str:
+    """Strip the " Token" suffix and surrounding whitespace."""
+    return _TOKEN_SUFFIX.sub('', name).strip()
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def clean_type(type_text: str) -> str:
+    """Strip the "Token " prefix, which isn't a real Magic type."""
+    return _TOKEN_PREFIX.sub('', type_text).strip()
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def strip_reminder_text(text: str) -> str:
+    """Remove reminder text in parentheses and collapse whitespace/newlines."""
+    if not text:
+        return ''
+    return ' '.join(_REMINDER_TEXT.sub('', text).split())
+
+
+def composite_id(name: str, pt: str, colors: str, type_text: str, abilities: str) -> str:
+    """Dedup key; must stay identical to Dart TokenDefinition.id."""
+    return f"{name}|{pt}|{colors}|{type_text}|{abilities}"
+
+
+def token_id(token: Dict) -> str:
+    """Composite ID of an output token dict."""
+    return composite_id(token['name'], token['pt'], token['colors'], token['type'], token['abilities'])
+
+
+# Filter categories in Dart Category enum order (lib/models/token_definition.dart).
+CATEGORIES = ('myriad', 'creature', 'artifact', 'enchantment', 'emblem', 'dungeon', 'counter', 'other')
+
+
+def token_category(name: str, type_text: str, abilities: str) -> str:
+    """Filter category; must stay identical to Dart TokenDefinition.category."""
+    lower_type = type_text.lower()
+    if 'myriad' in abilities.lower():
+        return 'myriad'
+    for category in ('creature', 'artifact', 'enchantment', 'emblem', 'dungeon'):
+        if category in lower_type:
+            return category
+    if 'counter' in name.lower():
+        return 'counter'
+    return 'other'
+
+
+def build_scryfall_url(scryfall_id: str) -> str:
+    """Build Scryfall CDN image URL from scryfallId."""
+    if not scryfall_id:
+        return ''
+    front = scryfall_id[:2]
+    return f"https://cards.scryfall.io/large/front/{front[0]}/{front[1]}/{scryfall_id}.jpg"
+
+
+def key_hash(token_id: str) -> int:
+    """Fixed-size (64-bit) digest of a composite ID, used as the dedup key.
+
+    blake2b rather than hash() so keys agree across worker processes.
+    """
+    return int.from_bytes(hashlib.blake2b(token_id.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def normalize_fields(name: str, type_text: str, abilities: str, pt: str,
+                     colors: str) -> Optional[Tuple[int, str, Dict]]:
+    """Clean one distinct set of raw fields. Returns (key_hash, composite ID,
+    normalized fields), or None if the name is empty after cleaning."""
+    name = clean_name(name)
+    if not name:
+        return None
+
+    type_text = clean_type(type_text)
+    abilities = strip_reminder_text(abilities)
+    token_id = composite_id(name, pt, colors, type_text, abilities)
+
+    return key_hash(token_id), token_id, {
+        'name': name,
+        'abilities': abilities,
+        'pt': pt,
+        'colors': colors,
+        'type': type_text,
+    }
+
+
+def normalize_records(tokens: Iterable[TokenRecord]) -> Iterator[Optional[Tuple[int, str, Dict]]]:
+    """normalize_fields() for each raw printing, in order.
+
+    Memoized per call on the raw field tuple, so reprints cost one dict
+    lookup and the memo is sized by this build's distinct tokens rather
+    than a global bound. Reprints share the returned fields dict; copy it
+    before changing it.
+    """
+    memo = {}
+    for token in tokens:
+        raw = (token.name, token.type, token.abilities, token.pt, token.colors)
+        try:
+            yield memo[raw]
+        except KeyError:
+            normalized = memo[raw] = normalize_fields(*raw)
+            yield normalized
+
+
+def normalize_token(token: TokenRecord) -> Optional[Tuple[str, Dict]]:
+    """Clean one raw token. Returns (composite ID, normalized fields), or
+    None if the name is empty after cleaning."""
+    normalized = normalize_fields(token.name, token.type, token.abilities, token.pt, token.colors)
+    return None if normalized is None else normalized[1:]
+
+
+def normalize_tokens(tokens: Iterable[TokenRecord]) -> List[Optional[Tuple[str, Dict]]]:
+    """Batch form of normalize_token(), one result per input token."""
+    return [None if n is None else n[1:] for n in normalize_records(tokens)]
+
+
+def check_key(group: Dict, token_id: str) -> None:
+    """Record a group's composite ID, failing loudly on a key_hash collision."""
+    if group['id'] is None:
+        group['id'] = token_id
+    elif group['id'] != token_id:
+        raise ValueError(f"Dedup key collision: {group['id']!r} vs {token_id!r}")
+
+
+def cache_info() -> Dict[str, Tuple[int, int]]:
+    """(hits, misses) per memoized cleaner, for build diagnostics."""
+    return {
+        fn.__name__: (fn.cache_info().hits, fn.cache_info().misses)
+        for fn in (clean_name, clean_type, strip_reminder_text)
+    }
+
+
+def _normalize_inline(token: TokenRecord) -> Optional[Tuple[str, Dict]]:
+    """The pre-module cleaning path (inline re.sub per printing), kept only
+    as the benchmark baseline."""
+    name = re.sub(r'\s*Token\s*$', '', token.name, flags=re.IGNORECASE).strip()
+    if not name:
+        return None
+    type_text = re.sub(r'^Token\s+', '', token.type, flags=re.IGNORECASE).strip()
+    abilities = token.abilities
+    if abilities:
+        abilities = re.sub(r'\([^)]*\)', '', abilities)
+        abilities = ' '.join(abilities.split()).strip()
+    key = f"{name}|{token.pt}|{token.colors}|{type_text}|{abilities}"
+    return key, {
+        'name': name,
+        'abilities': abilities,
+        'pt': token.pt,
+        'colors': token.colors,
+        'type': type_text,
+    }
+
+
+def _benchmark_printings(database_path: str, reprints: int) -> List[TokenRecord]:
+    """Raw-looking printings rebuilt from the shipped database, each token
+    repeated `reprints` times as AllPrintings reprints are."""
+    import json
+
+    with open(database_path, 'r', encoding='utf-8') as f:
+        tokens = json.load(f)
+
+    printings = []
+    for _ in range(reprints):
+        for t in tokens:
+            abilities = t['abilities']
+            if abilities:
+                abilities += " (This is reminder text.)"
+            printings.append(TokenRecord(
+                f"{t['name']} Token", f"Token {t['type']}", abilities, t['pt'], t['colors']))
+    return printings
+
+
+def main():
+    """Micro-benchmark: per-token cost of inline re.sub vs memoized cleaning."""
+    import os
+
+    database_path = os.path.join(
+        os.path.dirname(__file__), "..", "..", "assets", "token_database.json")
+    printings = _benchmark_printings(os.path.normpath(database_path), reprints=8)
+    print(f"Normalizing {len(printings)} synthetic printings")
+
+    start = time.perf_counter()
+    before = [_normalize_inline(t) for t in printings]
+    inline_s = time.perf_counter() - start
+
+    for fn in (clean_name, clean_type, strip_reminder_text):
+        fn.cache_clear()
+    start = time.perf_counter()
+    after = normalize_tokens(printings)
+    memo_s = time.perf_counter() - start
+
+    if before != after:
+        raise AssertionError("Memoized normalization diverged from the inline path")
+
+    per_before = inline_s / len(printings) * 1e6
+    per_after = memo_s / len(printings) * 1e6
+    print(f"  inline re.sub: {per_before:6.2f} µs/token ({inline_s * 1000:.1f}ms total)")
+    print(f"  memoized:      {per_after:6.2f} µs/token ({memo_s * 1000:.1f}ms total)")
+    print(f"  speedup:       {per_before / per_after:.1f}x")
+    for name, (hits, misses) in cache_info().items():
+        print(f"  {name}: {hits} hits, {misses} misses")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Card → token reverse index, shipped next to token_database.json.
+
+Decklist import maps a card name to the tokens that card creates. The app
+used to rebuild that map on every load by walking every token's
+reverse_related list. The pipeline already has the relation, so it writes
+the inverse once:
+
+    {
+      "format": 1,
+      "database_sha256": "...",          # the database the indexes refer to
+      "tokens": 942,                     # token count of that database
+      "cards": ["academy manufactor", ...],   # lowercase card names, sorted
+      "postings": [[12, 407], [3], ...]       # token indexes per card, ascending
+    }
+
+`cards` and `postings` are parallel arrays. A token index is a position in
+token_database.json, which is in canonical order. Keys are lowercased to
+match the app's case-insensitive lookup. A card is found by binary search
+on `cards`, or by loading the arrays straight into a map.
+
+check_reverse_index() proves the index is exactly the inverse of the
+forward lists, and write_reverse_index() runs it against the written
+database before returning.
+"""
+
+import hashlib
+import json
+import os
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, List
+
+REVERSE_INDEX_FORMAT = 1
+
+
+def build_reverse_index(tokens: List[Dict]) -> Dict:
+    """Inverse of the tokens' reverse_related lists."""
+    index = defaultdict(set)
+    for i, token in enumerate(tokens):
+        for card in token.get('reverse_related', ()):
+            index[card.lower()].add(i)
+    cards = sorted(index)
+    return {
+        'format': REVERSE_INDEX_FORMAT,
+        'tokens': len(tokens),
+        'cards': cards,
+        'postings': [sorted(index[card]) for card in cards],
+    }
+
+
+def dumps_reverse_index(index: Dict) -> str:
+    """Minified JSON text."""
+    return json.dumps(index, ensure_ascii=False, separators=(',', ':'))
+
+
+def lookup(index: Dict, card_name: str) -> List[int]:
+    """Token indexes for a card name (case-insensitive)."""
+    key = card_name.lower()
+    cards = index['cards']
+    i = bisect_left(cards, key)
+    if i < len(cards) and cards[i] == key:
+        return index['postings'][i]
+    return []
+
+
+def check_reverse_index(index: Dict, tokens: List[Dict]) -> None:
+    """Raise AssertionError unless `index` is exactly the inverse of the
+    tokens' forward reverse_related lists."""
+    if index.get('format') != REVERSE_INDEX_FORMAT:
+        raise AssertionError(f"Unsupported reverse index format: {index.get('format')!r}")
+    if index['tokens'] != len(tokens):
+        raise AssertionError(f"Reverse index covers {index['tokens']} tokens, database has {len(tokens)}")
+    cards, postings = index['cards'], index['postings']
+    if len(cards) != len(postings):
+        raise AssertionError("Reverse index cards and postings differ in length")
+    if any(a >= b for a, b in zip(cards, cards[1:])):
+        raise AssertionError("Reverse index cards are not sorted and unique")
+
+    inverted = defaultdict(set)
+    for card, posting in zip(cards, postings):
+        if not posting or any(a >= b for a, b in zip(posting, posting[1:])):
+            raise AssertionError(f"Postings for {card!r} are empty or not ascending")
+        if posting[0] < 0 or posting[-1] >= len(tokens):
+            raise AssertionError(f"Postings for {card!r} point outside the database")
+        for i in posting:
+            inverted[i].add(card)
+    for i, token in enumerate(tokens):
+        forward = {card.lower() for card in token.get('reverse_related', ())}
+        if forward != inverted.get(i, set()):
+            raise AssertionError(f"Reverse index disagrees with the forward list of token {i} "
+                                 f"({token['name']!r})")
+
+
+def write_reverse_index(tokens: List[Dict], output_path: str, database_path: str) -> None:
+    """Write the card -> token postings for `tokens`, tied by sha256 to the
+    database file at `database_path`, and report size and how loading them
+    compares with rebuilding the map from the reverse_related lists."""
+    with open(database_path, 'rb') as f:
+        database = f.read()
+    index = build_reverse_index(tokens)
+    index['database_sha256'] = hashlib.sha256(database).hexdigest()
+    text = dumps_reverse_index(index)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+    # Postings are token positions, so check them against the order of the
+    # tokens in the published file.
+    database_tokens = json.loads(database)
+    start = time.perf_counter()
+    loaded = json.loads(text)
+    load_s = time.perf_counter() - start
+    check_reverse_index(loaded, database_tokens)
+
+    start = time.perf_counter()
+    rebuilt = defaultdict(list)
+    for token in database_tokens:
+        for card in token.get('reverse_related', ()):
+            rebuilt[card.lower()].append(token)
+    rebuild_s = time.perf_counter() - start
+
+    postings = sum(len(p) for p in index['postings'])
+    print(f"Saved reverse index to {output_path} ({len(index['cards'])} cards, "
+          f"{postings} links, {len(text.encode('utf-8')) / 1024:.0f}KB; consistency verified)")
+    print(f"  load {load_s * 1000:.1f}ms vs {rebuild_s * 1000:.1f}ms to rebuild from the "
+          f"forward lists (after decoding the database)")
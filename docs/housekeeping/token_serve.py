@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+Local token-update server, for testing the in-app update flow without
+publishing.
+
+TokenUpdateService fetches `$_rawBase/assets/token_manifest.json`, then
+the database it names. This serves the same layout from a local build:
+
+    /assets/token_manifest.json
+    /assets/token_database.json
+    /assets/<path>                 every artifact listed in the manifest
+
+Nothing else under assets/ is reachable. The manifest is re-read whenever
+it changes on disk, so a rebuild in another terminal is picked up without
+a restart. Each file is read and hashed once per change on disk:
+
+- ETag is the file's sha256, so If-None-Match answers 304 until the
+  content changes. Compressed variants get their own tag ("<sha>-gzip").
+- Accept-Encoding picks gzip, or brotli when the `brotli` module is
+  installed. Variants are compressed once and only served when smaller.
+- A single `Range: bytes=...` gets a 206 of the uncompressed file (416 if
+  it can't be satisfied); If-Range is honoured. Multi-range requests get
+  the whole file.
+- Requests are handled on one thread each, with HTTP/1.1 keep-alive.
+
+Every request is logged with its status, encoding, bytes sent and
+latency. On exit a per-file report compares the bytes sent with what
+plain full downloads would have cost.
+
+Usage:
+    python3 docs/housekeeping/token_serve.py
+    python3 docs/housekeeping/token_serve.py --host 0.0.0.0 --port 8787 --report serve.json
+    python3 docs/housekeeping/process_tokens_mtgjson.py --serve
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import unquote, urlsplit
+
+try:
+    import brotli
+except ImportError:  # optional; gzip covers every client
+    brotli = None
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8787
+URL_PREFIX = '/assets/'
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "assets", "token_manifest.json")
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_CONTENT_TYPES = {
+    '.json': 'application/json; charset=utf-8',
+    '.ndjson': 'application/x-ndjson; charset=utf-8',
+    '.sqlite': 'application/vnd.sqlite3',
+}
+
+
+def _compressors() -> Dict[str, Callable[[bytes], bytes]]:
+    compressors = {'gzip': lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressors['br'] = lambda data: brotli.compress(data, quality=11)
+    return compressors
+
+
+class ServedFile:
+    """One file's bytes, sha256 and compressed variants, as of (mtime, size)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.content_type = _CONTENT_TYPES.get(os.path.splitext(path)[1], 'application/octet-stream')
+        self.stamp = _stat_stamp(path)
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        self.sha256 = hashlib.sha256(self.data).hexdigest()
+        self.variants = {'identity': self.data}
+        for encoding, compress in _compressors().items():
+            packed = compress(self.data)
+            if len(packed) < len(self.data):
+                self.variants[encoding] = packed
+
+    def etag(self, encoding: str = 'identity') -> str:
+        suffix = '' if encoding == 'identity' else f'-{encoding}'
+        return f'"{self.sha256}{suffix}"'
+
+
+def _stat_stamp(path: str) -> Tuple[int, int]:
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+class Catalog:
+    """URL path -> ServedFile for the manifest, the database and the
+    manifest's artifacts; reloads whatever changed on disk."""
+
+    def __init__(self, manifest_path: str, database_path: Optional[str] = None):
+        self.manifest_path = os.path.normpath(manifest_path)
+        self.root = os.path.dirname(self.manifest_path)
+        self.database_path = os.path.normpath(
+            database_path or os.path.join(self.root, 'token_database.json'))
+        self._lock = threading.Lock()
+        self._manifest_stamp = None
+        self._paths = {}
+        self._files = {}
+
+    def _url(self, path: str) -> str:
+        return URL_PREFIX + os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def _reload_manifest(self) -> None:
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        paths = {self._url(self.manifest_path): self.manifest_path,
+                 self._url(self.database_path): self.database_path}
+        for artifact in manifest.get('artifacts', {}).values():
+            path = os.path.normpath(os.path.join(self.root, artifact['path']))
+            paths[self._url(path)] = path
+        self._paths = paths
+
+    def urls(self) -> List[str]:
+        with self._lock:
+            self._refresh_manifest()
+            return sorted(self._paths)
+
+    def _refresh_manifest(self) -> None:
+        stamp = _stat_stamp(self.manifest_path)
+        if stamp != self._manifest_stamp:
+            self._reload_manifest()
+            self._manifest_stamp = stamp
+
+    def lookup(self, url_path: str) -> Optional[ServedFile]:
+        """The current ServedFile for `url_path`, or None if it isn't published."""
+        url_path = posixpath.normpath(unquote(url_path))
+        with self._lock:
+            self._refresh_manifest()
+            path = self._paths.get(url_path)
+            if path is None or not os.path.isfile(path):
+                return None
+            served = self._files.get(path)
+            if served is None or served.stamp != _stat_stamp(path):
+                served = self._files[path] = ServedFile(path)
+            return served
+
+
+def negotiate(accept_encoding: str, available) -> str:
+    """Best content coding of `available` for an Accept-Encoding header;
+    brotli wins ties with gzip."""
+    preference = {'br': 2, 'gzip': 1}
+    best, best_key = 'identity', (0.0, 0)
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if coding not in available or coding == 'identity':
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                continue
+        key = (q, preference.get(coding, 0))
+        if q > 0 and key > best_key:
+            best, best_key = coding, key
+    return best
+
+
+def parse_range(header: str, length: int) -> Union[None, str, Tuple[int, int]]:
+    """(first, last) byte positions for a single-range header; 'unsatisfiable'
+    for a range past the end; None to ignore it (malformed or multi-range)."""
+    m = _RANGE.match(header.strip())
+    if not m or not (m.group(1) or m.group(2)):
+        return None
+    if length == 0:
+        return 'unsatisfiable'
+    first, last = m.group(1), m.group(2)
+    if not first:
+        # Suffix range: the last N bytes.
+        count = int(last)
+        if count == 0:
+            return 'unsatisfiable'
+        return max(0, length - count), length - 1
+    first = int(first)
+    last = min(int(last), length - 1) if last else length - 1
+    if first > last:
+        return None if m.group(2) and int(m.group(2)) < first else 'unsatisfiable'
+    return first, last
+
+
+def _tags(header: str) -> List[str]:
+    # If-None-Match uses weak comparison, so W/ prefixes are dropped.
+    return [t.strip()[2:] if t.strip().startswith('W/') else t.strip() for t in header.split(',')]
+
+
+class ServeStats:
+    """Per-request records, shared by the handler threads."""
+
+    def __init__(self, quiet: bool = False):
+        self.quiet = quiet
+        self._lock = threading.Lock()
+        self.records = []
+        self.started = time.time()
+
+    def record(self, method: str, path: str, status: int, encoding: str,
+               sent: int, full: int, latency: float, client: str) -> None:
+        entry = {'method': method, 'path': path, 'status': status, 'encoding': encoding,
+                 'bytes': sent, 'full_bytes': full, 'latency_ms': round(latency * 1000, 3)}
+        with self._lock:
+            self.records.append(entry)
+            if not self.quiet:
+                print(f"{client} {method} {path} {status} {encoding} "
+                      f"{sent}/{full}B {latency * 1000:.1f}ms", flush=True)
+
+    def summary(self) -> Dict:
+        """Per-path totals: statuses, bytes sent vs plain full GETs, latency percentiles."""
+        with self._lock:
+            records = list(self.records)
+        by_path = defaultdict(list)
+        for r in records:
+            by_path[r['path']].append(r)
+        paths = {}
+        for path, rs in sorted(by_path.items()):
+            latencies = sorted(r['latency_ms'] for r in rs)
+            statuses = defaultdict(int)
+            encodings = defaultdict(int)
+            for r in rs:
+                statuses[str(r['status'])] += 1
+                encodings[r['encoding']] += 1
+            paths[path] = {
+                'requests': len(rs),
+                'statuses': dict(sorted(statuses.items())),
+                'encodings': dict(sorted(encodings.items())),
+                'bytes': sum(r['bytes'] for r in rs),
+                'full_bytes': sum(r['full_bytes'] for r in rs),
+                'latency_ms': {
+                    'p50': latencies[len(latencies) // 2],
+                    'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                    'max': latencies[-1],
+                },
+            }
+        return {
+            'requests': len(records),
+            'seconds': round(time.time() - self.started, 3),
+            'bytes': sum(p['bytes'] for p in paths.values()),
+            'full_bytes': sum(p['full_bytes'] for p in paths.values()),
+            'paths': paths,
+        }
+
+
+def print_report(summary: Dict) -> None:
+    print(f"\n=== Serve report: {summary['requests']} requests in {summary['seconds']:.1f}s ===")
+    for path, p in summary['paths'].items():
+        statuses = ' '.join(f"{k}x{v}" for k, v in p['statuses'].items())
+        lat = p['latency_ms']
+        sent = f"{p['bytes'] / 1024:.1f}KB sent"
+        if p['full_bytes']:
+            sent += (f" of {p['full_bytes'] / 1024:.1f}KB as plain GETs "
+                     f"({1 - p['bytes'] / p['full_bytes']:.0%} saved)")
+        print(f"  {path}")
+        print(f"    {p['requests']} requests ({statuses}), {sent}; "
+              f"latency p50 {lat['p50']:.1f}ms p95 {lat['p95']:.1f}ms max {lat['max']:.1f}ms")
+    if summary['full_bytes']:
+        print(f"  Total: {summary['bytes'] / 1024:.1f}KB sent of {summary['full_bytes'] / 1024:.1f}KB "
+              f"({1 - summary['bytes'] / summary['full_bytes']:.0%} saved)")
+
+
+class TokenRequestHandler(BaseHTTPRequestHandler):
+    """GET/HEAD for catalog files; the server carries `catalog` and `stats`."""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'TokenServe/1'
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def log_message(self, format, *args):
+        pass  # ServeStats logs each request with its bytes and latency
+
+    def _serve(self, head: bool) -> None:
+        start = time.perf_counter()
+        path = urlsplit(self.path).path
+        served = self.server.catalog.lookup(path)
+        if served is None:
+            body = b'Not found\n'
+            self.send_response(404)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if not head:
+                self.wfile.write(body)
+            self._record(path, 404, 'identity', 0 if head else len(body), 0, start)
+            return
+
+        full = len(served.data)
+        byte_range = None
+        range_header = self.headers.get('Range')
+        if range_header:
+            if_range = self.headers.get('If-Range')
+            if if_range is None or if_range.strip() == served.etag():
+                byte_range = parse_range(range_header, full)
+
+        # Ranges are served from the uncompressed file, so offsets mean the
+        # same thing to every client.
+        if byte_range is None:
+            encoding = negotiate(self.headers.get('Accept-Encoding', ''), served.variants)
+        else:
+            encoding = 'identity'
+        etag = served.etag(encoding)
+
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = _tags(if_none_match)
+            if '*' in tags or etag in tags:
+                self.send_response(304)
+                self._common_headers(etag)
+                self.end_headers()
+                self._record(path, 304, encoding, 0, 0 if head else full, start)
+                return
+
+        body = served.variants[encoding]
+        if byte_range == 'unsatisfiable':
+            self.send_response(416)
+            self._common_headers(etag)
+            self.send_header('Content-Range', f'bytes */{full}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            self._record(path, 416, encoding, 0, 0, start)
+            return
+        if byte_range is not None:
+            first, last = byte_range
+            body = body[first:last + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {first}-{last}/{full}')
+            full = len(body)
+        else:
+            self.send_response(200)
+        self._common_headers(etag)
+        self.send_header('Content-Type', served.content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding != 'identity':
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+        if head:
+            self._record(path, 206 if byte_range else 200, encoding, 0, 0, start)
+        else:
+            self._record(path, 206 if byte_range else 200, encoding, len(body), full, start)
+
+    def _common_headers(self, etag: str) -> None:
+        self.send_header('ETag', etag)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Accept-Ranges', 'bytes')
+        # Always revalidate: a rebuild changes the files behind the same URLs.
+        self.send_header('Cache-Control', 'no-cache')
+
+    def _record(self, path: str, status: int, encoding: str, sent: int, full: int, start: float) -> None:
+        # `full` is what the same request would have sent without
+        # conditional GET or compression: the uncompressed file or range.
+        self.server.stats.record(self.command, path, status, encoding, sent, full,
+                                 time.perf_counter() - start, self.client_address[0])
+
+
+def make_server(manifest_path: str, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                database_path: Optional[str] = None, quiet: bool = False) -> ThreadingHTTPServer:
+    """A threaded server for the build at `manifest_path` (port 0 picks a free one)."""
+    server = ThreadingHTTPServer((host, port), TokenRequestHandler)
+    server.daemon_threads = True
+    server.catalog = Catalog(manifest_path, database_path)
+    server.stats = ServeStats(quiet)
+    return server
+
+
+def serve(manifest_path: str, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+          database_path: Optional[str] = None, duration: Optional[float] = None,
+          report_path: Optional[str] = None, quiet: bool = False) -> Dict:
+    """Serve until Ctrl-C (or for `duration` seconds), then print the
+    report and optionally save it as JSON. Returns the report."""
+    server = make_server(manifest_path, host, port, database_path, quiet)
+    host, port = server.server_address[:2]
+    urls = server.catalog.urls()
+    print(f"Serving {len(urls)} files from {server.catalog.root} on http://{host}:{port}"
+          f" (encodings: {', '.join(['identity', *_compressors()])})")
+    for url in urls:
+        print(f"  http://{host}:{port}{url}")
+    print(f"Point RemoteUrls._rawBase at http://{host}:{port} to test app updates; Ctrl-C to stop")
+
+    if duration is not None:
+        threading.Timer(duration, server.shutdown).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    summary = server.stats.summary()
+    print_report(summary)
+    if report_path:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+            f.write('\n')
+        print(f"Saved serve report to {report_path}")
+    return summary
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command-line options."""
+    parser = argparse.ArgumentParser(
+        description="Serve the built token manifest, database and artifacts locally.")
+    parser.add_argument('--manifest', default=MANIFEST_PATH,
+                        help="Manifest to serve (default assets/token_manifest.json)")
+    parser.add_argument('--database', default=None,
+                        help="Database path (default token_database.json next to the manifest)")
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help=f"Address to bind (default {DEFAULT_HOST}; 0.0.0.0 for devices on the LAN)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help=f"Port (default {DEFAULT_PORT})")
+    parser.add_argument('--duration', type=float, default=None, metavar='SECONDS',
+                        help="Stop after this many seconds instead of waiting for Ctrl-C")
+    parser.add_argument('--report', default=None,
+                        help="Also save the request report as JSON")
+    parser.add_argument('--quiet', action='store_true',
+                        help="Don't log each request (the report is still printed)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Main execution."""
+    args = parse_args(argv)
+    serve(args.manifest, args.host, args.port, args.database, args.duration, args.report, args.quiet)
+
+
+if __name__ == "__main__":
+    main()
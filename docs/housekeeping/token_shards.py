@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Popularity-first shards of token_database.json.
+
+The app decodes the whole database before the search screen can show
+anything. Sharded output lets a client load a small hot shard first and
+fetch the long tail lazily:
+
+    assets/token_db_shards/shard-0.json   the HOT_SHARD_TOKENS most popular tokens
+    assets/token_db_shards/shard-1.json   the rest, most popular first, split
+    ...                                   into near-equal shards
+
+Tokens are ranked by popularity (highest first, ties in canonical order)
+and cut into contiguous slices, so no shard holds a token more popular
+than any token in the shard before it. Each shard is an ordinary
+token_database.json array (canonical order, same formatting), so the
+existing parser reads any shard unchanged. Every shard is listed in the
+manifest with its own sha256 and size, plus its index, token count and
+popularity range. Shards that would be empty (fewer tokens than shards
+to fill) are not written, so a small database gets fewer shards.
+
+write_shards() checks that the shards reassemble into the monolithic
+database: concatenated and serialized with dumps_database(), they must
+reproduce token_database.json byte-for-byte.
+"""
+
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+from token_io import canonical_key, dumps_database
+
+SHARD_FORMAT = 1
+HOT_SHARD_TOKENS = 200
+
+_SHARD_FILE = re.compile(r'^shard-\d+\.json$')
+
+
+def rank_tokens(tokens: List[Dict]) -> List[Dict]:
+    """Tokens by popularity, highest first; ties in canonical order."""
+    return sorted(tokens, key=lambda t: (-t['popularity'], canonical_key(t)))
+
+
+def split_shards(tokens: List[Dict], count: int, hot_size: Optional[int] = None) -> List[List[Dict]]:
+    """`tokens` cut into at most `count` shards: the hot shard, then the
+    tail in near-equal parts. Empty tail parts are left out."""
+    if count < 2:
+        raise ValueError(f"Need at least 2 shards, got {count}")
+    if hot_size is None:
+        hot_size = HOT_SHARD_TOKENS
+    ranked = rank_tokens(tokens)
+    shards = [ranked[:hot_size]]
+    tail = ranked[hot_size:]
+    parts = count - 1
+    for i in range(parts):
+        shard = tail[len(tail) * i // parts:len(tail) * (i + 1) // parts]
+        if shard:
+            shards.append(shard)
+    return shards
+
+
+def reassemble(paths: List[str]) -> bytes:
+    """The monolithic database bytes rebuilt from shard files."""
+    tokens = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            tokens.extend(json.load(f))
+    return dumps_database(tokens).encode('utf-8')
+
+
+def write_shards(tokens: List[Dict], shard_dir: str, count: int, database_path: str,
+                 hot_size: Optional[int] = None) -> List[Dict]:
+    """Write up to `count` shards of `tokens`, verify they reassemble into the
+    database at `database_path`, and report sizes and decode times.
+
+    Prunes shard files left over from a larger `count`. Returns one entry
+    per shard ({'path', 'index', 'tokens', 'min_popularity',
+    'max_popularity'}) for the manifest.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    entries = []
+    for index, shard in enumerate(split_shards(tokens, count, hot_size)):
+        path = os.path.join(shard_dir, f"shard-{index}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(dumps_database(shard))
+        popularity = [t['popularity'] for t in shard]
+        entries.append({
+            'path': path,
+            'index': index,
+            'tokens': len(shard),
+            'min_popularity': min(popularity, default=None),
+            'max_popularity': max(popularity, default=None),
+        })
+
+    wanted = {os.path.basename(e['path']) for e in entries}
+    for name in os.listdir(shard_dir):
+        if _SHARD_FILE.match(name) and name not in wanted:
+            os.remove(os.path.join(shard_dir, name))
+
+    # Reassembly check: all shards together must be the monolithic database.
+    with open(database_path, 'rb') as f:
+        database = f.read()
+    if reassemble([e['path'] for e in entries]) != database:
+        raise AssertionError(f"Shards in {shard_dir} do not reassemble into {database_path}")
+    if sum(e['tokens'] for e in entries) != len(tokens):
+        raise AssertionError(f"Shards in {shard_dir} do not hold every token exactly once")
+
+    hot_path = entries[0]['path']
+    with open(hot_path, 'r', encoding='utf-8') as f:
+        hot_text = f.read()
+    start = time.perf_counter()
+    json.loads(hot_text)
+    hot_s = time.perf_counter() - start
+    start = time.perf_counter()
+    json.loads(database)
+    full_s = time.perf_counter() - start
+
+    print(f"Saved {len(entries)} shards to {shard_dir} (reassembly verified)")
+    for e in entries:
+        size = os.path.getsize(e['path'])
+        print(f"  shard {e['index']}: {e['tokens']:5d} tokens, popularity "
+              f"{e['min_popularity']}..{e['max_popularity']}, {size / 1024:.0f}KB")
+    print(f"  hot shard: {len(hot_text.encode('utf-8')) / len(database):.0%} of the database, "
+          f"decode {hot_s * 1000:.1f}ms vs {full_s * 1000:.1f}ms for the whole file")
+    return entries
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+SQLite + FTS5 copy of token_database.json, for indexed queries.
+
+Search in the app scans every token on each keystroke, and answering a
+question about the database from a script means decoding the whole JSON
+file. The pipeline also writes the same tokens as a SQLite database:
+
+    tokens           id (position in token_database.json), name, abilities,
+                     pt, colors, type, category, popularity, and the
+                     token_facets masks
+    artwork          token_id, position, set_code, url
+    reverse_related  token_id, card
+    tokens_fts       FTS5 over name, type and abilities (external content:
+                     rows are read from `tokens`, not stored twice)
+    meta             format, token count, sha256 of the source database
+
+Colors, category and popularity have B-tree indexes. Names have a NOCASE
+index, so a name-prefix LIKE is a range scan. Category is
+token_category(), which mirrors the app's TokenDefinition.category.
+
+Everything is inserted in one transaction, in the database's canonical
+order, with a fixed page size. The FTS index is then merged into a single
+segment and the file vacuumed. The same tokens therefore produce the
+same bytes with the same SQLite version. write_sqlite() reads the file
+back and checks it against the written JSON before returning.
+
+query_tokens() and tokens_for_card() are the query helpers; results come
+back in the app's order (popularity, then name). benchmark_queries() times
+prefix, full-text and faceted queries against a linear scan of the
+decoded JSON.
+
+Usage (query a built database):
+    python3 docs/housekeeping/token_sqlite.py goblin
+    python3 docs/housekeeping/token_sqlite.py --prefix gob --colors R --category creature
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+from token_instrument import median_ms
+from token_normalize import token_category
+
+SQLITE_FORMAT = 1
+PAGE_SIZE = 4096
+SQLITE_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "assets", "token_database.sqlite")
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID;
+CREATE TABLE tokens (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL COLLATE NOCASE,
+    abilities TEXT NOT NULL,
+    pt TEXT NOT NULL,
+    colors TEXT NOT NULL,
+    type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    popularity INTEGER NOT NULL,
+    color_mask INTEGER NOT NULL,
+    type_mask INTEGER NOT NULL,
+    keyword_mask INTEGER NOT NULL
+);
+CREATE TABLE artwork (
+    token_id INTEGER NOT NULL REFERENCES tokens(id),
+    position INTEGER NOT NULL,
+    set_code TEXT NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (token_id, position)
+) WITHOUT ROWID;
+CREATE TABLE reverse_related (
+    token_id INTEGER NOT NULL REFERENCES tokens(id),
+    card TEXT NOT NULL,
+    PRIMARY KEY (token_id, card)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE tokens_fts USING fts5(
+    name, type, abilities,
+    content='tokens', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+"""
+
+# Created after the bulk insert, so each is built once from sorted keys.
+_INDEXES = """
+CREATE INDEX tokens_name ON tokens(name);
+CREATE INDEX tokens_colors ON tokens(colors, popularity DESC);
+CREATE INDEX tokens_category ON tokens(category, popularity DESC);
+CREATE INDEX tokens_popularity ON tokens(popularity DESC, name COLLATE BINARY);
+CREATE INDEX reverse_related_card ON reverse_related(card COLLATE NOCASE);
+"""
+
+_WORD = re.compile(r'\w+')
+_COLUMNS = ('id', 'name', 'abilities', 'pt', 'colors', 'type', 'category', 'popularity',
+            'color_mask', 'type_mask', 'keyword_mask')
+
+
+def build_sqlite(tokens: List[Dict], path: str, database_sha256: str) -> None:
+    """Write `tokens` (in canonical order) to a fresh SQLite file at `path`."""
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.execute(f"PRAGMA page_size = {PAGE_SIZE}")
+        conn.execute(f"PRAGMA user_version = {SQLITE_FORMAT}")
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("BEGIN")
+        for statement in _SCHEMA.split(';'):
+            if statement.strip():
+                conn.execute(statement)
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ('format', str(SQLITE_FORMAT)),
+            ('tokens', str(len(tokens))),
+            ('database_sha256', database_sha256),
+        ])
+        conn.executemany(
+            "INSERT INTO tokens VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((i, t['name'], t['abilities'], t['pt'], t['colors'], t['type'],
+              token_category(t['name'], t['type'], t['abilities']), t['popularity'],
+              t['color_mask'], t['type_mask'], t['keyword_mask'])
+             for i, t in enumerate(tokens)))
+        conn.executemany(
+            "INSERT INTO artwork VALUES (?, ?, ?, ?)",
+            ((i, position, art['set'], art['url'])
+             for i, t in enumerate(tokens) for position, art in enumerate(t['artwork'])))
+        conn.executemany(
+            "INSERT INTO reverse_related VALUES (?, ?)",
+            ((i, card) for i, t in enumerate(tokens) for card in t.get('reverse_related', ())))
+        for statement in _INDEXES.split(';'):
+            if statement.strip():
+                conn.execute(statement)
+        conn.execute("INSERT INTO tokens_fts(tokens_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO tokens_fts(tokens_fts) VALUES ('optimize')")
+        # Raises sqlite3.DatabaseError if the index doesn't match `tokens`.
+        conn.execute("INSERT INTO tokens_fts(tokens_fts, rank) VALUES ('integrity-check', 1)")
+        conn.execute("COMMIT")
+        conn.execute("ANALYZE")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Read-only connection whose rows behave like dicts."""
+    conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def fts_query(text: str) -> str:
+    """FTS5 query matching every word of `text` as a prefix (so partial
+    words match while typing); '' if it has no words."""
+    return ' '.join(f'"{word}"*' for word in _WORD.findall(text.lower()))
+
+
+def query_tokens(conn: sqlite3.Connection, text: Optional[str] = None, prefix: Optional[str] = None,
+                 colors: Optional[str] = None, category: Optional[str] = None,
+                 limit: Optional[int] = None) -> List[Dict]:
+    """Tokens matching every given filter, most popular first, then by name.
+
+    `text` is a full-text query over name, type and abilities; `prefix`
+    matches the start of the name (case-insensitive); `colors` is an exact
+    WUBRG string ('' or 'C' for colorless); `category` is one of
+    token_normalize.CATEGORIES.
+    """
+    where, params = [], []
+    if text:
+        match = fts_query(text)
+        if match:
+            where.append("t.id IN (SELECT rowid FROM tokens_fts WHERE tokens_fts MATCH ?)")
+            params.append(match)
+    if prefix:
+        escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        where.append("t.name LIKE ? ESCAPE '\\'")
+        params.append(escaped + '%')
+    if colors is not None:
+        where.append("t.colors = ?")
+        params.append('' if colors == 'C' else colors)
+    if category is not None:
+        where.append("t.category = ?")
+        params.append(category)
+    sql = f"SELECT {', '.join('t.' + c for c in _COLUMNS)} FROM tokens t"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY t.popularity DESC, t.name COLLATE BINARY"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return [dict(row) for row in conn.execute(sql, params)]
+
+
+def tokens_for_card(conn: sqlite3.Connection, card_name: str) -> List[Dict]:
+    """Tokens a card creates (case-insensitive card name)."""
+    sql = (f"SELECT {', '.join('t.' + c for c in _COLUMNS)} FROM reverse_related r "
+           "JOIN tokens t ON t.id = r.token_id WHERE r.card = ? COLLATE NOCASE "
+           "ORDER BY t.popularity DESC, t.name COLLATE BINARY")
+    return [dict(row) for row in conn.execute(sql, (card_name,))]
+
+
+def read_tokens(conn: sqlite3.Connection) -> List[Dict]:
+    """Every token as a database dict (artwork and reverse_related included)."""
+    tokens = [{'name': r['name'], 'abilities': r['abilities'], 'pt': r['pt'], 'colors': r['colors'],
+               'type': r['type'], 'popularity': r['popularity'], 'color_mask': r['color_mask'],
+               'type_mask': r['type_mask'], 'keyword_mask': r['keyword_mask'],
+               'artwork': [], 'reverse_related': []}
+              for r in conn.execute("SELECT * FROM tokens ORDER BY id")]
+    for r in conn.execute("SELECT token_id, set_code, url FROM artwork ORDER BY token_id, position"):
+        tokens[r['token_id']]['artwork'].append({'set': r['set_code'], 'url': r['url']})
+    for r in conn.execute("SELECT token_id, card FROM reverse_related ORDER BY token_id, card"):
+        tokens[r['token_id']]['reverse_related'].append(r['card'])
+    return tokens
+
+
+def check_sqlite(path: str, tokens: List[Dict], database_sha256: str) -> None:
+    """Raise AssertionError unless the SQLite file at `path` holds exactly
+    `tokens`. (build_sqlite() already ran FTS5's own integrity check.)"""
+    conn = connect(path)
+    try:
+        meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        if meta.get('format') != str(SQLITE_FORMAT) or meta.get('database_sha256') != database_sha256:
+            raise AssertionError(f"{path} was not built from this database (meta {meta!r})")
+        stored = read_tokens(conn)
+        if len(stored) != len(tokens):
+            raise AssertionError(f"{path} holds {len(stored)} tokens, database has {len(tokens)}")
+        for i, (row, token) in enumerate(zip(stored, tokens)):
+            expected = {**token, 'reverse_related': sorted(token.get('reverse_related', ()))}
+            if row != expected:
+                raise AssertionError(f"{path} disagrees with the database at token {i} ({token['name']!r})")
+    finally:
+        conn.close()
+
+
+def _scan(tokens: List[Dict], keep) -> List[Dict]:
+    # What the app does today: test every token, then sort the matches.
+    matched = [t for t in tokens if keep(t)]
+    matched.sort(key=lambda t: (-t['popularity'], t['name']))
+    return matched
+
+
+def benchmark_queries(path: str, tokens: List[Dict], repeat: int = 20) -> Dict[str, Dict]:
+    """Median latency of prefix, full-text and faceted queries, against a
+    linear scan of the decoded tokens. Query terms come from the most
+    popular token, so every query has results."""
+    top = max(tokens, key=lambda t: t['popularity'])
+    prefix = top['name'][:3]
+    words = _WORD.findall(top['abilities'].lower()) or _WORD.findall(top['name'].lower())
+    word = max(words, key=len)
+    colors = top['colors']
+    category = token_category(top['name'], top['type'], top['abilities'])
+
+    def text_match(t):
+        return any(word in t[f].lower() for f in ('name', 'abilities', 'pt', 'type'))
+
+    cases = {
+        'prefix': (dict(prefix=prefix), lambda t: t['name'].lower().startswith(prefix.lower())),
+        'full_text': (dict(text=word), text_match),
+        'faceted': (dict(colors=colors, category=category),
+                    lambda t: t['colors'] == colors
+                    and token_category(t['name'], t['type'], t['abilities']) == category),
+        'text_and_facets': (dict(text=word, colors=colors, category=category),
+                            lambda t: text_match(t) and t['colors'] == colors
+                            and token_category(t['name'], t['type'], t['abilities']) == category),
+    }
+    results = {}
+    conn = connect(path)
+    try:
+        for name, (filters, keep) in cases.items():
+            rows = query_tokens(conn, **filters)
+            results[name] = {
+                'query': filters,
+                'rows': len(rows),
+                'scan_rows': len(_scan(tokens, keep)),
+                'sqlite_ms': round(median_ms(lambda: query_tokens(conn, **filters), repeat), 3),
+                'scan_ms': round(median_ms(lambda: _scan(tokens, keep), repeat), 3),
+            }
+    finally:
+        conn.close()
+    return results
+
+
+def print_benchmark(results: Dict[str, Dict]) -> None:
+    for name, r in results.items():
+        speedup = r['scan_ms'] / r['sqlite_ms'] if r['sqlite_ms'] else float('inf')
+        print(f"  {name:16s} {r['rows']:6d} rows  sqlite {r['sqlite_ms']:7.2f}ms  "
+              f"scan {r['scan_ms']:7.2f}ms  ({speedup:.1f}x)")
+
+
+def write_sqlite(tokens: List[Dict], output_path: str, database_path: str) -> None:
+    """Load the tokens of the database file at `database_path` into a new
+    SQLite file, read every row back to compare, and report size and query
+    latency against a linear scan."""
+    with open(database_path, 'rb') as f:
+        database = f.read()
+    sha = hashlib.sha256(database).hexdigest()
+    database_tokens = json.loads(database)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    start = time.perf_counter()
+    build_sqlite(database_tokens, output_path, sha)
+    build_s = time.perf_counter() - start
+    check_sqlite(output_path, database_tokens, sha)
+
+    print(f"Saved SQLite database to {output_path} ({len(tokens)} tokens, "
+          f"{os.path.getsize(output_path) / 1024:.0f}KB, built in {build_s * 1000:.0f}ms; "
+          f"contents verified)")
+    print_benchmark(benchmark_queries(output_path, database_tokens))
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command-line options."""
+    parser = argparse.ArgumentParser(description="Query the token SQLite database.")
+    parser.add_argument('text', nargs='?', help="Full-text query over name, type and abilities")
+    parser.add_argument('--prefix', help="Name prefix")
+    parser.add_argument('--colors', help="Exact colors, e.g. WU (C for colorless)")
+    parser.add_argument('--category', help="Category, e.g. creature")
+    parser.add_argument('--card', help="Tokens created by this card instead")
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--database', default=SQLITE_PATH)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Main execution."""
+    args = parse_args(argv)
+    conn = connect(args.database)
+    try:
+        if args.card:
+            rows = tokens_for_card(conn, args.card)[:args.limit]
+        else:
+            rows = query_tokens(conn, args.text, args.prefix, args.colors, args.category, args.limit)
+    finally:
+        conn.close()
+    for row in rows:
+        print(f"{row['popularity']:5d}  {row['name']} {row['pt']} [{row['colors'] or 'C'}] "
+              f"{row['type']} -- {row['abilities']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+A small stage graph with on-disk snapshots for the token build.
+
+Each stage declares the stages it depends on, the inputs that determine
+its output (strings such as an upstream version, or file fingerprints) and
+the source files its code lives in. A stage's key is a sha256 over all of
+that plus its dependencies' keys, so a snapshot is reused only when
+nothing that could affect it has changed. Snapshots are pickles written
+atomically to <snapshot_dir>/<stage>-<key>.pickle, one per stage.
+
+code_files() lists a module's source file together with every sibling
+module it imports, transitively, so a stage keyed on it is invalidated by
+an edit to any helper module it calls into.
+
+Keys are computed before any work is done, and dependencies are resolved
+lazily: when a stage's snapshot matches, its dependencies are not loaded
+or run at all. Because of that, a stage's output must really be what its
+key describes: a stage whose `snapshot_if` check rejects its output (e.g.
+the fetch fell back to stale data) is not snapshotted, and neither is
+anything computed from it.
+"""
+
+import hashlib
+import os
+import pickle
+import sys
+import time
+import types
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from token_instrument import stage as instrument_stage
+
+SNAPSHOT_FORMAT = 1
+
+
+def file_fingerprint(paths: Iterable[str]) -> str:
+    """sha256 over the names and contents of `paths` (missing files count as empty)."""
+    sha = hashlib.sha256()
+    for path in paths:
+        sha.update(os.path.basename(path).encode('utf-8') + b'\0')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                sha.update(f.read())
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+def code_files(*modules: types.ModuleType) -> List[str]:
+    """Source files of `modules` and of every module they import from the
+    same directory (directly or via `from x import y`), transitively."""
+    root = os.path.dirname(os.path.abspath(modules[0].__file__))
+    found = set()
+    pending = list(modules)
+    while pending:
+        module = pending.pop()
+        path = os.path.abspath(getattr(module, '__file__', None) or '')
+        if path in found or os.path.dirname(path) != root:
+            continue
+        found.add(path)
+        for value in vars(module).values():
+            if isinstance(value, types.ModuleType):
+                pending.append(value)
+            else:
+                owner = sys.modules.get(getattr(value, '__module__', None) or '')
+                if owner is not None:
+                    pending.append(owner)
+    return sorted(found)
+
+
+class StageGraph:
+    """Lazily evaluated, snapshot-backed build stages."""
+
+    def __init__(self, snapshot_dir: str, enabled: bool = True):
+        self.snapshot_dir = snapshot_dir
+        self.enabled = enabled
+        self._stages: Dict[str, Dict] = {}
+        self._keys: Dict[str, Optional[str]] = {}
+        self._outputs: Dict[str, object] = {}
+        self._untrusted: Set[str] = set()
+
+    def add(self, name: str, compute: Callable, deps: Iterable[str] = (),
+            inputs: Iterable[Optional[str]] = (), code: Iterable[str] = (),
+            snapshot: bool = True,
+            snapshot_if: Optional[Callable[[object], bool]] = None) -> None:
+        """Register a stage; `compute` is called with the deps' outputs.
+
+        An input of None means "unknown" (e.g. upstream version could not
+        be fetched): the stage and everything downstream of it run uncached.
+        `snapshot_if` is called with a freshly computed output; if it
+        returns False the output doesn't match the stage's inputs, so it is
+        used for this run but not snapshotted (see trusted()).
+        """
+        self._stages[name] = {
+            'compute': compute,
+            'deps': list(deps),
+            'inputs': list(inputs),
+            'code': list(code),
+            'snapshot': snapshot,
+            'snapshot_if': snapshot_if,
+        }
+
+    def key(self, name: str) -> Optional[str]:
+        """Cache key for a stage, or None if it can't be cached."""
+        if name not in self._keys:
+            spec = self._stages[name]
+            dep_keys = [self.key(dep) for dep in spec['deps']]
+            if None in spec['inputs'] or None in dep_keys:
+                self._keys[name] = None
+            else:
+                sha = hashlib.sha256(f"{SNAPSHOT_FORMAT}\0{name}\0".encode('utf-8'))
+                for part in spec['inputs'] + dep_keys:
+                    sha.update(part.encode('utf-8') + b'\0')
+                sha.update(file_fingerprint(spec['code']).encode('ascii'))
+                self._keys[name] = sha.hexdigest()
+        return self._keys[name]
+
+    def _snapshot_path(self, name: str, key: str) -> str:
+        return os.path.join(self.snapshot_dir, f"{name}-{key[:16]}.pickle")
+
+    def get(self, name: str):
+        """Output of a stage: from memory, a matching snapshot, or by running it."""
+        if name in self._outputs:
+            return self._outputs[name]
+        spec = self._stages[name]
+        key = self.key(name)
+        use_snapshot = self.enabled and spec['snapshot'] and key is not None
+        path = self._snapshot_path(name, key) if use_snapshot else None
+
+        if path and os.path.exists(path):
+            start = time.perf_counter()
+            with instrument_stage(f'{name}_snapshot') as st:
+                with open(path, 'rb') as f:
+                    output = pickle.load(f)
+                st.bytes = os.path.getsize(path)
+            print(f"Reusing {name} snapshot {os.path.basename(path)} "
+                  f"({(time.perf_counter() - start) * 1000:.0f}ms)")
+        else:
+            output = spec['compute'](*[self.get(dep) for dep in spec['deps']])
+            if (any(dep in self._untrusted for dep in spec['deps'])
+                    or (spec['snapshot_if'] and not spec['snapshot_if'](output))):
+                self._untrusted.add(name)
+                if path:
+                    print(f"Not snapshotting {name}: its output doesn't match its inputs")
+            elif path:
+                self._save(name, path, output)
+        self._outputs[name] = output
+        return output
+
+    def trusted(self, name: str) -> bool:
+        """False if the stage's output, or one it was computed from, failed
+        its snapshot_if check this run."""
+        return name not in self._untrusted
+
+    def _save(self, name: str, path: str, output) -> None:
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        # One snapshot per stage: drop the ones for older keys.
+        for stale in self._stale_snapshots(name, path):
+            os.remove(stale)
+
+    def _stale_snapshots(self, name: str, keep: str) -> List[str]:
+        prefix = f"{name}-"
+        return [
+            os.path.join(self.snapshot_dir, f)
+            for f in os.listdir(self.snapshot_dir)
+            if f.startswith(prefix) and f.endswith('.pickle')
+            and os.path.join(self.snapshot_dir, f) != keep
+        ]